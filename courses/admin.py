@@ -0,0 +1,101 @@
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.db import transaction
+from django.template.response import TemplateResponse
+from django.utils import timezone
+from .forms import RosterSyncForm
+from .grade_import import GradeImportError, read_rows
+from .models import Course, Enrollment, OutboxEmail, WaitlistEntry
+from .registration import recount_seats
+from .roster_sync import RosterSyncError, sync_enrollments
+from .signals import promote_waitlists
+
+@admin.register(Course)
+class CourseAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name', 'instructor', 'capacity', 'seats_taken', 'is_active')
+    list_filter = ('is_active',)
+    search_fields = ('code', 'name')
+    raw_id_fields = ('instructor',)
+    readonly_fields = ('seats_taken',)
+    actions = ['sync_roster']
+
+    @admin.action(description='Sync enrollments from a roster file')
+    def sync_roster(self, request, queryset):
+        form = RosterSyncForm(request.POST, request.FILES) if 'apply' in request.POST else RosterSyncForm()
+        if form.is_valid():
+            roster = form.cleaned_data['roster']
+            try:
+                result = sync_enrollments(
+                    read_rows(roster, roster.name),
+                    courses=queryset,
+                    deactivate=form.cleaned_data['deactivate']
+                )
+            except (GradeImportError, RosterSyncError) as e:
+                form.add_error('roster', str(e))
+            else:
+                self.message_user(
+                    request,
+                    f'Synced {result.rows} roster rows in {result.elapsed:.1f}s: {result.created} created, '
+                    f'{result.reactivated} reactivated, {result.deactivated} deactivated, {result.unchanged} unchanged.',
+                    messages.SUCCESS
+                )
+                if result.incomplete:
+                    self.message_user(
+                        request,
+                        f'Kept every enrollment of {len(result.incomplete)} courses whose rows name unknown students.',
+                        messages.WARNING
+                    )
+                for line, message in result.errors[:20]:
+                    self.message_user(request, f'Line {line}: {message}', messages.WARNING)
+                if len(result.errors) > 20:
+                    self.message_user(request, f'... and {len(result.errors) - 20} more errors.', messages.WARNING)
+                return None
+
+        return TemplateResponse(request, 'admin/courses/course/sync_roster.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Sync enrollments from a roster file',
+            'opts': self.model._meta,
+            'courses': queryset,
+            'form': form,
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
+
+@admin.register(Enrollment)
+class EnrollmentAdmin(admin.ModelAdmin):
+    list_display = ('student', 'course', 'enrollment_date', 'is_active')
+    list_filter = ('is_active',)
+    search_fields = ('student__username', 'student__student_id', 'course__code')
+    raw_id_fields = ('student', 'course')
+    list_select_related = ('student', 'course')
+
+    def save_model(self, request, obj, form, change):
+        """Edits to ``is_active`` or ``course`` bypass registration, so recount the seats they move."""
+        course_ids = {obj.course_id}
+        if change:
+            course_ids.update(Enrollment.objects.filter(pk=obj.pk).values_list('course_id', flat=True))
+        super().save_model(request, obj, form, change)
+        recount_seats(course_ids)
+        transaction.on_commit(lambda: promote_waitlists(course_ids))
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ('course', 'student', 'created_at')
+    search_fields = ('student__username', 'course__code')
+    raw_id_fields = ('student', 'course')
+    list_select_related = ('student', 'course')
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to_email', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to_email', 'subject')
+    raw_id_fields = ('announcement', 'recipient')
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+    actions = ['retry']
+
+    @admin.action(description='Send again')
+    def retry(self, request, queryset):
+        count = queryset.exclude(status=OutboxEmail.SENT).update(
+            status=OutboxEmail.PENDING, attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f'{count} emails queued again.', messages.SUCCESS)
@@ -0,0 +1,137 @@
+"""Precomputed course analytics.
+
+``refresh_course_statistics`` runs the grade engine over a course once and
+stores the course-level and per-assignment statistics in ``CourseStatistic``
+rows, so the analytics page only ever reads those rows.
+
+Recomputing a course scans all of its grades, so it stays off the request
+path: grade and enrollment writes only ``mark_statistics_stale``, which bumps
+``version`` on the course's row, and ``manage.py refresh_course_statistics
+--stale`` (run as a worker with ``--interval``) refreshes the courses whose
+``refreshed_version`` lags behind. A refresh stores the version it read before
+computing, so a write made while it runs leaves the course stale. Rows are
+updated in place or upserted, so two refreshes of one course never collide.
+"""
+import statistics
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+from .grading import compute_course_grades
+from .models import Course, CourseStatistic
+
+STATISTIC_FIELDS = (
+    'student_count', 'graded_count', 'completion_rate', 'mean', 'median', 'stddev', 'percentiles', 'histogram'
+)
+
+PERCENTILES = (10, 25, 50, 75, 90)
+HISTOGRAM_BINS = 10
+
+def percentile(sorted_values, rank):
+    """Linearly interpolated percentile of already sorted values."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * rank / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def histogram(values):
+    """Counts per 10-point band from 0 to 100; values outside the range fall in the end bands."""
+    counts = [0] * HISTOGRAM_BINS
+    for value in values:
+        band = int(value // (100 / HISTOGRAM_BINS))
+        counts[max(0, min(band, HISTOGRAM_BINS - 1))] += 1
+    return counts
+
+def describe(values, student_count, expected_count=None):
+    """Field values for a ``CourseStatistic`` built from a list of percentages."""
+    values = sorted(values)
+    expected_count = student_count if expected_count is None else expected_count
+    return {
+        'student_count': student_count,
+        'graded_count': len(values),
+        'completion_rate': round(len(values) / expected_count * 100, 1) if expected_count else 0,
+        'mean': round(statistics.fmean(values), 1) if values else None,
+        'median': round(statistics.median(values), 1) if values else None,
+        'stddev': round(statistics.pstdev(values), 1) if values else None,
+        'percentiles': {str(rank): round(percentile(values, rank), 1) for rank in PERCENTILES} if values else {},
+        'histogram': histogram(values),
+    }
+
+def refresh_course_statistics(course):
+    """Recompute and store every statistic of one course."""
+    version = CourseStatistic.objects.filter(
+        course=course, assignment__isnull=True
+    ).values_list('version', flat=True).first() or 0
+    report = compute_course_grades(course)
+    student_count = len(report.students)
+
+    course_values = [student.percentage for student in report.students if student.percentage is not None]
+    graded_cells = sum(score is not None for student in report.students for score in student.scores)
+    course_fields = describe(course_values, student_count)
+    course_fields['completion_rate'] = (
+        round(graded_cells / (student_count * len(report.assignments)) * 100, 1)
+        if student_count and report.assignments else 0
+    )
+
+    rows = []
+    for position, assignment in enumerate(report.assignments):
+        values = [
+            float(student.scores[position]) / assignment.max_score * 100
+            for student in report.students
+            if student.scores[position] is not None and assignment.max_score > 0
+        ]
+        rows.append(CourseStatistic(course=course, assignment_id=assignment.id, **describe(values, student_count)))
+
+    with transaction.atomic():
+        _save_course_row(course.id, course_fields, version)
+        CourseStatistic.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['course', 'assignment'],
+            update_fields=[*STATISTIC_FIELDS, 'refreshed_at']
+        )
+        CourseStatistic.objects.filter(course=course, assignment__isnull=False).exclude(
+            assignment_id__in=[row.assignment_id for row in rows]
+        ).delete()
+    return rows
+
+def _update_course_row(course_id, fields, version):
+    return CourseStatistic.objects.filter(course_id=course_id, assignment__isnull=True).update(
+        refreshed_version=version,
+        refreshed_at=timezone.now(),
+        **fields
+    )
+
+def _save_course_row(course_id, fields, version):
+    # The course row's uniqueness is a partial index, which an upsert
+    # cannot target, so it is updated in place and created when missing
+    if _update_course_row(course_id, fields, version):
+        return
+    try:
+        with transaction.atomic():
+            CourseStatistic.objects.create(
+                course_id=course_id, assignment=None, version=version, refreshed_version=version, **fields
+            )
+    except IntegrityError:
+        # A concurrent refresh created it first
+        _update_course_row(course_id, fields, version)
+
+def mark_statistics_stale(course_ids):
+    """Have the statistics worker refresh these courses; one cheap UPDATE."""
+    CourseStatistic.objects.filter(course_id__in=course_ids, assignment__isnull=True).update(version=F('version') + 1)
+
+def stale_courses():
+    """Active courses whose statistics lag behind their writes or were never computed."""
+    course_rows = CourseStatistic.objects.filter(course=OuterRef('pk'), assignment__isnull=True)
+    return Course.objects.filter(is_active=True).filter(
+        Exists(course_rows.filter(version__gt=F('refreshed_version'))) | ~Exists(course_rows)
+    )
+
+def refresh_stale_statistics():
+    """Refresh every stale course; returns how many were refreshed."""
+    refreshed = 0
+    for course in stale_courses().iterator():
+        refresh_course_statistics(course)
+        refreshed += 1
+    return refreshed
@@ -0,0 +1,89 @@
+"""Async versions of the read-heavy course views.
+
+Each view loads everything its template needs with the async ORM API before
+rendering, running independent queries together with ``asyncio.gather``.
+They share their querysets with the sync views in ``courses.views`` and are
+routed instead of them when ``settings.ASYNC_READ_VIEWS`` is on, which only
+pays off under the ASGI application. Like them they read from a replica.
+"""
+import asyncio
+from django.contrib import messages
+from django.shortcuts import aget_object_or_404, redirect, render
+from student_portal.decorators import async_login_required, read_replica
+from .models import Announcement, Course, Enrollment, Grade
+from .views import (
+    catalog_paginator, feed_paginator, grade_list_context, grade_list_querysets, visible_announcements,
+    visible_courses
+)
+
+async def _list(queryset):
+    return [row async for row in queryset]
+
+@async_login_required
+@read_replica
+async def course_list(request):
+    page = await catalog_paginator.apaginate(visible_courses(request.user), request)
+    return render(request, 'courses/course_list.html', {
+        'courses': page.object_list,
+        'page': page,
+        'title': 'Courses',
+        'description': 'Browse available courses'
+    })
+
+@async_login_required
+@read_replica
+async def course_detail(request, course_id):
+    course = await aget_object_or_404(Course.objects.select_related('instructor'), id=course_id)
+    announcements = Announcement.objects.filter(course=course, is_active=True).select_related('instructor')
+
+    if request.user.role == 'student':
+        enrollment = await aget_object_or_404(Enrollment, student=request.user, course=course)
+        grades, announcements = await asyncio.gather(
+            _list(Grade.objects.filter(enrollment=enrollment)),
+            _list(announcements)
+        )
+        context = {
+            'course': course,
+            'enrollment': enrollment,
+            'grades': grades,
+            'announcements': announcements
+        }
+    else:
+        students, announcements = await asyncio.gather(
+            _list(course.students.filter(enrollment__is_active=True)),
+            _list(announcements)
+        )
+        context = {
+            'course': course,
+            'is_instructor': course.instructor_id == request.user.id,
+            'enrolled_students': students,
+            'announcements': announcements
+        }
+
+    context.update({
+        'title': f'Course: {course.name}',
+        'description': course.description
+    })
+    return render(request, 'courses/course_detail.html', context)
+
+@async_login_required
+@read_replica
+async def announcement_list(request):
+    page = await feed_paginator.apaginate(visible_announcements(request.user), request)
+    return render(request, 'courses/announcement_list.html', {
+        'announcements': page.object_list,
+        'page': page,
+        'title': 'Announcements',
+        'description': 'View all announcements'
+    })
+
+@async_login_required
+@read_replica
+async def grade_list(request):
+    if request.user.role != 'student':
+        messages.error(request, 'Only students can view grades.')
+        return redirect('dashboard')
+
+    enrollments, grades = grade_list_querysets(request.user)
+    enrollments, grades = await asyncio.gather(_list(enrollments), _list(grades))
+    return render(request, 'courses/grade_list.html', grade_list_context(enrollments, grades))
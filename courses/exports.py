@@ -0,0 +1,105 @@
+"""Streaming grade and roster exports.
+
+Every dataset is a generator of tuples whose first item is the header row.
+Rows are read with ``values_list(...).iterator(chunk_size=...)`` so no model
+instances are built and memory stays flat however large the export is; the
+writers turn the rows into CSV or JSON Lines one line at a time, ready for a
+``StreamingHttpResponse`` or a file.
+"""
+import csv
+import json
+from .grading import letter_grade, load_assignments, weighted_percentage
+from .models import Enrollment, Grade
+
+DEFAULT_CHUNK_SIZE = 2000
+STUDENT_COLUMNS = ('username', 'student_id', 'first_name', 'last_name')
+
+def gradebook_rows(course, chunk_size=DEFAULT_CHUNK_SIZE):
+    """One row per enrolled student with one score column per active assignment.
+
+    Enrollments and grades are both streamed in enrollment order and merged,
+    so the pivot never holds more than one student's grades at a time. The
+    last two columns are the weighted percentage and letter grade.
+    """
+    assignments = load_assignments(course)
+    positions = {assignment.id: position for position, assignment in enumerate(assignments)}
+    yield STUDENT_COLUMNS + tuple(assignment.title for assignment in assignments) + ('percentage', 'letter')
+
+    enrollments = Enrollment.objects.filter(course=course, is_active=True).order_by('id').values_list(
+        'id', *(f'student__{column}' for column in STUDENT_COLUMNS)
+    ).iterator(chunk_size=chunk_size)
+    grades = Grade.objects.filter(
+        enrollment__course=course,
+        enrollment__is_active=True,
+        assignment__in=list(positions)
+    ).order_by('enrollment_id').values_list('enrollment_id', 'assignment_id', 'score').iterator(chunk_size=chunk_size)
+
+    grade = next(grades, None)
+    for enrollment_id, *student in enrollments:
+        scores = [None] * len(assignments)
+        while grade is not None and grade[0] <= enrollment_id:
+            if grade[0] == enrollment_id:
+                scores[positions[grade[1]]] = grade[2]
+            grade = next(grades, None)
+        percentage = weighted_percentage(scores, assignments)
+        yield (
+            tuple(student)
+            + tuple('' if score is None else score for score in scores)
+            + ('' if percentage is None else percentage, letter_grade(percentage) or '')
+        )
+
+def grade_rows(course=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Every grade, one per row, for a course or the whole institution."""
+    columns = (
+        'enrollment__course__code', 'enrollment__student__username', 'enrollment__student__student_id',
+        'assignment__title', 'assignment__max_score', 'assignment__weight', 'score', 'submitted_at'
+    )
+    yield ('course', 'username', 'student_id', 'assignment', 'max_score', 'weight', 'score', 'submitted_at')
+
+    grades = Grade.objects.filter(assignment__isnull=False)
+    if course is not None:
+        grades = grades.filter(enrollment__course=course)
+    yield from grades.order_by('id').values_list(*columns).iterator(chunk_size=chunk_size)
+
+def roster_rows(course=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Every enrollment, one per row, for a course or the whole institution."""
+    columns = (
+        'course__code', 'student__username', 'student__student_id', 'student__first_name',
+        'student__last_name', 'student__email', 'enrollment_date', 'is_active'
+    )
+    yield ('course', 'username', 'student_id', 'first_name', 'last_name', 'email', 'enrollment_date', 'is_active')
+
+    enrollments = Enrollment.objects.all()
+    if course is not None:
+        enrollments = enrollments.filter(course=course)
+    yield from enrollments.order_by('id').values_list(*columns).iterator(chunk_size=chunk_size)
+
+DATASETS = {
+    'gradebook': gradebook_rows,
+    'grades': grade_rows,
+    'roster': roster_rows,
+}
+
+class _Echo:
+    """A file-like object whose write() hands the line straight back."""
+
+    def write(self, value):
+        return value
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+def jsonl_lines(rows):
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+    for row in rows:
+        yield json.dumps(dict(zip(header, row)), default=str) + '\n'
+
+FORMATS = {
+    'csv': (csv_lines, 'text/csv'),
+    'jsonl': (jsonl_lines, 'application/x-ndjson'),
+}
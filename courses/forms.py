@@ -4,7 +4,7 @@ from .models import Course, Grade, Announcement, Assignment
 class CourseForm(forms.ModelForm):
     class Meta:
         model = Course
-        fields = ['code', 'name', 'description', 'instructor']
+        fields = ['code', 'name', 'description', 'instructor', 'capacity']
         widgets = {
             'description': forms.Textarea(attrs={'rows': 4}),
         }
@@ -74,4 +74,35 @@ class AnnouncementForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         for field in self.fields.values():
-            field.widget.attrs.update({'class': 'form-control'}) 
\ No newline at end of file
+            field.widget.attrs.update({'class': 'form-control'})
+
+class GradeImportForm(forms.Form):
+    gradebook = forms.FileField(
+        help_text='A .csv or .xlsx file with a "username" or "student_id" column and one column per assignment title.'
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['gradebook'].widget.attrs.update({'class': 'form-control', 'accept': '.csv,.xlsx'})
+
+    def clean_gradebook(self):
+        gradebook = self.cleaned_data['gradebook']
+        if not gradebook.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Gradebook files must be .csv or .xlsx.')
+        return gradebook
+
+class RosterSyncForm(forms.Form):
+    roster = forms.FileField(
+        help_text='A .csv or .xlsx file with a "course" column and a "username" or "student_id" column.'
+    )
+    deactivate = forms.BooleanField(
+        required=False,
+        initial=True,
+        help_text='Deactivate enrollments of the selected courses that are missing from the roster.'
+    )
+
+    def clean_roster(self):
+        roster = self.cleaned_data['roster']
+        if not roster.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Roster files must be .csv or .xlsx.')
+        return roster
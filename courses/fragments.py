@@ -0,0 +1,60 @@
+"""Per-course template fragment caching.
+
+Every course has a generation number in the cache, and each cached fragment
+of the course (``{% coursecache %}`` in ``course_cache``) has that number in its key.
+Writes to a course, its announcements or its enrollments bump the generation
+(see ``courses.signals``), which orphans every fragment rendered before the
+write at once; orphans simply expire. A generation that was evicted restarts
+from the clock, so it never reuses a number an older fragment was keyed on.
+
+A bump only reaches the processes that share the cache, so fragments are
+only cached when ``COURSE_FRAGMENT_CACHE_TIMEOUT`` is set, which it is by
+default with a shared cache backend.
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+from student_portal.db_routing import reading_from_replica
+
+GENERATION_PREFIX = 'course-generation'
+FRAGMENT_PREFIX = 'course-fragment'
+
+def generation_key(course_id):
+    return f'{GENERATION_PREFIX}:{course_id}'
+
+def get_generation(course_id):
+    key = generation_key(course_id)
+    generation = cache.get(key)
+    if generation is None:
+        generation = time.time_ns()
+        if not cache.add(key, generation, None):
+            generation = cache.get(key, generation)
+    return generation
+
+def bump_generations(course_ids):
+    """Invalidate every cached fragment of the given courses."""
+    for course_id in set(course_ids):
+        try:
+            cache.incr(generation_key(course_id))
+        except ValueError:
+            cache.set(generation_key(course_id), time.time_ns(), None)
+
+def fragment_cache_key(name, course_id, vary_on=()):
+    parts = ':'.join(str(value) for value in vary_on)
+    return f'{FRAGMENT_PREFIX}:{name}:{course_id}:{get_generation(course_id)}:{parts}'
+
+def get_fragment(name, course_id, render, vary_on=()):
+    """The cached fragment, rendering and storing it on a miss."""
+    timeout = getattr(settings, 'COURSE_FRAGMENT_CACHE_TIMEOUT', 0)
+    if not timeout:
+        return render()
+    key = fragment_cache_key(name, course_id, vary_on)
+    content = cache.get(key)
+    if content is None:
+        content = render()
+        # A replica may not have the write that bumped the generation yet, so
+        # what it renders is only kept for as long as replicas are allowed to lag
+        if reading_from_replica():
+            timeout = min(timeout, settings.REPLICA_PIN_SECONDS)
+        cache.set(key, content, timeout)
+    return content
@@ -0,0 +1,175 @@
+"""Bulk gradebook import.
+
+A gradebook file has one row per student: a ``username`` (or ``student_id``)
+column identifying the student, plus one column per assignment, headed with
+the assignment title. Rows are streamed from the file, validated against
+assignments and enrollments preloaded for the course, and upserted on the
+``(enrollment, assignment)`` unique key in fixed-size batches.
+"""
+import csv
+import io
+import zipfile
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from .models import Assignment, Enrollment, Grade
+from .signals import refresh_grade_summaries
+
+DEFAULT_BATCH_SIZE = 500
+IDENTIFIER_COLUMNS = ('username', 'student_id')
+
+class GradeImportError(Exception):
+    """The file as a whole cannot be imported.
+
+    Also raised for files that cannot be read at all, in place of the
+    decoding errors of the CSV and XLSX readers.
+    """
+
+class GradeImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.grades_written = 0
+        self.errors = []
+        self.ignored_columns = []
+
+    def add_error(self, line, message):
+        self.errors.append((line, message))
+
+    @property
+    def has_errors(self):
+        return bool(self.errors)
+
+def read_csv_rows(file):
+    """Yield ``(line_number, row_dict)`` from a binary or text CSV file."""
+    if not isinstance(file, io.TextIOBase):
+        file = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(file)
+    try:
+        for row in reader:
+            yield reader.line_num, row
+    except UnicodeDecodeError:
+        raise GradeImportError('The file is not UTF-8 encoded text; save it as CSV UTF-8 and try again.')
+    except csv.Error as e:
+        raise GradeImportError(f'The file is not a valid CSV file (line {reader.line_num}: {e}).')
+
+def read_xlsx_rows(file):
+    """Yield ``(line_number, row_dict)`` from the first sheet of an XLSX workbook."""
+    try:
+        from openpyxl import load_workbook
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        raise GradeImportError('Importing XLSX files requires the openpyxl package.')
+
+    try:
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError):
+        # KeyError: a zip archive without the parts of a workbook
+        raise GradeImportError('The file is not a valid XLSX workbook.')
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+        for line, values in enumerate(rows, start=2):
+            yield line, {
+                column: '' if value is None else str(value)
+                for column, value in zip(header, values)
+            }
+    finally:
+        workbook.close()
+
+def read_rows(file, filename):
+    if filename.lower().endswith('.xlsx'):
+        return read_xlsx_rows(file)
+    if filename.lower().endswith('.csv'):
+        return read_csv_rows(file)
+    raise GradeImportError('Gradebook files must be .csv or .xlsx.')
+
+class GradeImporter:
+    def __init__(self, course, batch_size=DEFAULT_BATCH_SIZE):
+        self.course = course
+        self.batch_size = batch_size
+        self.assignments = {
+            assignment.title.strip(): assignment
+            for assignment in Assignment.objects.filter(course=course, is_active=True)
+        }
+
+    def _load_enrollments(self, identifier):
+        return dict(Enrollment.objects.filter(
+            course=self.course,
+            is_active=True
+        ).values_list(f'student__{identifier}', 'id'))
+
+    def _parse_score(self, value, assignment):
+        try:
+            score = Decimal(value.strip())
+        except InvalidOperation:
+            raise ValueError(f'"{value}" is not a number')
+        if not score.is_finite() or score < 0:
+            raise ValueError(f'score {value} must be zero or more')
+        if score > assignment.max_score:
+            raise ValueError(f'score {value} exceeds the maximum score of {assignment.max_score}')
+        return score.quantize(Decimal('0.01'))
+
+    def run(self, rows):
+        """Import ``(line_number, row_dict)`` pairs and return a ``GradeImportResult``."""
+        result = GradeImportResult()
+        pending = {}
+        enrollments = None
+        identifier = None
+        columns = None
+
+        for line, row in rows:
+            if columns is None:
+                identifier = next((name for name in IDENTIFIER_COLUMNS if name in row), None)
+                if identifier is None:
+                    raise GradeImportError('The file needs a "username" or "student_id" column.')
+                columns = [(name, self.assignments[name.strip()]) for name in row if name and name.strip() in self.assignments]
+                result.ignored_columns = [
+                    name for name in row
+                    if name and name != identifier and name.strip() not in self.assignments
+                ]
+                enrollments = self._load_enrollments(identifier)
+
+            result.rows += 1
+            key = (row.get(identifier) or '').strip()
+            enrollment_id = enrollments.get(key)
+            if enrollment_id is None:
+                result.add_error(line, f'No active enrollment in {self.course.code} for {identifier} "{key}"')
+                continue
+
+            for column, assignment in columns:
+                value = row.get(column) or ''
+                if not value.strip():
+                    continue
+                try:
+                    score = self._parse_score(value, assignment)
+                except ValueError as e:
+                    result.add_error(line, f'{column}: {e}')
+                    continue
+                pending[(enrollment_id, assignment.id)] = score
+
+            if len(pending) >= self.batch_size:
+                result.grades_written += self._flush(pending)
+                pending = {}
+
+        if pending:
+            result.grades_written += self._flush(pending)
+        return result
+
+    def _flush(self, pending):
+        grades = [
+            Grade(enrollment_id=enrollment_id, assignment_id=assignment_id, score=score)
+            for (enrollment_id, assignment_id), score in pending.items()
+        ]
+        with transaction.atomic():
+            Grade.objects.bulk_create(
+                grades,
+                update_conflicts=True,
+                unique_fields=['enrollment', 'assignment'],
+                update_fields=['score']
+            )
+            # bulk_create bypasses the Grade signals
+            enrollment_ids = list({enrollment_id for enrollment_id, _ in pending})
+            transaction.on_commit(lambda: refresh_grade_summaries(enrollment_ids))
+        return len(grades)
+
+def import_gradebook(course, file, filename, batch_size=DEFAULT_BATCH_SIZE):
+    return GradeImporter(course, batch_size=batch_size).run(read_rows(file, filename))
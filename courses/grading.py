@@ -0,0 +1,131 @@
+"""Weighted grade computation for whole courses.
+
+A course is loaded as a students x assignments score matrix (three queries:
+assignments, enrollments, then every grade of the course) and every student's
+weighted percentage, letter grade and the class statistics are computed from
+it in one pass. A student's percentage is the weight-averaged fraction of each graded
+assignment's max score, the same definition ``EnrollmentGradeSummary`` stores:
+
+    sum(weight * score / max_score) / sum(weight)   over graded assignments
+"""
+import statistics
+from .models import Assignment, Enrollment, Grade
+
+LETTER_GRADES = (
+    (90, 'A'),
+    (80, 'B'),
+    (70, 'C'),
+    (60, 'D'),
+)
+
+def letter_grade(percentage):
+    if percentage is None:
+        return None
+    for cutoff, letter in LETTER_GRADES:
+        if percentage >= cutoff:
+            return letter
+    return 'F'
+
+class GradedAssignment:
+    def __init__(self, id, title, max_score, weight):
+        self.id = id
+        self.title = title
+        self.max_score = float(max_score)
+        self.weight = float(weight)
+
+def weighted_percentage(scores, assignments):
+    """Weighted percentage for one row of the score matrix (``None`` marks ungraded)."""
+    points = 0.0
+    weight_total = 0.0
+    for score, assignment in zip(scores, assignments):
+        if score is None or assignment.max_score <= 0:
+            continue
+        points += assignment.weight * float(score) / assignment.max_score
+        weight_total += assignment.weight
+    if not weight_total:
+        return None
+    return round(points / weight_total * 100, 1)
+
+class StudentGrade:
+    def __init__(self, enrollment_id, student_id, username, scores, assignments):
+        self.enrollment_id = enrollment_id
+        self.student_id = student_id
+        self.username = username
+        self.scores = scores
+        self.total_score = sum(float(score) for score in scores if score is not None)
+        self.total_max = sum(
+            assignment.max_score for score, assignment in zip(scores, assignments) if score is not None
+        )
+        self.percentage = weighted_percentage(scores, assignments)
+        self.letter = letter_grade(self.percentage)
+
+class CourseGradeReport:
+    def __init__(self, assignments, students):
+        self.assignments = assignments
+        self.students = students
+        self.statistics = class_statistics([student.percentage for student in students])
+
+    def by_enrollment(self):
+        return {student.enrollment_id: student for student in self.students}
+
+def class_statistics(percentages):
+    graded = [percentage for percentage in percentages if percentage is not None]
+    distribution = {letter: 0 for _, letter in LETTER_GRADES}
+    distribution['F'] = 0
+    for percentage in graded:
+        distribution[letter_grade(percentage)] += 1
+
+    if not graded:
+        return {'count': 0, 'mean': None, 'median': None, 'stddev': None, 'min': None, 'max': None,
+                'distribution': distribution}
+    return {
+        'count': len(graded),
+        'mean': round(statistics.fmean(graded), 1),
+        'median': round(statistics.median(graded), 1),
+        'stddev': round(statistics.pstdev(graded), 1),
+        'min': min(graded),
+        'max': max(graded),
+        'distribution': distribution,
+    }
+
+def compute_grades(assignments, rows):
+    """Compute a report from an already-built matrix.
+
+    ``rows`` yields ``(enrollment_id, student_id, username, scores)`` where
+    ``scores`` is aligned with ``assignments``.
+    """
+    return CourseGradeReport(assignments, [
+        StudentGrade(enrollment_id, student_id, username, scores, assignments)
+        for enrollment_id, student_id, username, scores in rows
+    ])
+
+def load_assignments(course):
+    return [
+        GradedAssignment(*values)
+        for values in Assignment.objects.filter(course=course, is_active=True).order_by(
+            'due_date', 'id'
+        ).values_list('id', 'title', 'max_score', 'weight')
+    ]
+
+def compute_course_grades(course):
+    """Weighted grades and class statistics for every active enrollment of a course."""
+    assignments = load_assignments(course)
+    positions = {assignment.id: position for position, assignment in enumerate(assignments)}
+
+    matrix = {}
+    students = Enrollment.objects.filter(course=course, is_active=True).order_by('student__username')
+    for enrollment_id, student_id, username in students.values_list('id', 'student_id', 'student__username'):
+        matrix[enrollment_id] = (student_id, username, [None] * len(assignments))
+
+    grades = Grade.objects.filter(
+        enrollment__course=course,
+        enrollment__is_active=True,
+        assignment__in=list(positions)
+    ).values_list('enrollment_id', 'assignment_id', 'score')
+    for enrollment_id, assignment_id, score in grades:
+        matrix[enrollment_id][2][positions[assignment_id]] = score
+
+    return compute_grades(assignments, (
+        (enrollment_id, student_id, username, scores)
+        for enrollment_id, (student_id, username, scores) in matrix.items()
+    ))
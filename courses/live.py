@@ -0,0 +1,160 @@
+"""Live announcement fan-out for the Server-Sent Events stream.
+
+A hub keeps, per course, the subscriptions of the streams that are open in
+this process. ``publish`` may be called from any thread (announcements are
+published from sync views after commit); each event loop with subscribers
+gets one callback that delivers the event to all of its subscriptions, so
+thousands of idle streams cost one queue each and no threads.
+
+``LocalHub`` only reaches streams served by the same process. With
+``ANNOUNCEMENT_HUB_BACKEND = 'postgres'`` events go through Postgres
+``NOTIFY`` and every process runs one listener thread that feeds its local
+subscriptions, so a stream receives announcements published by any worker.
+"""
+import asyncio
+import json
+import select
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+
+SUBSCRIPTION_QUEUE_SIZE = 100
+
+class Subscription:
+    """One open stream: a bounded queue of events for a set of courses."""
+
+    def __init__(self, course_ids, loop):
+        self.course_ids = frozenset(course_ids)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIPTION_QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A stalled client; it is told to resync when it catches up
+            self.overflowed = True
+
+    async def get(self):
+        return await self.queue.get()
+
+class LocalHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, course_ids):
+        """Subscribe the running event loop to the courses' announcements."""
+        subscription = Subscription(course_ids, asyncio.get_running_loop())
+        with self._lock:
+            for course_id in subscription.course_ids:
+                self._subscriptions[course_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for course_id in subscription.course_ids:
+                subscribers = self._subscriptions.get(course_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[course_id]
+
+    def subscriber_count(self, course_id=None):
+        with self._lock:
+            if course_id is not None:
+                return len(self._subscriptions.get(course_id, ()))
+            return len(set().union(*self._subscriptions.values()))
+
+    def publish(self, course_id, event):
+        self.deliver(course_id, event)
+
+    def deliver(self, course_id, event):
+        """Hand ``event`` to every subscription of the course in this process."""
+        with self._lock:
+            subscribers = list(self._subscriptions.get(course_id, ()))
+        by_loop = defaultdict(list)
+        for subscription in subscribers:
+            by_loop[subscription.loop].append(subscription)
+        for loop, subscriptions in by_loop.items():
+            if loop.is_closed():
+                continue
+            loop.call_soon_threadsafe(_deliver_all, subscriptions, event)
+
+def _deliver_all(subscriptions, event):
+    for subscription in subscriptions:
+        subscription.deliver(event)
+
+class PostgresHub(LocalHub):
+    channel = 'portal_announcements'
+
+    def __init__(self):
+        super().__init__()
+        if connection.vendor != 'postgresql':
+            raise ImproperlyConfigured('The postgres announcement hub needs a PostgreSQL database.')
+        self._listener = None
+
+    def publish(self, course_id, event):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, json.dumps({'course_id': course_id, 'event': event})])
+
+    def subscribe(self, course_ids):
+        self._start_listener()
+        return super().subscribe(course_ids)
+
+    def _start_listener(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='announcement-listener', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        import psycopg2
+
+        listener = psycopg2.connect(**connection.get_connection_params())
+        listener.autocommit = True
+        try:
+            with listener.cursor() as cursor:
+                cursor.execute(f'LISTEN {self.channel}')
+            while True:
+                if select.select([listener], [], [], 5) == ([], [], []):
+                    continue
+                listener.poll()
+                while listener.notifies:
+                    message = json.loads(listener.notifies.pop(0).payload)
+                    self.deliver(message['course_id'], message['event'])
+        finally:
+            listener.close()
+
+HUB_BACKENDS = {
+    'local': LocalHub,
+    'postgres': PostgresHub,
+}
+
+_hub = None
+_hub_lock = threading.Lock()
+
+def get_hub():
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            backend = getattr(settings, 'ANNOUNCEMENT_HUB_BACKEND', 'local')
+            if backend not in HUB_BACKENDS:
+                raise ImproperlyConfigured(f'Unknown ANNOUNCEMENT_HUB_BACKEND "{backend}"')
+            _hub = HUB_BACKENDS[backend]()
+        return _hub
+
+def announcement_event(announcement):
+    return {
+        'id': announcement.id,
+        'course_id': announcement.course_id,
+        'course': announcement.course.code,
+        'title': announcement.title,
+        'created_at': announcement.created_at.isoformat(),
+    }
+
+def publish_announcement(announcement):
+    get_hub().publish(announcement.course_id, announcement_event(announcement))
@@ -0,0 +1,101 @@
+import time
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, RequestFactory
+from courses.analytics import percentile
+from users.models import User
+
+class Command(BaseCommand):
+    help = (
+        'Measures database connection setup cost per request through the full request cycle, '
+        'closing connections after every request (CONN_MAX_AGE=0) and with persistent connections. '
+        'Run it against a local PostgreSQL (DB_NAME, DB_HOST, ...) to see the real setup cost.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/courses/')
+        parser.add_argument('--username', help='Sign in as this user (default: the first student)')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--max-age', type=int, default=600, help='CONN_MAX_AGE of the persistent run')
+
+    def session_cookie(self, username):
+        users = User.objects.filter(username=username) if username else User.objects.filter(role=User.STUDENT)
+        user = users.order_by('id').first()
+        if user is None:
+            raise CommandError('No user to sign in as')
+        client = Client()
+        client.force_login(user)
+        return '; '.join(f'{name}={morsel.value}' for name, morsel in client.cookies.items())
+
+    def run(self, path, cookie, total):
+        # WSGIHandler sends request_started/request_finished, which is where
+        # Django closes or keeps connections; the test client skips that
+        handler = WSGIHandler()
+        environ = RequestFactory().get(path, HTTP_COOKIE=cookie, HTTP_HOST='localhost').environ
+        stats = {'connects': 0, 'connect_time': 0.0}
+        connect = connection.get_new_connection
+
+        def timed_connect(conn_params):
+            started = time.perf_counter()
+            try:
+                return connect(conn_params)
+            finally:
+                stats['connects'] += 1
+                stats['connect_time'] += time.perf_counter() - started
+
+        connection.get_new_connection = timed_connect
+        latencies = []
+        statuses = set()
+        try:
+            for _ in range(total):
+                started = time.perf_counter()
+                response = handler(dict(environ), lambda status, headers: statuses.add(status.split()[0]))
+                b''.join(response)
+                response.close()
+                latencies.append(time.perf_counter() - started)
+        finally:
+            del connection.get_new_connection
+        latencies.sort()
+        return {
+            **stats,
+            'mean': sum(latencies) / total * 1000,
+            'p50': percentile(latencies, 50) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'statuses': statuses,
+        }
+
+    def handle(self, *args, **options):
+        cookie = self.session_cookie(options['username'])
+        original = {key: connection.settings_dict[key] for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+        pooled = 'pool' in connection.settings_dict.get('OPTIONS', {})
+        modes = [('pool', {})] if pooled else [
+            ('close per request', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}),
+            ('persistent', {'CONN_MAX_AGE': options['max_age'], 'CONN_HEALTH_CHECKS': False}),
+            ('persistent + checks', {'CONN_MAX_AGE': options['max_age'], 'CONN_HEALTH_CHECKS': True}),
+        ]
+
+        self.stdout.write(
+            f'{options["requests"]} requests to {options["path"]} on {connection.vendor} '
+            f'({connection.settings_dict["NAME"]})'
+        )
+        try:
+            for name, overrides in modes:
+                connection.close()
+                connection.settings_dict.update(overrides)
+                # Warm up templates, caches and the first connection
+                self.run(options['path'], cookie, 5)
+                result = self.run(options['path'], cookie, options['requests'])
+                self.stdout.write(
+                    f'{name:<20} {result["connects"]:5d} connects '
+                    f'{result["connect_time"] * 1000 / options["requests"]:7.2f} ms setup/request   '
+                    f'mean {result["mean"]:7.2f} ms   p50 {result["p50"]:7.2f} ms   p99 {result["p99"]:7.2f} ms   '
+                    f'HTTP {", ".join(sorted(result["statuses"]))}'
+                )
+        finally:
+            connection.close()
+            connection.settings_dict.update(original)
+        if not pooled:
+            self.stdout.write(
+                'For the pool, run this again with DB_PROCESS_ROLE=command DB_COMMAND_POOL=True (needs Django 5.1+, psycopg 3 and psycopg_pool).'
+            )
@@ -0,0 +1,43 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from courses.grading import GradedAssignment, compute_grades
+
+class Command(BaseCommand):
+    help = 'Times the grade computation engine on a synthetic course'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=1000)
+        parser.add_argument('--assignments', type=int, default=50)
+        parser.add_argument('--missing', type=float, default=0.1, help='Fraction of ungraded cells')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        assignments = [
+            GradedAssignment(index, f'Assignment {index}', rng.choice([10, 20, 50, 100]), rng.choice([1, 1, 2, 3]))
+            for index in range(options['assignments'])
+        ]
+        rows = [
+            (index, index, f'student{index}', [
+                None if rng.random() < options['missing'] else round(rng.uniform(0, assignment.max_score), 2)
+                for assignment in assignments
+            ])
+            for index in range(options['students'])
+        ]
+
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            report = compute_grades(assignments, rows)
+            timings.append(time.perf_counter() - started)
+
+        cells = options['students'] * options['assignments']
+        best = min(timings)
+        self.stdout.write(
+            f'{options["students"]} students x {options["assignments"]} assignments ({cells} cells): '
+            f'best {best * 1000:.1f} ms, mean {sum(timings) / len(timings) * 1000:.1f} ms '
+            f'over {options["repeat"]} runs ({cells / best:,.0f} cells/s)'
+        )
+        self.stdout.write(f'Class mean {report.statistics["mean"]}%, median {report.statistics["median"]}%')
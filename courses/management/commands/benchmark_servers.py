@@ -0,0 +1,122 @@
+import http.cookiejar
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from courses.analytics import percentile
+
+DEFAULT_PATHS = ('/dashboard/', '/courses/', '/courses/announcements/', '/courses/grades/')
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class Command(BaseCommand):
+    help = (
+        'Compares p50/p99 latency and requests/s of the read pages under gunicorn sync workers (WSGI) '
+        'and uvicorn (ASGI with ASYNC_READ_VIEWS) at the same load'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='A student account to sign in as')
+        parser.add_argument('password')
+        parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--workers', type=int, default=4)
+
+    def servers(self, port, workers):
+        yield 'gunicorn (sync)', 'gunicorn', [
+            sys.executable, '-m', 'gunicorn', 'student_portal.wsgi:application',
+            '--workers', str(workers), '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'
+        ], {'ASYNC_READ_VIEWS': 'False'}
+        yield 'uvicorn (async)', 'uvicorn', [
+            sys.executable, '-m', 'uvicorn', 'student_portal.asgi:application',
+            '--workers', str(workers), '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'
+        ], {'ASYNC_READ_VIEWS': 'True'}
+
+    def wait_until_up(self, base_url, server, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError('The server exited during startup')
+            try:
+                urllib.request.urlopen(f'{base_url}/login/', timeout=1)
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f'The server did not answer within {timeout}s')
+
+    def sign_in(self, base_url, username, password):
+        cookies = http.cookiejar.CookieJar()
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookies))
+        opener.open(f'{base_url}/login/')
+        csrf_token = next((cookie.value for cookie in cookies if cookie.name == 'csrftoken'), '')
+        opener.open(f'{base_url}/login/', urllib.parse.urlencode({
+            'username': username, 'password': password, 'remember': 'on', 'csrfmiddlewaretoken': csrf_token
+        }).encode())
+        if not any(cookie.name == 'sessionid' for cookie in cookies):
+            raise CommandError(f'Could not sign in as {username}')
+        return '; '.join(f'{cookie.name}={cookie.value}' for cookie in cookies)
+
+    def load(self, base_url, cookie, paths, total, concurrency):
+        def fetch(index):
+            request = urllib.request.Request(f'{base_url}{paths[index % len(paths)]}', headers={'Cookie': cookie})
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    response.read()
+                    ok = response.status == 200
+            except OSError:
+                ok = False
+            return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(fetch, range(total)))
+        elapsed = time.perf_counter() - started
+        latencies = sorted(latency for latency, _ in results)
+        return {
+            'p50': percentile(latencies, 50) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'rps': total / elapsed,
+            'errors': sum(not ok for _, ok in results),
+        }
+
+    def handle(self, *args, **options):
+        rows = []
+        port = free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        for name, module, command, env in self.servers(port, options['workers']):
+            if importlib.util.find_spec(module) is None:
+                self.stdout.write(self.style.WARNING(f'{name}: skipped, {module} is not installed'))
+                continue
+            server = subprocess.Popen(command, env={**os.environ, **env})
+            try:
+                self.wait_until_up(base_url, server)
+                cookie = self.sign_in(base_url, options['username'], options['password'])
+                # Warm up connections, caches and the workers' imports
+                self.load(base_url, cookie, options['paths'], options['concurrency'] * 2, options['concurrency'])
+                rows.append((name, self.load(
+                    base_url, cookie, options['paths'], options['requests'], options['concurrency']
+                )))
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+        self.stdout.write(
+            f'{options["requests"]} requests over {", ".join(options["paths"])} '
+            f'at concurrency {options["concurrency"]}, {options["workers"]} workers'
+        )
+        for name, result in rows:
+            self.stdout.write(
+                f'{name:<16} p50 {result["p50"]:7.1f} ms   p99 {result["p99"]:7.1f} ms   '
+                f'{result["rps"]:8.1f} req/s   {result["errors"]} errors'
+            )
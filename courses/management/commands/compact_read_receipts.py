@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from courses.models import Announcement
+from courses.read_state import compact_course
+
+class Command(BaseCommand):
+    help = 'Folds announcement read receipts into per-course read watermarks'
+
+    def handle(self, *args, **options):
+        course_ids = Announcement.read_by.through.objects.values_list(
+            'announcement__course_id', flat=True
+        ).distinct()
+
+        removed = 0
+        for course_id in list(course_ids):
+            removed += compact_course(course_id)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Compacted {removed} read receipts into watermarks')
+        )
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from courses.exports import DATASETS, DEFAULT_CHUNK_SIZE, FORMATS
+from courses.models import Course
+
+class Command(BaseCommand):
+    help = 'Streams a gradebook, grade dump or roster as CSV or JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', choices=sorted(DATASETS), default='grades')
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--course', help='Course code; omit for an institution-wide export')
+        parser.add_argument('--output', help='File to write to (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        course = None
+        if options['course']:
+            try:
+                course = Course.objects.get(code=options['course'])
+            except Course.DoesNotExist:
+                raise CommandError(f'No course with code {options["course"]}')
+        elif options['dataset'] == 'gradebook':
+            raise CommandError('The gradebook dataset needs --course')
+
+        rows_for = DATASETS[options['dataset']]
+        if course is None:
+            rows = rows_for(chunk_size=options['chunk_size'])
+        else:
+            rows = rows_for(course, chunk_size=options['chunk_size'])
+        write_lines, _ = FORMATS[options['format']]
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                for line in write_lines(rows):
+                    output.write(line)
+        else:
+            for line in write_lines(rows):
+                self.stdout.write(line, ending='')
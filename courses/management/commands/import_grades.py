@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from courses.grade_import import DEFAULT_BATCH_SIZE, GradeImportError, import_gradebook
+from courses.models import Course
+
+class Command(BaseCommand):
+    help = 'Imports a CSV/XLSX gradebook into a course'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course', help='Course code')
+        parser.add_argument('path', help='Path to the .csv or .xlsx gradebook')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            course = Course.objects.get(code=options['course'])
+        except Course.DoesNotExist:
+            raise CommandError(f'No course with code {options["course"]}')
+
+        started = time.monotonic()
+        try:
+            with open(options['path'], 'rb') as file:
+                result = import_gradebook(course, file, options['path'], batch_size=options['batch_size'])
+        except (OSError, GradeImportError) as e:
+            raise CommandError(str(e))
+        elapsed = time.monotonic() - started
+
+        for line, message in result.errors:
+            self.stdout.write(self.style.ERROR(f'Line {line}: {message}'))
+        if result.ignored_columns:
+            self.stdout.write(self.style.WARNING(f'Ignored columns: {", ".join(result.ignored_columns)}'))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Imported {result.grades_written} grades from {result.rows} rows in {elapsed:.2f}s '
+                f'({len(result.errors)} errors)'
+            )
+        )
@@ -0,0 +1,70 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import RequestFactory
+from courses.models import Course, Enrollment, WaitlistEntry
+from courses.views import enroll_course
+from users.models import User
+
+def fire_enrollments(course, students, workers):
+    """POST to ``enroll_course`` once per student from ``workers`` threads; returns failed request count."""
+    factory = RequestFactory()
+
+    def request_seat(student):
+        request = factory.post(f'/courses/enroll/{course.id}/')
+        request.user = student
+        request.session = SessionBase()
+        request._messages = FallbackStorage(request)
+        try:
+            return enroll_course(request, course.id).status_code != 302
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(request_seat, students))
+
+class Command(BaseCommand):
+    help = 'Fires concurrent enroll requests at one course and checks it is never oversubscribed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--capacity', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=32)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated course and students')
+
+    def handle(self, *args, **options):
+        run = uuid.uuid4().hex[:8]
+        course = Course.objects.create(code=f'LOAD-{run}', name='Enrollment load test', capacity=options['capacity'])
+        User.objects.bulk_create([
+            User(username=f'load-{run}-{index}', role=User.STUDENT)
+            for index in range(options['students'])
+        ])
+        students = list(User.objects.filter(username__startswith=f'load-{run}-'))
+
+        try:
+            started = time.perf_counter()
+            failed = fire_enrollments(course, students, options['workers'])
+            elapsed = time.perf_counter() - started
+
+            course.refresh_from_db()
+            enrolled = Enrollment.objects.filter(course=course, is_active=True).count()
+            waitlisted = WaitlistEntry.objects.filter(course=course).count()
+            self.stdout.write(
+                f'{len(students)} requests from {options["workers"]} workers in {elapsed:.2f}s '
+                f'({len(students) / elapsed:,.0f} req/s): {enrolled} enrolled, {waitlisted} waitlisted, {failed} failed'
+            )
+            if enrolled > course.capacity or course.seats_taken != enrolled:
+                raise CommandError(
+                    f'Oversubscribed: {enrolled} enrollments, {course.seats_taken} seats taken, capacity {course.capacity}'
+                )
+            if failed or enrolled + waitlisted != len(students):
+                raise CommandError(f'{len(students) - enrolled - waitlisted} requests were lost')
+            self.stdout.write(self.style.SUCCESS('Capacity held under concurrent registration'))
+        finally:
+            if not options['keep']:
+                course.delete()
+                User.objects.filter(username__startswith=f'load-{run}-').delete()
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from courses.models import Enrollment, EnrollmentGradeSummary
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-enrollment grade summaries from the grades table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', help='Only rebuild enrollments of the course with this code')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        enrollment_ids = None
+        if options['course']:
+            enrollment_ids = Enrollment.objects.filter(
+                course__code=options['course']
+            ).order_by('id').values_list('id', flat=True).iterator()
+
+        refreshed = EnrollmentGradeSummary.objects.refresh(
+            enrollment_ids,
+            batch_size=options['batch_size']
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt {refreshed} grade summaries')
+        )
@@ -0,0 +1,46 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from courses.analytics import refresh_course_statistics, refresh_stale_statistics
+from courses.models import Course
+
+class Command(BaseCommand):
+    help = 'Recomputes the precomputed course analytics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', help='Only refresh the course with this code')
+        parser.add_argument('--stale', action='store_true',
+                            help='Only refresh courses with writes since their last refresh')
+        parser.add_argument('--interval', type=float,
+                            help='With --stale, keep polling for stale courses this many seconds apart')
+
+    def handle(self, *args, **options):
+        if options['stale']:
+            self.refresh_stale(options['interval'])
+            return
+
+        courses = Course.objects.filter(is_active=True)
+        if options['course']:
+            courses = Course.objects.filter(code=options['course'])
+
+        refreshed = 0
+        for course in courses.iterator():
+            refresh_course_statistics(course)
+            refreshed += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Refreshed statistics for {refreshed} courses')
+        )
+
+    def refresh_stale(self, interval):
+        try:
+            while True:
+                close_old_connections()
+                refreshed = refresh_stale_statistics()
+                if refreshed or interval is None:
+                    self.stdout.write(f'Refreshed statistics for {refreshed} stale courses')
+                if interval is None:
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,34 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from courses.outbox import RateLimiter, send_pending
+
+class Command(BaseCommand):
+    help = 'Sends queued announcement emails in batches over one connection, within a per-minute rate limit'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the due emails and exit instead of polling')
+        parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE)
+        parser.add_argument('--rate', type=int, default=settings.OUTBOX_RATE_PER_MINUTE,
+                            help='Emails per minute, 0 for no limit')
+        parser.add_argument('--interval', type=float, default=10, help='Seconds between polls of an empty outbox')
+
+    def handle(self, *args, **options):
+        rate_limiter = RateLimiter(options['rate'])
+        try:
+            while True:
+                # Outside the request cycle nothing else applies CONN_MAX_AGE and health checks
+                close_old_connections()
+                result = send_pending(batch_size=options['batch_size'], rate_limiter=rate_limiter)
+                if result.attempted:
+                    self.stdout.write(
+                        f'Sent {result.sent}, {result.retried} to retry, {result.failed} failed'
+                    )
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS('Outbox drained' if options['once'] else 'Stopped'))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from courses.grade_import import GradeImportError, read_rows
+from courses.models import Course
+from courses.roster_sync import DEFAULT_BATCH_SIZE, RosterSyncError, sync_enrollments
+
+class Command(BaseCommand):
+    help = 'Syncs enrollments with a registrar roster (CSV/XLSX with course and username or student_id columns)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the .csv or .xlsx roster')
+        parser.add_argument('--course', action='append', dest='courses', metavar='CODE',
+                            help='Only sync this course; may be repeated')
+        parser.add_argument('--no-deactivate', action='store_false', dest='deactivate',
+                            help='Keep enrollments that are missing from the roster')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def progress(self, phase, done, total, elapsed):
+        self.stdout.write(f'{phase}: {done}/{total} ({done / elapsed if elapsed else 0:,.0f} rows/s)')
+
+    def handle(self, *args, **options):
+        courses = None
+        if options['courses']:
+            courses = Course.objects.filter(code__in=options['courses'])
+            missing = set(options['courses']) - set(courses.values_list('code', flat=True))
+            if missing:
+                raise CommandError(f'No course with code {", ".join(sorted(missing))}')
+
+        try:
+            with open(options['path'], 'rb') as file:
+                result = sync_enrollments(
+                    read_rows(file, options['path']),
+                    courses=courses,
+                    batch_size=options['batch_size'],
+                    deactivate=options['deactivate'],
+                    progress=self.progress
+                )
+        except (OSError, GradeImportError, RosterSyncError) as e:
+            raise CommandError(str(e))
+
+        for line, message in result.errors:
+            self.stdout.write(self.style.ERROR(f'Line {line}: {message}'))
+        if result.incomplete:
+            self.stdout.write(self.style.WARNING(
+                f'Kept every enrollment of {len(result.incomplete)} courses whose rows name unknown students'
+            ))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Synced {result.rows} roster rows in {result.elapsed:.2f}s '
+                f'({result.rows / result.elapsed if result.elapsed else 0:,.0f} rows/s): '
+                f'{result.created} created, {result.reactivated} reactivated, {result.deactivated} deactivated, '
+                f'{result.unchanged} unchanged, {len(result.errors)} errors'
+            )
+        )
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0004_rename_date_added_grade_submitted_at_assignment_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnrollmentGradeSummary',
+            fields=[
+                ('enrollment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='grade_summary', serialize=False, to='courses.enrollment')),
+                ('total_score', models.DecimalField(decimal_places=2, default=0, max_digits=9)),
+                ('total_max', models.DecimalField(decimal_places=2, default=0, max_digits=9)),
+                ('weighted_percentage', models.DecimalField(blank=True, decimal_places=1, max_digits=5, null=True)),
+                ('graded_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'enrollment_grade_summaries',
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0005_enrollmentgradesummary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnnouncementReadMarker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_up_to', models.DateTimeField()),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='announcement_read_markers', to='courses.course')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='announcement_read_markers', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'announcement_read_markers',
+                'unique_together': {('user', 'course')},
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_announcementreadmarker'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='announcement',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['course', '-created_at'], name='announce_active_course_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['course', 'due_date'], name='assign_active_course_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['instructor'], name='course_active_instr_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['student', 'course'], name='enroll_active_student_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['course', 'student'], name='enroll_active_course_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseStatistic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('student_count', models.PositiveIntegerField(default=0)),
+                ('graded_count', models.PositiveIntegerField(default=0)),
+                ('completion_rate', models.FloatField(default=0)),
+                ('mean', models.FloatField(blank=True, null=True)),
+                ('median', models.FloatField(blank=True, null=True)),
+                ('stddev', models.FloatField(blank=True, null=True)),
+                ('percentiles', models.JSONField(default=dict)),
+                ('histogram', models.JSONField(default=list)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+                ('assignment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='statistics', to='courses.assignment')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statistics', to='courses.course')),
+            ],
+            options={
+                'db_table': 'course_statistics',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='coursestatistic',
+            constraint=models.UniqueConstraint(fields=('course', 'assignment'), name='course_statistic_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='coursestatistic',
+            constraint=models.UniqueConstraint(condition=models.Q(('assignment__isnull', True)), fields=('course',), name='course_statistic_course_unique'),
+        ),
+    ]
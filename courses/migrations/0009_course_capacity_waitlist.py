@@ -0,0 +1,50 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_seats(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    Enrollment = apps.get_model('courses', 'Enrollment')
+    active = Enrollment.objects.filter(course=OuterRef('pk'), is_active=True).order_by().values('course')
+    Course.objects.update(seats_taken=Coalesce(Subquery(active.annotate(n=Count('id')).values('n')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_coursestatistic'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, help_text='Leave empty for unlimited seats.', null=True),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='seats_taken',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist', to='courses.course')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'waitlist_entries',
+                'ordering': ['created_at', 'id'],
+                'unique_together': {('course', 'student')},
+            },
+        ),
+        migrations.RunPython(count_seats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-18 20:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursestatistic',
+            name='refreshed_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='coursestatistic',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-18 20:51
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_course_statistic_version'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='enrollment',
+            name='enroll_active_student_idx',
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Count, FloatField, Q, Sum
+from django.db.models.functions import Cast
 from users.models import User
 
 class Course(models.Model):
@@ -8,18 +10,45 @@ class Course(models.Model):
     instructor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='courses_taught')
     students = models.ManyToManyField(User, through='Enrollment', related_name='enrolled_courses')
     is_active = models.BooleanField(default=True)
+    capacity = models.PositiveIntegerField(null=True, blank=True, help_text='Leave empty for unlimited seats.')
+    # Active enrollments, maintained by courses.registration
+    seats_taken = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'courses'
+        indexes = [
+            models.Index(fields=['instructor'], condition=Q(is_active=True), name='course_active_instr_idx'),
+        ]
 
     def __str__(self):
         return f"{self.code} - {self.name}"
 
+    def save(self, *args, **kwargs):
+        # seats_taken on an instance is a snapshot; writing it back would undo
+        # the registrations made since it was loaded, so only inserts and
+        # explicit update_fields write it
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'seats_taken'
+            ]
+        super().save(*args, **kwargs)
+
     def get_total_assignments(self):
         return self.assignments.count()
 
+    @property
+    def seats_left(self):
+        if self.capacity is None:
+            return None
+        return max(self.capacity - self.seats_taken, 0)
+
+    @property
+    def is_full(self):
+        return self.capacity is not None and self.seats_taken >= self.capacity
+
 class Assignment(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='assignments')
     title = models.CharField(max_length=200)
@@ -34,6 +63,9 @@ class Assignment(models.Model):
     class Meta:
         db_table = 'assignments'
         ordering = ['due_date']
+        indexes = [
+            models.Index(fields=['course', 'due_date'], condition=Q(is_active=True), name='assign_active_course_due_idx'),
+        ]
 
     def __str__(self):
         return f"{self.course.code} - {self.title}"
@@ -47,19 +79,35 @@ class Enrollment(models.Model):
     class Meta:
         db_table = 'enrollments'
         unique_together = ['student', 'course']
+        # Lookups by student are served by the unique (student, course) index
+        indexes = [
+            models.Index(fields=['course', 'student'], condition=Q(is_active=True), name='enroll_active_course_idx'),
+        ]
 
     def get_current_grade(self):
-        grades = self.grade_set.all()
-        if not grades.exists():
+        try:
+            summary = self.grade_summary
+        except EnrollmentGradeSummary.DoesNotExist:
             return 0
-        
-        total_score = sum(grade.score for grade in grades)
-        total_max = sum(grade.max_score for grade in grades)
-        
-        if total_max == 0:
+
+        if summary.weighted_percentage is None:
             return 0
-            
-        return round((total_score / total_max) * 100, 1)
+
+        return summary.weighted_percentage
+
+class WaitlistEntry(models.Model):
+    """A student queued for a seat in a full course, served first come, first served."""
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='waitlist')
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='waitlist_entries')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'waitlist_entries'
+        unique_together = ['course', 'student']
+        ordering = ['created_at', 'id']
+
+    def __str__(self):
+        return f"{self.student_id} waiting for {self.course_id}"
 
 class Grade(models.Model):
     enrollment = models.ForeignKey(Enrollment, on_delete=models.CASCADE)
@@ -74,6 +122,83 @@ class Grade(models.Model):
     def __str__(self):
         return f"{self.enrollment.student.get_full_name()} - {self.assignment.title if self.assignment else 'No Assignment'}"
 
+class EnrollmentGradeSummaryManager(models.Manager):
+    def refresh(self, enrollment_ids=None, batch_size=500):
+        """Recompute the summaries of the given enrollments (all when None).
+
+        Each batch is one grouped query over the enrollments' grades followed
+        by one upsert, so the cost is bounded by the enrollments touched
+        rather than the size of the grades table.
+        """
+        if enrollment_ids is None:
+            enrollment_ids = Enrollment.objects.order_by('id').values_list('id', flat=True).iterator()
+
+        refreshed = 0
+        batch = []
+        for enrollment_id in enrollment_ids:
+            batch.append(enrollment_id)
+            if len(batch) >= batch_size:
+                refreshed += self._refresh_batch(batch)
+                batch = []
+        if batch:
+            refreshed += self._refresh_batch(batch)
+        return refreshed
+
+    def _refresh_batch(self, enrollment_ids):
+        # Grades of inactive assignments do not count, as in courses.grading
+        graded = Q(grade__assignment__is_active=True)
+        weighted = graded & Q(grade__assignment__max_score__gt=0)
+        rows = Enrollment.objects.filter(id__in=enrollment_ids).values('id').annotate(
+            total_score=Sum('grade__score', filter=graded),
+            total_max=Sum('grade__assignment__max_score', filter=graded),
+            graded_count=Count('grade', filter=graded),
+            weighted_points=Sum(
+                Cast('grade__assignment__weight', FloatField())
+                * Cast('grade__score', FloatField())
+                / Cast('grade__assignment__max_score', FloatField()),
+                filter=weighted
+            ),
+            total_weight=Sum(Cast('grade__assignment__weight', FloatField()), filter=weighted),
+        )
+
+        summaries = []
+        for row in rows:
+            weighted_percentage = None
+            if row['total_weight']:
+                weighted_percentage = round(row['weighted_points'] / row['total_weight'] * 100, 1)
+            summaries.append(self.model(
+                enrollment_id=row['id'],
+                total_score=row['total_score'] or 0,
+                total_max=row['total_max'] or 0,
+                weighted_percentage=weighted_percentage,
+                graded_count=row['graded_count'],
+            ))
+
+        self.bulk_create(
+            summaries,
+            update_conflicts=True,
+            unique_fields=['enrollment'],
+            update_fields=['total_score', 'total_max', 'weighted_percentage', 'graded_count', 'updated_at'],
+        )
+        return len(summaries)
+
+class EnrollmentGradeSummary(models.Model):
+    """Denormalized grade totals for one enrollment, kept in sync on Grade writes."""
+    enrollment = models.OneToOneField(Enrollment, on_delete=models.CASCADE, primary_key=True, related_name='grade_summary')
+    total_score = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    total_max = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    weighted_percentage = models.DecimalField(max_digits=5, decimal_places=1, null=True, blank=True)
+    graded_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = EnrollmentGradeSummaryManager()
+
+    class Meta:
+        db_table = 'enrollment_grade_summaries'
+
+    def __str__(self):
+        return f"Summary for enrollment {self.enrollment_id}"
+
 class Announcement(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
@@ -87,3 +212,90 @@ class Announcement(models.Model):
     class Meta:
         db_table = 'announcements'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['course', '-created_at'], condition=Q(is_active=True), name='announce_active_course_idx'),
+        ]
+
+class OutboxEmail(models.Model):
+    """An announcement email waiting in the outbox for the ``send_outbox`` worker."""
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    announcement = models.ForeignKey(Announcement, on_delete=models.CASCADE, related_name='outbox_emails')
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='outbox_emails')
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Not picked up before this time: retry backoff, or a worker's claim on it
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'email_outbox'
+        unique_together = ['announcement', 'recipient']
+        indexes = [
+            models.Index(fields=['next_attempt_at'], condition=Q(status='pending'), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.to_email} ({self.status})"
+
+class AnnouncementReadMarker(models.Model):
+    """Per-user, per-course "read up to" watermark for announcements.
+
+    Every announcement in the course created at or before ``read_up_to`` counts
+    as read; reads of newer announcements are kept as exceptions in
+    ``Announcement.read_by`` until they are compacted into the watermark.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='announcement_read_markers')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='announcement_read_markers')
+    read_up_to = models.DateTimeField()
+
+    class Meta:
+        db_table = 'announcement_read_markers'
+        unique_together = ['user', 'course']
+
+    def __str__(self):
+        return f"{self.user_id} read {self.course_id} up to {self.read_up_to}"
+
+class CourseStatistic(models.Model):
+    """Precomputed grade statistics for a course (``assignment`` empty) or one of its assignments.
+
+    Values are percentages of the max score; refreshed by ``courses.analytics``.
+    """
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='statistics')
+    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, null=True, blank=True, related_name='statistics')
+    student_count = models.PositiveIntegerField(default=0)
+    graded_count = models.PositiveIntegerField(default=0)
+    completion_rate = models.FloatField(default=0)
+    mean = models.FloatField(null=True, blank=True)
+    median = models.FloatField(null=True, blank=True)
+    stddev = models.FloatField(null=True, blank=True)
+    percentiles = models.JSONField(default=dict)
+    histogram = models.JSONField(default=list)
+    refreshed_at = models.DateTimeField(auto_now=True)
+    # Course row only: bumped by writes, and the value a refresh last saw
+    version = models.PositiveIntegerField(default=0)
+    refreshed_version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'course_statistics'
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'assignment'], name='course_statistic_unique'),
+            models.UniqueConstraint(
+                fields=['course'], condition=Q(assignment__isnull=True), name='course_statistic_course_unique'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Statistics for {self.course_id} / {self.assignment_id or 'course'}"
@@ -0,0 +1,183 @@
+"""Outbox for announcement emails.
+
+Publishing an announcement only queues one ``OutboxEmail`` row per student
+who wants email notifications (``enqueue_announcement``, run after commit).
+The ``send_outbox`` worker drains the queue with ``send_pending``: it claims
+a batch of due rows, sends them over one reused connection from
+``get_connection()`` within a per-minute rate limit, marks each row sent as
+soon as its message is accepted, and reschedules failures with exponential
+backoff until ``OUTBOX_MAX_ATTEMPTS``. A batch is never larger than a
+minute's worth of the rate, and its claim lasts as long as sending it can
+take plus ``CLAIM_TIMEOUT``, so another worker never picks up rows that are
+still waiting their turn.
+"""
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from users.models import User
+from .models import Announcement, OutboxEmail
+
+DEFAULT_BATCH_SIZE = 100
+ENQUEUE_BATCH_SIZE = 1000
+# How long a claimed row stays hidden from other workers beyond the time the
+# rate limit needs to send its batch
+CLAIM_TIMEOUT = timedelta(minutes=5)
+RETRY_DELAY = timedelta(minutes=1)
+
+def announcement_email(announcement):
+    subject = f'[{announcement.course.code}] {announcement.title}'
+    body = (
+        f'{announcement.content}\n\n'
+        f'{announcement.instructor.get_full_name() or announcement.instructor.username}, {announcement.course.name}\n\n'
+        'You receive this email because email notifications are on in your profile.'
+    )
+    return subject, body
+
+def enqueue_announcement(announcement_id):
+    """Queue an email of the announcement for every enrolled student who wants one.
+
+    Safe to run more than once: students already queued are skipped and not
+    counted in the returned number of queued emails.
+    """
+    announcement = Announcement.objects.select_related('course', 'instructor').get(id=announcement_id)
+    subject, body = announcement_email(announcement)
+    now = timezone.now()
+    recipients = User.objects.filter(
+        enrollment__course_id=announcement.course_id,
+        enrollment__is_active=True,
+        email_notifications=True,
+        is_active=True
+    ).exclude(email='').values_list('id', 'email')
+
+    queue = OutboxEmail.objects.filter(announcement=announcement)
+    already_queued = queue.count()
+    batch = []
+    for recipient_id, email in recipients.iterator(chunk_size=ENQUEUE_BATCH_SIZE):
+        batch.append(OutboxEmail(
+            announcement=announcement,
+            recipient_id=recipient_id,
+            to_email=email,
+            subject=subject,
+            body=body,
+            next_attempt_at=now
+        ))
+        if len(batch) == ENQUEUE_BATCH_SIZE:
+            OutboxEmail.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        OutboxEmail.objects.bulk_create(batch, ignore_conflicts=True)
+    # ignore_conflicts does not report which rows were skipped
+    return queue.count() - already_queued
+
+class RateLimiter:
+    """Allows at most ``per_minute`` calls to ``wait`` in any sliding minute."""
+
+    def __init__(self, per_minute, clock=time.monotonic, sleep=time.sleep):
+        self.per_minute = per_minute
+        self.clock = clock
+        self.sleep = sleep
+        self._sent = deque()
+
+    def wait(self):
+        if not self.per_minute:
+            return
+        now = self.clock()
+        while self._sent and self._sent[0] <= now - 60:
+            self._sent.popleft()
+        if len(self._sent) >= self.per_minute:
+            self.sleep(self._sent[0] + 60 - now)
+            now = self.clock()
+            self._sent.popleft()
+        self._sent.append(now)
+
+@dataclass
+class OutboxResult:
+    sent: int = 0
+    retried: int = 0
+    failed: int = 0
+
+    @property
+    def attempted(self):
+        return self.sent + self.retried + self.failed
+
+def claim_timeout(batch_size, per_minute=0):
+    """How long a batch stays claimed: the time to send it at ``per_minute`` plus ``CLAIM_TIMEOUT``."""
+    if not per_minute:
+        return CLAIM_TIMEOUT
+    return CLAIM_TIMEOUT + timedelta(minutes=batch_size / per_minute)
+
+def claim_batch(batch_size, per_minute=0):
+    """Take up to ``batch_size`` due rows, hiding them from other workers while they are sent."""
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        OutboxEmail.objects.filter(id__in=[email.id for email in emails]).update(
+            next_attempt_at=now + claim_timeout(len(emails), per_minute)
+        )
+    return emails
+
+def _record_failure(email, error, max_attempts, result):
+    email.attempts += 1
+    email.last_error = str(error) or error.__class__.__name__
+    if email.attempts >= max_attempts:
+        email.status = OutboxEmail.FAILED
+        result.failed += 1
+    else:
+        email.next_attempt_at = timezone.now() + RETRY_DELAY * 2 ** (email.attempts - 1)
+        result.retried += 1
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+def send_pending(batch_size=None, rate_limiter=None, max_attempts=None, connection=None):
+    """Send one claimed batch of due outbox emails over a single connection."""
+    batch_size = batch_size or getattr(settings, 'OUTBOX_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    max_attempts = max_attempts or getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+    per_minute = rate_limiter.per_minute if rate_limiter is not None else 0
+    if per_minute:
+        # Rows claimed beyond a minute's worth would only wait for the limiter
+        batch_size = min(batch_size, per_minute)
+    result = OutboxResult()
+    emails = claim_batch(batch_size, per_minute)
+    if not emails:
+        return result
+
+    connection = connection or get_connection()
+    done = set()
+    try:
+        connection.open()
+        for email in emails:
+            if rate_limiter is not None:
+                rate_limiter.wait()
+            message = EmailMessage(email.subject, email.body, settings.DEFAULT_FROM_EMAIL, [email.to_email])
+            done.add(email.id)
+            # One message per call so a rejected recipient fails alone
+            try:
+                connection.send_messages([message])
+            except Exception as e:
+                _record_failure(email, e, max_attempts, result)
+                # The server may have dropped us; reconnect for the rest
+                connection.close()
+                connection.open()
+            else:
+                # Recorded at once so a crash later in the batch cannot send it twice
+                OutboxEmail.objects.filter(id=email.id).update(
+                    status=OutboxEmail.SENT, attempts=F('attempts') + 1, sent_at=timezone.now(), last_error=''
+                )
+                result.sent += 1
+    except Exception as e:
+        # Could not (re)connect: the rest of the batch is retried later
+        for email in emails:
+            if email.id not in done:
+                _record_failure(email, e, max_attempts, result)
+    finally:
+        connection.close()
+    return result
@@ -0,0 +1,135 @@
+"""Announcement read state.
+
+A student's read state for a course is a watermark (``AnnouncementReadMarker``)
+plus the individual receipts in ``Announcement.read_by`` for announcements
+newer than it. Reads are answered with ``Exists`` subqueries folded into the
+announcement query itself, so a page of announcements never costs a query per
+row, and writes are single upserts that never check before inserting.
+"""
+from django.db.models import BooleanField, Exists, ExpressionWrapper, OuterRef, Q
+from django.utils import timezone
+from users.cache import invalidate_dashboards
+from .models import Announcement, AnnouncementReadMarker, Enrollment
+
+ReadReceipt = Announcement.read_by.through
+
+def _read_condition(user):
+    covered_by_marker = Exists(AnnouncementReadMarker.objects.filter(
+        user=user,
+        course=OuterRef('course'),
+        read_up_to__gte=OuterRef('created_at')
+    ))
+    has_receipt = Exists(ReadReceipt.objects.filter(announcement=OuterRef('pk'), user=user))
+    return Q(covered_by_marker) | Q(has_receipt)
+
+def with_read_state(queryset, user):
+    """Annotate each announcement in the queryset with ``is_read`` for the user."""
+    return queryset.annotate(
+        is_read=ExpressionWrapper(_read_condition(user), output_field=BooleanField())
+    )
+
+def unread(queryset, user):
+    """Restrict the queryset to announcements the user has not read."""
+    return queryset.exclude(_read_condition(user))
+
+def get_read_flags(user, announcement_ids):
+    """Return ``{announcement_id: is_read}`` for a page of announcements in one query."""
+    queryset = with_read_state(Announcement.objects.filter(id__in=announcement_ids), user)
+    return dict(queryset.values_list('id', 'is_read'))
+
+def mark_read(user, announcement):
+    """Record that the user has read the announcement.
+
+    When the announcement was loaded through ``with_read_state`` and is already
+    read, nothing is written; otherwise the receipt is inserted with
+    ``ON CONFLICT DO NOTHING`` so repeated views never fail or duplicate.
+    """
+    if getattr(announcement, 'is_read', False):
+        return False
+    ReadReceipt.objects.bulk_create(
+        [ReadReceipt(announcement_id=announcement.id, user_id=user.id)],
+        ignore_conflicts=True
+    )
+    invalidate_dashboards([user.id])
+    return True
+
+def mark_all_read(user, course_ids=None, now=None):
+    """Mark every announcement in the user's courses (or ``course_ids``) as read.
+
+    Moves the user's watermarks forward in one upsert and drops the receipts
+    the new watermarks make redundant.
+    """
+    now = now or timezone.now()
+    if course_ids is None:
+        course_ids = Enrollment.objects.filter(
+            student=user,
+            is_active=True
+        ).values_list('course_id', flat=True)
+    course_ids = list(course_ids)
+    if not course_ids:
+        return 0
+
+    AnnouncementReadMarker.objects.bulk_create(
+        [AnnouncementReadMarker(user=user, course_id=course_id, read_up_to=now) for course_id in course_ids],
+        update_conflicts=True,
+        unique_fields=['user', 'course'],
+        update_fields=['read_up_to']
+    )
+    ReadReceipt.objects.filter(
+        user=user,
+        announcement__course__in=course_ids,
+        announcement__created_at__lte=now
+    ).delete()
+    invalidate_dashboards([user.id])
+    return len(course_ids)
+
+def compact_course(course_id):
+    """Fold each reader's contiguous run of receipts into their watermark.
+
+    For every user with receipts in the course, the watermark advances to the
+    newest announcement before their first unread one; the watermarks are
+    written in one upsert and the receipts they cover are deleted in one
+    statement. Returns the number of receipts removed.
+    """
+    announcements = list(
+        Announcement.objects.filter(course_id=course_id).order_by('created_at', 'id').values_list('id', 'created_at')
+    )
+    if not announcements:
+        return 0
+
+    receipts = {}
+    for user_id, announcement_id in ReadReceipt.objects.filter(
+        announcement__course_id=course_id
+    ).values_list('user_id', 'announcement_id'):
+        receipts.setdefault(user_id, set()).add(announcement_id)
+    markers = dict(AnnouncementReadMarker.objects.filter(
+        course_id=course_id,
+        user_id__in=receipts
+    ).values_list('user_id', 'read_up_to'))
+
+    new_markers = []
+    for user_id, read_ids in receipts.items():
+        watermark = markers.get(user_id)
+        for announcement_id, created_at in announcements:
+            if watermark is not None and created_at <= watermark:
+                continue
+            if announcement_id not in read_ids:
+                break
+            watermark = created_at
+        if watermark is None or watermark == markers.get(user_id):
+            continue
+        new_markers.append(AnnouncementReadMarker(user_id=user_id, course_id=course_id, read_up_to=watermark))
+
+    AnnouncementReadMarker.objects.bulk_create(
+        new_markers,
+        update_conflicts=True,
+        unique_fields=['user', 'course'],
+        update_fields=['read_up_to']
+    )
+    # One DELETE for every reader: the receipts their watermark now covers
+    covered = Exists(AnnouncementReadMarker.objects.filter(
+        user=OuterRef('user_id'),
+        course_id=course_id,
+        read_up_to__gte=OuterRef('announcement__created_at')
+    ))
+    return ReadReceipt.objects.filter(covered, announcement__course_id=course_id).delete()[0]
@@ -0,0 +1,130 @@
+"""Seat-limited course registration with FIFO waitlists.
+
+``Course.seats_taken`` counts a course's active enrollments and is only ever
+changed with a conditional UPDATE, so a seat is claimed atomically by the
+database however many registrations race for the last one:
+
+    UPDATE courses SET seats_taken = seats_taken + 1
+    WHERE id = %s AND is_active AND (capacity IS NULL OR seats_taken < capacity)
+
+``Course.save()`` leaves the column out of its UPDATE, so editing a course
+never writes back a stale count.
+
+A student who finds the course full joins its waitlist. Whenever a seat frees
+up, ``promote_waitlist`` hands it to the oldest waitlist entries. Every path
+that locks both a course and one of its enrollments locks the course first.
+"""
+import random
+import time
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from .models import Course, Enrollment, WaitlistEntry
+
+ENROLLED = 'enrolled'
+WAITLISTED = 'waitlisted'
+ALREADY_ENROLLED = 'already_enrolled'
+ALREADY_WAITLISTED = 'already_waitlisted'
+CLOSED = 'closed'
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 0.02
+
+def with_retry(operation):
+    """Run ``operation`` again after losing a race or hitting a lock timeout.
+
+    An IntegrityError means a concurrent request created the same enrollment
+    or waitlist entry first; the next attempt sees its row. OperationalError
+    covers deadlocks and lock timeouts ("database is locked" on SQLite).
+    """
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return operation()
+        except (IntegrityError, OperationalError):
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+        time.sleep(random.uniform(0, RETRY_DELAY * 2 ** attempt))
+
+def reserve_seat(course_id):
+    """Claim one seat; False when the course is full or inactive."""
+    return Course.objects.filter(
+        Q(capacity__isnull=True) | Q(seats_taken__lt=F('capacity')),
+        id=course_id,
+        is_active=True
+    ).update(seats_taken=F('seats_taken') + 1) == 1
+
+def release_seat(course_id):
+    Course.objects.filter(id=course_id, seats_taken__gt=0).update(seats_taken=F('seats_taken') - 1)
+
+def _activate(student_id, course_id):
+    """Create or reactivate the enrollment for a seat already reserved."""
+    enrollment, created = Enrollment.objects.get_or_create(student_id=student_id, course_id=course_id)
+    if not created:
+        if enrollment.is_active:
+            raise IntegrityError(f'Student {student_id} is already enrolled in course {course_id}')
+        enrollment.is_active = True
+        enrollment.save(update_fields=['is_active'])
+    WaitlistEntry.objects.filter(course_id=course_id, student_id=student_id).delete()
+    return enrollment
+
+def _enroll(student_id, course_id):
+    with transaction.atomic():
+        # Claiming the seat is the first statement so that on SQLite the write
+        # lock is queued for up front instead of upgraded from a read lock.
+        reserved = reserve_seat(course_id)
+        if Enrollment.objects.filter(student_id=student_id, course_id=course_id, is_active=True).exists():
+            transaction.set_rollback(True)
+            return ALREADY_ENROLLED
+        if reserved:
+            _activate(student_id, course_id)
+            return ENROLLED
+        if not Course.objects.filter(id=course_id, is_active=True).exists():
+            return CLOSED
+        _, created = WaitlistEntry.objects.get_or_create(course_id=course_id, student_id=student_id)
+        return WAITLISTED if created else ALREADY_WAITLISTED
+
+def enroll(student, course):
+    """Enroll ``student`` or put them on the waitlist; returns one of the status constants."""
+    return with_retry(lambda: _enroll(student.pk, course.pk))
+
+def promote_waitlist(course_id):
+    """Move waitlisted students into free seats, oldest entry first. Returns their ids."""
+    promoted = []
+    with transaction.atomic():
+        if Course.objects.select_for_update().filter(id=course_id).first() is None:
+            return promoted
+        for entry in WaitlistEntry.objects.filter(course_id=course_id).order_by('created_at', 'id'):
+            if Enrollment.objects.filter(student_id=entry.student_id, course_id=course_id, is_active=True).exists():
+                entry.delete()
+                continue
+            if not reserve_seat(course_id):
+                break
+            _activate(entry.student_id, course_id)
+            promoted.append(entry.student_id)
+    return promoted
+
+def _drop(student_id, course_id):
+    with transaction.atomic():
+        Course.objects.select_for_update().filter(id=course_id).first()
+        enrollment = Enrollment.objects.select_for_update().filter(
+            student_id=student_id,
+            course_id=course_id,
+            is_active=True
+        ).first()
+        if enrollment is None:
+            return WaitlistEntry.objects.filter(course_id=course_id, student_id=student_id).delete()[0] > 0
+        enrollment.is_active = False
+        enrollment.save(update_fields=['is_active'])
+        release_seat(course_id)
+        promote_waitlist(course_id)
+        return True
+
+def drop(student, course):
+    """Leave the course (or its waitlist), passing the seat to the waitlist. False if neither applied."""
+    return with_retry(lambda: _drop(student.pk, course.pk))
+
+def recount_seats(course_ids=None):
+    """Reset ``seats_taken`` from the enrollments, for writes that bypass this module."""
+    active = Enrollment.objects.filter(course=OuterRef('pk'), is_active=True).order_by().values('course')
+    courses = Course.objects.all() if course_ids is None else Course.objects.filter(id__in=course_ids)
+    return courses.update(seats_taken=Coalesce(Subquery(active.annotate(n=Count('id')).values('n')), 0))
@@ -0,0 +1,180 @@
+"""Registrar roster sync.
+
+A roster file has one row per enrollment: a ``course`` column holding the
+course code and a ``username`` (or ``student_id``) column identifying the
+student. The file is authoritative for every course it has valid rows for:
+the wanted ``(student, course)`` pairs are diffed in memory against the
+existing enrollments of those courses, then missing enrollments are
+inserted, inactive ones reactivated and the ones missing from the file
+deactivated, in fixed-size batches of one statement and one transaction
+each. A course with a row naming an unknown student is not trusted to be
+complete, so none of its enrollments are deactivated. The registrar decides
+who is enrolled, so course capacity does not limit a sync, and the waitlist
+of a course synced this way is not promoted into the seats it frees.
+
+Bulk writes skip the model signals, so seat counts, waitlists, dashboards,
+course statistics and cached course fragments are brought up to date once at
+the end.
+"""
+import time
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from users.cache import invalidate_dashboards
+from users.models import User
+from .analytics import mark_statistics_stale
+from .fragments import bump_generations
+from .grade_import import IDENTIFIER_COLUMNS
+from .models import Course, Enrollment, WaitlistEntry
+from .registration import promote_waitlist, recount_seats
+
+DEFAULT_BATCH_SIZE = 1000
+
+class RosterSyncError(Exception):
+    """The roster as a whole cannot be synced."""
+
+class RosterSyncResult:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.reactivated = 0
+        self.deactivated = 0
+        self.unchanged = 0
+        # Ids of courses whose enrollments were kept because rows failed
+        self.incomplete = set()
+        self.errors = []
+        self.elapsed = 0.0
+
+    def add_error(self, line, message):
+        self.errors.append((line, message))
+
+    @property
+    def changed(self):
+        return self.created + self.reactivated + self.deactivated
+
+class RosterSync:
+    """Sync enrollments from roster rows.
+
+    ``courses`` limits the sync to those courses (rows for any other course
+    are reported as errors); ``deactivate=False`` only ever adds students.
+    ``progress`` is called after every batch with ``(phase, done, total, elapsed)``.
+    """
+
+    def __init__(self, courses=None, batch_size=DEFAULT_BATCH_SIZE, deactivate=True, progress=None):
+        self.courses = Course.objects.all() if courses is None else courses
+        self.batch_size = batch_size
+        self.deactivate = deactivate
+        self.progress = progress
+
+    def read(self, rows, result):
+        """The wanted ``(student_id, course_id)`` pairs and the ids of the courses they name.
+
+        Courses with rows that name no known student are added to ``result.incomplete``.
+        """
+        course_ids = dict(self.courses.values_list('code', 'id'))
+        students = None
+        identifier = None
+        wanted = set()
+        mentioned = set()
+
+        for line, row in rows:
+            if students is None:
+                identifier = next((name for name in IDENTIFIER_COLUMNS if name in row), None)
+                if identifier is None or 'course' not in row:
+                    raise RosterSyncError('The roster needs a "course" column and a "username" or "student_id" column.')
+                students = dict(
+                    User.objects.filter(role=User.STUDENT).exclude(**{identifier: None}).values_list(identifier, 'id')
+                )
+
+            result.rows += 1
+            code = (row.get('course') or '').strip()
+            key = (row.get(identifier) or '').strip()
+            course_id = course_ids.get(code)
+            if course_id is None:
+                result.add_error(line, f'Unknown course "{code}"')
+                continue
+            student_id = students.get(key)
+            if student_id is None:
+                result.add_error(line, f'No student with {identifier} "{key}"')
+                result.incomplete.add(course_id)
+                continue
+            mentioned.add(course_id)
+            wanted.add((student_id, course_id))
+        return wanted, mentioned
+
+    def run(self, rows):
+        result = RosterSyncResult()
+        started = time.monotonic()
+        wanted, course_ids = self.read(rows, result)
+
+        existing = {
+            (student_id, course_id): (enrollment_id, is_active)
+            for enrollment_id, student_id, course_id, is_active in Enrollment.objects.filter(
+                course_id__in=course_ids
+            ).values_list('id', 'student_id', 'course_id', 'is_active').iterator(chunk_size=self.batch_size)
+        }
+        to_create = wanted - existing.keys()
+        to_reactivate = [existing[pair][0] for pair in wanted & existing.keys() if not existing[pair][1]]
+        authoritative = course_ids - result.incomplete if self.deactivate else set()
+        to_deactivate = [
+            enrollment_id for (student_id, course_id), (enrollment_id, is_active) in existing.items()
+            if is_active and course_id in authoritative and (student_id, course_id) not in wanted
+        ]
+        result.unchanged = len(wanted) - len(to_create) - len(to_reactivate)
+
+        result.created = self._apply('create', sorted(to_create), started, self._create)
+        result.reactivated = self._apply('reactivate', to_reactivate, started, lambda batch: (
+            Enrollment.objects.filter(id__in=batch).update(is_active=True)
+        ))
+        result.deactivated = self._apply('deactivate', to_deactivate, started, lambda batch: (
+            Enrollment.objects.filter(id__in=batch).update(is_active=False)
+        ))
+
+        if result.changed:
+            self._refresh_derived(course_ids, authoritative, to_create, to_reactivate, to_deactivate, existing)
+        result.elapsed = time.monotonic() - started
+        return result
+
+    def _apply(self, phase, items, started, write):
+        done = 0
+        for offset in range(0, len(items), self.batch_size):
+            with transaction.atomic():
+                done += write(items[offset:offset + self.batch_size])
+            if self.progress:
+                self.progress(phase, min(offset + self.batch_size, len(items)), len(items), time.monotonic() - started)
+        return done
+
+    def _create(self, batch):
+        # Enrolled concurrently since the diff; ignore_conflicts would skip them silently
+        taken = set(Enrollment.objects.filter(
+            student_id__in={student_id for student_id, _ in batch},
+            course_id__in={course_id for _, course_id in batch}
+        ).values_list('student_id', 'course_id'))
+        new = [pair for pair in batch if pair not in taken]
+        Enrollment.objects.bulk_create(
+            [Enrollment(student_id=student_id, course_id=course_id) for student_id, course_id in new],
+            ignore_conflicts=True
+        )
+        return len(new)
+
+    def _refresh_derived(self, course_ids, authoritative, created, reactivated, deactivated, existing):
+        recount_seats(course_ids)
+        WaitlistEntry.objects.filter(course_id__in=course_ids).filter(Exists(Enrollment.objects.filter(
+            course=OuterRef('course'),
+            student=OuterRef('student'),
+            is_active=True
+        ))).delete()
+        # The roster already says who has the seats of an authoritative course
+        for course_id in course_ids - authoritative:
+            promote_waitlist(course_id)
+        mark_statistics_stale(course_ids)
+        bump_generations(course_ids)
+
+        by_id = {enrollment_id: student_id for (student_id, _), (enrollment_id, _) in existing.items()}
+        invalidate_dashboards(
+            {student_id for student_id, _ in created}
+            | {by_id[enrollment_id] for enrollment_id in reactivated}
+            | {by_id[enrollment_id] for enrollment_id in deactivated}
+        )
+
+def sync_enrollments(rows, **options):
+    return RosterSync(**options).run(rows)
@@ -0,0 +1,139 @@
+import threading
+from functools import partial
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from users.cache import invalidate_dashboards
+from .analytics import mark_statistics_stale
+from .fragments import bump_generations
+from .live import publish_announcement
+from .outbox import enqueue_announcement
+from .models import Announcement, Assignment, Course, Enrollment, EnrollmentGradeSummary, Grade
+from .registration import promote_waitlist, release_seat
+
+_pending = threading.local()
+
+def on_commit_batch(name, ids, run):
+    """Add ``ids`` to the batch ``name`` and call ``run(ids)`` once the transaction commits.
+
+    A cascade delete sends a signal for every grade and enrollment it
+    removes. The first of their callbacks to run takes the whole batch and
+    the others find nothing left, so the work is done once per transaction
+    instead of once per row. Ids from a rolled-back transaction stay in the
+    batch and are refreshed along with the next one.
+    """
+    if not hasattr(_pending, 'batches'):
+        _pending.batches = {}
+    _pending.batches.setdefault(name, set()).update(ids)
+    transaction.on_commit(partial(_run_batch, name, run))
+
+def _run_batch(name, run):
+    ids = _pending.batches.pop(name, None)
+    if ids:
+        run(ids)
+
+def deleting_course(origin):
+    """Whether a delete started from a course, whose rows all go with it."""
+    return isinstance(origin, Course) or isinstance(origin, QuerySet) and origin.model is Course
+
+def refresh_grade_summaries(enrollment_ids):
+    """Bring everything derived from the enrollments' grades up to date.
+
+    Recomputes their grade summaries, drops their students' cached dashboards
+    and marks the statistics of their courses stale.
+    """
+    EnrollmentGradeSummary.objects.refresh(enrollment_ids)
+    pairs = list(Enrollment.objects.filter(id__in=enrollment_ids).values_list('student_id', 'course_id'))
+    invalidate_dashboards([student_id for student_id, _ in pairs])
+    mark_statistics_stale({course_id for _, course_id in pairs})
+
+@receiver(post_save, sender=Grade)
+@receiver(post_delete, sender=Grade)
+def refresh_enrollment_grade_summary(sender, instance, **kwargs):
+    """Keep the enrollment's grade summary in step with its grades."""
+    on_commit_batch('grade_summaries', [instance.enrollment_id], refresh_grade_summaries)
+
+@receiver(post_save, sender=Assignment)
+def refresh_course_grade_summaries(sender, instance, created, **kwargs):
+    """A changed max_score, weight or is_active alters every summary in the course."""
+    if created:
+        on_commit_batch('statistics', [instance.course_id], mark_statistics_stale)
+        return
+    on_commit_batch('course_grade_summaries', [instance.course_id], refresh_courses_grade_summaries)
+
+def refresh_courses_grade_summaries(course_ids):
+    refresh_grade_summaries(list(Enrollment.objects.filter(course_id__in=course_ids).values_list('id', flat=True)))
+
+def promote_waitlists(course_ids):
+    for course_id in course_ids:
+        promote_waitlist(course_id)
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def invalidate_student_dashboard(sender, instance, origin=None, **kwargs):
+    on_commit_batch('dashboards', [instance.student_id], invalidate_dashboards)
+    if not deleting_course(origin):
+        on_commit_batch('statistics', [instance.course_id], mark_statistics_stale)
+
+@receiver(post_delete, sender=Enrollment)
+def free_deleted_enrollment_seat(sender, instance, origin=None, **kwargs):
+    # The seats of a course being deleted go with it
+    if not instance.is_active or deleting_course(origin):
+        return
+    release_seat(instance.course_id)
+    on_commit_batch('waitlists', [instance.course_id], promote_waitlists)
+
+@receiver(post_save, sender=Course)
+def fill_course_seats(sender, instance, created, **kwargs):
+    """A raised capacity opens seats for the waitlist."""
+    if created:
+        return
+    course_id = instance.id
+    transaction.on_commit(lambda: promote_waitlist(course_id))
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Announcement)
+@receiver(post_delete, sender=Announcement)
+def invalidate_course_dashboards(sender, instance, origin=None, **kwargs):
+    course_id = instance.id if sender is Course else instance.course_id
+    # Enrollment deletes drop the dashboards of a course being deleted
+    if not deleting_course(origin):
+        on_commit_batch('course_dashboards', [course_id], lambda course_ids: invalidate_dashboards(
+            Enrollment.objects.filter(course_id__in=course_ids).values_list('student_id', flat=True)
+        ))
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=Announcement)
+@receiver(post_delete, sender=Announcement)
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def invalidate_course_fragments(sender, instance, **kwargs):
+    course_id = instance.id if sender is Course else instance.course_id
+    on_commit_batch('fragments', [course_id], bump_generations)
+
+@receiver(post_save, sender=Announcement)
+def push_new_announcement(sender, instance, created, **kwargs):
+    """Send a newly published announcement to the open streams of its course."""
+    if created and instance.is_active:
+        transaction.on_commit(lambda: publish_announcement(instance))
+
+@receiver(post_save, sender=Announcement)
+def queue_announcement_emails(sender, instance, created, **kwargs):
+    """Queue the emails of a new announcement; the send_outbox worker sends them."""
+    if created and instance.is_active:
+        announcement_id = instance.id
+        transaction.on_commit(lambda: enqueue_announcement(announcement_id))
+
+@receiver(m2m_changed, sender=Announcement.read_by.through)
+def invalidate_reader_dashboards(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        user_ids = [instance.pk]
+    elif pk_set:
+        user_ids = list(pk_set)
+    else:
+        user_ids = Enrollment.objects.filter(course_id=instance.course_id).values_list('student_id', flat=True)
+    transaction.on_commit(lambda: invalidate_dashboards(user_ids))
@@ -0,0 +1,83 @@
+"""Server-Sent Events stream of new announcements.
+
+``announcement_stream`` is an async view: served by the ASGI application
+each open stream is a coroutine waiting on its queue in ``courses.live``,
+not a worker thread. A WSGI worker would have to hold a thread per stream
+(Django even tries to collect the endless iterator first), so under WSGI
+the view answers 204, which tells ``EventSource`` to stop reconnecting;
+pages only open the stream when ``LIVE_ANNOUNCEMENTS`` is on, as it is by
+default in ``student_portal.asgi``.
+"""
+import asyncio
+import json
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from .live import announcement_event, get_hub
+from .models import Announcement, Enrollment
+
+BACKLOG_LIMIT = 50
+
+def format_event(event, name='announcement'):
+    lines = [f'event: {name}']
+    if 'id' in event:
+        lines.append(f'id: {event["id"]}')
+    lines.append(f'data: {json.dumps(event)}')
+    return '\n'.join(lines) + '\n\n'
+
+async def _missed_events(course_ids, last_event_id):
+    """Announcements published while a reconnecting client was away."""
+    announcements = Announcement.objects.filter(
+        course_id__in=course_ids,
+        is_active=True,
+        id__gt=last_event_id
+    ).select_related('course').order_by('id')[:BACKLOG_LIMIT]
+    return [announcement_event(announcement) async for announcement in announcements]
+
+async def _events(course_ids, backlog, keepalive):
+    hub = get_hub()
+    # Subscribed only once the server starts streaming, so a response that
+    # is never sent leaves nothing behind in the hub
+    subscription = hub.subscribe(course_ids)
+    try:
+        yield f'retry: {keepalive * 1000}\n\n'
+        for event in backlog:
+            yield format_event(event)
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if subscription.overflowed:
+                subscription.overflowed = False
+                yield format_event({}, name='resync')
+            yield format_event(event)
+    finally:
+        hub.unsubscribe(subscription)
+
+async def announcement_stream(request):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    course_ids = [
+        course_id async for course_id in Enrollment.objects.filter(
+            student=user,
+            is_active=True
+        ).values_list('course_id', flat=True)
+    ]
+    backlog = []
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    if last_event_id.isdigit():
+        backlog = await _missed_events(course_ids, int(last_event_id))
+
+    response = StreamingHttpResponse(
+        _events(course_ids, backlog, getattr(settings, 'SSE_KEEPALIVE_SECONDS', 15)),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,45 @@
+from django import template
+from django.utils.safestring import mark_safe
+from ..fragments import get_fragment
+
+register = template.Library()
+
+class CourseCacheNode(template.Node):
+    def __init__(self, nodelist, name, course, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.course = course
+        self.vary_on = vary_on
+
+    def render(self, context):
+        course = self.course.resolve(context)
+        course_id = getattr(course, 'pk', course)
+        vary_on = [value.resolve(context) for value in self.vary_on]
+        return mark_safe(get_fragment(
+            self.name.resolve(context),
+            course_id,
+            lambda: self.nodelist.render(context),
+            vary_on
+        ))
+
+@register.tag
+def coursecache(parser, token):
+    """Cache the enclosed block per course, shared by every user.
+
+    {% coursecache "announcements" course [vary_on ...] %} ... {% endcoursecache %}
+
+    The block is rendered again after any write to the course, its
+    announcements or its enrollments. Only put content in it that is the
+    same for everyone who can see the course.
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f'"{bits[0]}" takes a fragment name and a course')
+    nodelist = parser.parse(('endcoursecache',))
+    parser.delete_first_token()
+    return CourseCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]),
+        [parser.compile_filter(bit) for bit in bits[3:]]
+    )
@@ -1,3 +1,1205 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import zipfile
+from contextlib import closing
+from io import BytesIO, StringIO
+from unittest import mock
+from decimal import Decimal
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.base import SessionBase
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.core.management import call_command
+from django.db import connection, connections
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.wsgi import WSGIHandler
+from django.http import HttpResponse
+from django.test import (
+    AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from openpyxl import Workbook
+from student_portal.db_routing import PIN_COOKIE, ReplicaPinMiddleware, ReplicaRouter
+from student_portal.decorators import read_replica
+from student_portal.performance import PerformanceMiddleware, histogram
+from users.models import User
+from .models import (
+    Announcement, AnnouncementReadMarker, Assignment, Course, CourseStatistic, Enrollment, EnrollmentGradeSummary, Grade,
+    OutboxEmail, WaitlistEntry
+)
+from . import async_views, registration
+from .live import get_hub
+from .outbox import CLAIM_TIMEOUT, RateLimiter, enqueue_announcement, send_pending
+from .roster_sync import RosterSync, sync_enrollments
+from .streams import announcement_stream
+from . import analytics
+from .analytics import refresh_course_statistics, stale_courses
+from .grading import compute_course_grades
+from .read_state import ReadReceipt, compact_course, get_read_flags
 
-# Create your tests here.
+class EnrollmentGradeSummaryTests(TestCase):
+    def setUp(self):
+        self.student = User.objects.create_user(username='student', password='pass', role=User.STUDENT)
+        self.course = Course.objects.create(code='CS101', name='Intro to Computing')
+        self.enrollment = Enrollment.objects.create(student=self.student, course=self.course)
+        self.quiz = Assignment.objects.create(
+            course=self.course, title='Quiz', due_date=timezone.now(),
+            max_score=Decimal('10'), weight=Decimal('1')
+        )
+        self.exam = Assignment.objects.create(
+            course=self.course, title='Exam', due_date=timezone.now(),
+            max_score=Decimal('100'), weight=Decimal('3')
+        )
+
+    def add_grade(self, assignment, score):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Grade.objects.create(enrollment=self.enrollment, assignment=assignment, score=Decimal(score))
+
+    def test_summary_tracks_grade_writes(self):
+        quiz_grade = self.add_grade(self.quiz, '5')
+        self.add_grade(self.exam, '100')
+
+        summary = EnrollmentGradeSummary.objects.get(enrollment=self.enrollment)
+        self.assertEqual(summary.total_score, Decimal('105'))
+        self.assertEqual(summary.total_max, Decimal('110'))
+        self.assertEqual(summary.graded_count, 2)
+        # (1 * 0.5 + 3 * 1.0) / 4
+        self.assertEqual(summary.weighted_percentage, Decimal('87.5'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            quiz_grade.score = Decimal('10')
+            quiz_grade.save()
+        self.assertEqual(self.enrollment.get_current_grade(), Decimal('100.0'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            quiz_grade.delete()
+        summary.refresh_from_db()
+        self.assertEqual(summary.graded_count, 1)
+        self.assertEqual(summary.total_max, Decimal('100'))
+
+    def test_inactive_assignments_do_not_count(self):
+        self.add_grade(self.quiz, '5')
+        self.add_grade(self.exam, '100')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.quiz.is_active = False
+            self.quiz.save()
+
+        summary = EnrollmentGradeSummary.objects.get(enrollment=self.enrollment)
+        self.assertEqual(summary.graded_count, 1)
+        self.assertEqual(summary.total_max, Decimal('100'))
+        self.assertEqual(summary.weighted_percentage, Decimal('100.0'))
+        student = compute_course_grades(self.course).students[0]
+        self.assertEqual(Decimal(str(student.percentage)), summary.weighted_percentage)
+
+    def test_current_grade_without_grades(self):
+        self.assertEqual(self.enrollment.get_current_grade(), 0)
+
+    def test_rebuild_command(self):
+        Grade.objects.bulk_create([
+            Grade(enrollment=self.enrollment, assignment=self.quiz, score=Decimal('8')),
+        ])
+        self.assertFalse(EnrollmentGradeSummary.objects.exists())
+
+        call_command('rebuild_grade_summaries', stdout=StringIO())
+
+        summary = EnrollmentGradeSummary.objects.get(enrollment=self.enrollment)
+        self.assertEqual(summary.weighted_percentage, Decimal('80.0'))
+
+    def test_cascade_deletes_refresh_once_per_transaction(self):
+        students = User.objects.bulk_create([User(username=f'student{index}') for index in range(40)])
+        enrollments = Enrollment.objects.bulk_create([Enrollment(student=student, course=self.course) for student in students])
+        Grade.objects.bulk_create([
+            Grade(enrollment=enrollment, assignment=assignment, score=Decimal('5'))
+            for enrollment in enrollments for assignment in (self.quiz, self.exam)
+        ])
+        EnrollmentGradeSummary.objects.refresh()
+
+        # Two grades per enrollment used to cost a refresh each
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            self.quiz.delete()
+        self.assertLess(len(queries), 25)
+        summary = EnrollmentGradeSummary.objects.get(enrollment=enrollments[0])
+        self.assertEqual(summary.total_max, Decimal('100'))
+
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            self.course.delete()
+        self.assertLess(len(queries), 25)
+        self.assertFalse(Enrollment.objects.exists())
+
+class GradeListQueryCountTests(TestCase):
+    def setUp(self):
+        self.student = User.objects.create_user(username='student', password='pass', role=User.STUDENT)
+        self.client.force_login(self.student)
+
+    def enroll_in_courses(self, count):
+        for index in range(count):
+            course = Course.objects.create(code=f'CS{index:03d}', name=f'Course {index}')
+            enrollment = Enrollment.objects.create(student=self.student, course=course)
+            for number in range(3):
+                assignment = Assignment.objects.create(
+                    course=course, title=f'Assignment {number}', due_date=timezone.now(),
+                    max_score=Decimal('10')
+                )
+                Grade.objects.create(enrollment=enrollment, assignment=assignment, score=Decimal('7'))
+        EnrollmentGradeSummary.objects.refresh()
+
+    def assert_grade_list_queries(self, course_count):
+        self.enroll_in_courses(course_count)
+        # session, user, enrollments with summaries, grades with assignments
+        with self.assertNumQueries(4):
+            response = self.client.get('/courses/grades/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['enrollments']), course_count)
+        self.assertContains(response, 'Assignment 2', count=course_count)
+
+    def test_one_course(self):
+        self.assert_grade_list_queries(1)
+
+    def test_twenty_courses(self):
+        self.assert_grade_list_queries(20)
+
+class AnnouncementReadStateTests(TestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user(username='instructor', password='pass', role=User.INSTRUCTOR)
+        self.student = User.objects.create_user(username='student', password='pass', role=User.STUDENT)
+        self.course = Course.objects.create(code='CS101', name='Intro to Computing', instructor=self.instructor)
+        Enrollment.objects.create(student=self.student, course=self.course)
+        self.announcements = [
+            Announcement.objects.create(course=self.course, instructor=self.instructor, title=f'News {index}', content='Hi')
+            for index in range(10)
+        ]
+        self.client.force_login(self.student)
+
+    def test_list_read_flags_do_not_query_per_row(self):
+        self.announcements[0].read_by.add(self.student)
+        # session, user, announcements with read state
+        with self.assertNumQueries(3):
+            response = self.client.get('/courses/announcements/')
+        flags = {announcement.id: announcement.is_read for announcement in response.context['announcements']}
+        self.assertEqual(sum(flags.values()), 1)
+        self.assertTrue(flags[self.announcements[0].id])
+
+    def test_detail_skips_write_when_already_read(self):
+        url = f'/courses/announcements/{self.announcements[0].id}/'
+        self.client.get(url)
+        self.assertTrue(get_read_flags(self.student, [self.announcements[0].id])[self.announcements[0].id])
+        # session, user, announcement with read state; no receipt insert
+        with self.assertNumQueries(3):
+            self.client.get(url)
+
+    def test_mark_all_read_uses_watermark(self):
+        self.announcements[3].read_by.add(self.student)
+        response = self.client.post('/courses/announcements/mark-all-read/')
+        self.assertRedirects(response, '/courses/announcements/', fetch_redirect_response=False)
+
+        flags = get_read_flags(self.student, [announcement.id for announcement in self.announcements])
+        self.assertTrue(all(flags.values()))
+        self.assertFalse(self.student.read_announcements.exists())
+        self.assertEqual(AnnouncementReadMarker.objects.filter(user=self.student).count(), 1)
+
+    def test_compaction_folds_contiguous_receipts(self):
+        for announcement in self.announcements[:4]:
+            announcement.read_by.add(self.student)
+        self.announcements[6].read_by.add(self.student)
+
+        self.assertEqual(compact_course(self.course.id), 4)
+
+        marker = AnnouncementReadMarker.objects.get(user=self.student, course=self.course)
+        self.assertEqual(marker.read_up_to, self.announcements[3].created_at)
+        flags = get_read_flags(self.student, [announcement.id for announcement in self.announcements])
+        self.assertEqual(
+            [flags[announcement.id] for announcement in self.announcements],
+            [True] * 4 + [False, False, True] + [False] * 3
+        )
+
+    def test_compaction_deletes_in_one_statement_for_all_readers(self):
+        readers = [self.student] + [
+            User.objects.create_user(username=f'reader{index}', password='pass') for index in range(4)
+        ]
+        for reader in readers:
+            for announcement in self.announcements[:3]:
+                announcement.read_by.add(reader)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(compact_course(self.course.id), 15)
+        deletes = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 1)
+        self.assertEqual(AnnouncementReadMarker.objects.filter(course=self.course).count(), 5)
+        self.assertFalse(ReadReceipt.objects.exists())
+
+class HotPathIndexTests(TestCase):
+    """Each query of the hot views must be answered from indexes, not a full table scan."""
+
+    def setUp(self):
+        self.instructor = User.objects.create_user(username='instructor', password='pass', role=User.INSTRUCTOR)
+        self.student = User.objects.create_user(username='student', password='pass', role=User.STUDENT)
+        self.course = Course.objects.create(code='CS101', name='Intro to Computing', instructor=self.instructor)
+        Enrollment.objects.create(student=self.student, course=self.course)
+        assignment = Assignment.objects.create(
+            course=self.course, title='Quiz', due_date=timezone.now(), max_score=Decimal('10')
+        )
+        Grade.objects.create(enrollment=Enrollment.objects.get(), assignment=assignment, score=Decimal('8'))
+        Announcement.objects.create(course=self.course, title='Welcome', content='Hello', instructor=self.instructor)
+
+    def hot_pages(self):
+        detail = f'/courses/{self.course.id}/'
+        return {
+            self.student: ['/dashboard/', '/courses/', detail, '/courses/announcements/', '/courses/grades/'],
+            self.instructor: ['/dashboard/', '/courses/', detail, '/courses/announcements/'],
+        }
+
+    def view_queries(self):
+        """Yield ``(path, sql)`` for every SELECT the hot views run."""
+        for user, paths in self.hot_pages().items():
+            self.client.force_login(user)
+            for path in paths:
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(self.client.get(path).status_code, 200)
+                for query in queries.captured_queries:
+                    if query['sql'].startswith('SELECT'):
+                        yield path, query['sql']
+
+    def explain(self, sql):
+        vendor = connection.vendor
+        with connection.cursor() as cursor:
+            if vendor == 'postgresql':
+                # Tiny test tables always favour a sequential scan; ask whether an index is usable at all
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}')
+            elif vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            else:
+                self.skipTest(f'No EXPLAIN expectations for {vendor}')
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+    def test_hot_view_queries_use_indexes(self):
+        for path, sql in self.view_queries():
+            plan = self.explain(sql)
+            with self.subTest(path=path, sql=sql[:120]):
+                self.assertNotIn('Seq Scan', plan)
+                self.assertNotRegex(plan, r'\bSCAN (TABLE )?\w+(?! USING)\b')
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='pass', role=User.ADMIN)
+        self.client.force_login(self.admin)
+        for index in range(60):
+            Course.objects.create(code=f'CS{index:03d}', name=f'Course {index}')
+
+    def test_walks_catalog_forwards_and_backwards(self):
+        codes = []
+        pages = []
+        response = self.client.get('/courses/?per_page=25')
+        while True:
+            page = response.context['page']
+            pages.append(page)
+            codes.extend(course.code for course in page)
+            if not page.has_next:
+                break
+            response = self.client.get(f'/courses/?after={page.next_cursor}&per_page=25')
+
+        self.assertEqual(codes, [f'CS{index:03d}' for index in range(60)])
+        self.assertEqual([len(page) for page in pages], [25, 25, 10])
+        self.assertFalse(pages[0].has_previous)
+
+        response = self.client.get(f'/courses/?before={pages[2].previous_cursor}&per_page=25')
+        self.assertEqual([course.code for course in response.context['page']], codes[25:50])
+
+    def test_page_size_is_capped(self):
+        response = self.client.get('/courses/?per_page=100000')
+        self.assertEqual(len(response.context['page']), 60)
+        self.assertEqual(response.context['page'].per_page, 100)
+
+    def test_manage_courses_counts_students_in_the_page_query(self):
+        course = Course.objects.get(code='CS000')
+        for index in range(3):
+            student = User.objects.create_user(username=f'student{index}', password='pass')
+            Enrollment.objects.create(student=student, course=course, is_active=index < 2)
+        # Session, user, and the page of courses with their counts
+        with self.assertNumQueries(3):
+            response = self.client.get('/courses/manage/?per_page=100')
+        counts = {course.code: course.student_count for course in response.context['page']}
+        self.assertEqual((counts['CS000'], counts['CS001']), (2, 0))
+
+    def test_invalid_cursor_starts_from_first_page(self):
+        response = self.client.get('/courses/?after=not-a-cursor')
+        self.assertEqual(response.context['page'].object_list[0].code, 'CS000')
+
+class GradeImportTests(TestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user(username='instructor', password='pass', role=User.INSTRUCTOR)
+        self.course = Course.objects.create(code='CS101', name='Intro to Computing', instructor=self.instructor)
+        self.quiz = Assignment.objects.create(
+            course=self.course, title='Quiz 1', due_date=timezone.now(), max_score=Decimal('10')
+        )
+        self.exam = Assignment.objects.create(
+            course=self.course, title='Final Exam', due_date=timezone.now(), max_score=Decimal('100')
+        )
+        self.students = []
+        for index in range(3):
+            student = User.objects.create_user(username=f'student{index}', password='pass', role=User.STUDENT)
+            Enrollment.objects.create(student=student, course=self.course)
+            self.students.append(student)
+
+    def upload(self, content, filename='gradebook.csv'):
+        self.client.force_login(self.instructor)
+        if isinstance(content, str):
+            content = content.encode()
+        gradebook = SimpleUploadedFile(filename, content, content_type='application/octet-stream')
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'/courses/{self.course.id}/grades/import/', {'gradebook': gradebook})
+
+    def test_import_upserts_grades_and_reports_row_errors(self):
+        enrollment = Enrollment.objects.get(student=self.students[0])
+        Grade.objects.create(enrollment=enrollment, assignment=self.quiz, score=Decimal('1'))
+
+        response = self.upload(
+            'username,Quiz 1,Final Exam,Notes\n'
+            'student0,9,88.5,\n'
+            'student1,11,70,\n'
+            'nobody,5,5,\n'
+            'student2,,abc,\n'
+        )
+
+        result = response.context['result']
+        self.assertEqual(result.rows, 4)
+        self.assertEqual(result.grades_written, 3)
+        self.assertEqual(result.ignored_columns, ['Notes'])
+        self.assertEqual([line for line, _ in result.errors], [3, 4, 5])
+        self.assertIn('exceeds the maximum score of 10', result.errors[0][1])
+
+        self.assertEqual(Grade.objects.get(enrollment=enrollment, assignment=self.quiz).score, Decimal('9'))
+        self.assertEqual(Grade.objects.count(), 3)
+        summary = EnrollmentGradeSummary.objects.get(enrollment=enrollment)
+        self.assertEqual(summary.graded_count, 2)
+
+    def test_batches_writes(self):
+        from .grade_import import GradeImporter
+        rows = [(line, {'username': student.username, 'Quiz 1': '5', 'Final Exam': '50'})
+                for line, student in enumerate(self.students, start=2)]
+        importer = GradeImporter(self.course, batch_size=2)
+        # Assignments were preloaded; enrollments load once, then each batch is savepoint, upsert, release
+        with self.assertNumQueries(1 + 3 * 3):
+            result = importer.run(iter(rows))
+        self.assertEqual(result.grades_written, 6)
+
+    def test_unreadable_csv_is_reported_on_the_form(self):
+        oversized_field = 'username,Quiz 1\nstudent0,"' + 'x' * 200_000 + '"\n'
+        for content in ('username,Quiz 1\nstudent0,9\n'.encode('utf-16'), oversized_field):
+            response = self.upload(content)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.context['form'].errors['gradebook'])
+        self.assertFalse(Grade.objects.exists())
+
+    def test_xlsx_gradebook_is_imported(self):
+        workbook = Workbook()
+        workbook.active.append(['username', 'Quiz 1', 'Final Exam'])
+        workbook.active.append(['student0', 9, 88.5])
+        workbook.active.append(['student1', None, 70])
+        output = BytesIO()
+        workbook.save(output)
+
+        result = self.upload(output.getvalue(), 'gradebook.xlsx').context['result']
+        self.assertEqual((result.rows, result.grades_written, result.errors), (2, 3, []))
+        self.assertEqual(
+            Grade.objects.get(enrollment__student=self.students[0], assignment=self.exam).score, Decimal('88.5')
+        )
+
+    def test_unreadable_xlsx_is_reported_on_the_form(self):
+        for content in (b'not a zip archive', self.zip_without_workbook()):
+            response = self.upload(content, 'gradebook.xlsx')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('not a valid XLSX workbook', response.context['form'].errors['gradebook'][0])
+
+    def zip_without_workbook(self):
+        output = BytesIO()
+        with zipfile.ZipFile(output, 'w') as archive:
+            archive.writestr('notes.txt', 'hello')
+        return output.getvalue()
+
+    def test_other_instructors_cannot_import(self):
+        other = User.objects.create_user(username='other', password='pass', role=User.INSTRUCTOR)
+        self.client.force_login(other)
+        response = self.client.get(f'/courses/{self.course.id}/grades/import/')
+        self.assertEqual(response.status_code, 404)
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user(username='instructor', password='pass', role=User.INSTRUCTOR)
+        self.course = Course.objects.create(code='CS101', name='Intro to Computing', instructor=self.instructor)
+        self.quiz = Assignment.objects.create(
+            course=self.course, title='Quiz', due_date=timezone.now(), max_score=Decimal('10')
+        )
+        self.exam = Assignment.objects.create(
+            course=self.course, title='Exam', due_date=timezone.now() + timezone.timedelta(days=1),
+            max_score=Decimal('100')
+        )
+        for index in range(3):
+            student = User.objects.create_user(username=f'student{index}', password='pass', student_id=f'S{index}')
+            enrollment = Enrollment.objects.create(student=student, course=self.course)
+            if index != 1:
+                Grade.objects.create(enrollment=enrollment, assignment=self.exam, score=Decimal(60 + index))
+            Grade.objects.create(enrollment=enrollment, assignment=self.quiz, score=Decimal(index))
+
+    def test_gradebook_pivot_streams_as_csv(self):
+        self.client.force_login(self.instructor)
+        response = self.client.get(f'/courses/{self.course.id}/export/')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, [
+            'username,student_id,first_name,last_name,Quiz,Exam,percentage,letter',
+            'student0,S0,,,0.00,60.00,30.0,F',
+            'student1,S1,,,1.00,,10.0,F',
+            'student2,S2,,,2.00,62.00,41.0,F',
+        ])
+
+    def test_institution_roster_as_jsonl_is_admin_only(self):
+        self.client.force_login(self.instructor)
+        self.assertEqual(self.client.get('/courses/export/?dataset=roster').status_code, 302)
+
+        admin = User.objects.create_user(username='admin', password='pass', role=User.ADMIN)
+        self.client.force_login(admin)
+        response = self.client.get('/courses/export/?dataset=roster&format=jsonl')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([record['username'] for record in records], ['student0', 'student1', 'student2'])
+        self.assertEqual(records[0]['course'], 'CS101')
+
+    def test_command_exports_grade_dump(self):
+        out = StringIO()
+        call_command('export_grades', '--course', 'CS101', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], 'course,username,student_id,assignment,max_score,weight,score,submitted_at')
+        self.assertEqual(len(lines), 1 + 5)
+
+class GradingEngineTests(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(code='CS101', name='Intro to Computing')
+        self.quiz = Assignment.objects.create(
+            course=self.course, title='Quiz', due_date=timezone.now(), max_score=Decimal('10'), weight=Decimal('1')
+        )
+        self.exam = Assignment.objects.create(
+            course=self.course, title='Exam', due_date=timezone.now() + timezone.timedelta(days=1),
+            max_score=Decimal('100'), weight=Decimal('3')
+        )
+        scores = {'ann': ('5', '100'), 'bob': ('10', None), 'cat': (None, None)}
+        for username, (quiz, exam) in scores.items():
+            enrollment = Enrollment.objects.create(
+                student=User.objects.create_user(username=username, password='pass'), course=self.course
+            )
+            for assignment, score in ((self.quiz, quiz), (self.exam, exam)):
+                if score is not None:
+                    Grade.objects.create(enrollment=enrollment, assignment=assignment, score=Decimal(score))
+
+    def test_weighted_course_grades(self):
+        with self.assertNumQueries(3):
+            report = compute_course_grades(self.course)
+
+        students = {student.username: student for student in report.students}
+        self.assertEqual(students['ann'].percentage, 87.5)
+        self.assertEqual(students['ann'].letter, 'B')
+        self.assertEqual(students['ann'].total_score, 105)
+        self.assertEqual(students['bob'].percentage, 100.0)
+        self.assertIsNone(students['cat'].percentage)
+
+        self.assertEqual(report.statistics['count'], 2)
+        self.assertEqual(report.statistics['mean'], 93.8)
+        self.assertEqual(report.statistics['distribution'], {'A': 1, 'B': 1, 'C': 0, 'D': 0, 'F': 0})
+
+    def test_matches_materialized_summary(self):
+        EnrollmentGradeSummary.objects.refresh()
+        report = compute_course_grades(self.course)
+        for student in report.students:
+            summary = EnrollmentGradeSummary.objects.get(enrollment_id=student.enrollment_id)
+            expected = None if summary.weighted_percentage is None else float(summary.weighted_percentage)
+            self.assertEqual(student.percentage, expected)
+
+class CourseAnalyticsTests(TestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user(username='instructor', password='pass', role=User.INSTRUCTOR)
+        self.course = Course.objects.create(code='CS101', name='Intro to Computing', instructor=self.instructor)
+        self.quiz = Assignment.objects.create(
+            course=self.course, title='Quiz', due_date=timezone.now(), max_score=Decimal('10')
+        )
+        self.enrollments = [
+            Enrollment.objects.create(
+                student=User.objects.create_user(username=f'student{index}', password='pass'), course=self.course
+            )
+            for index in range(4)
+        ]
+
+    def test_grade_writes_mark_statistics_stale(self):
+        call_command('refresh_course_statistics', stdout=StringIO())
+        self.assertFalse(stale_courses().exists())
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            for enrollment, score in zip(self.enrollments, ('4', '6', '8')):
+                Grade.objects.create(enrollment=enrollment, assignment=self.quiz, score=Decimal(score))
+        # The request only marks the course; it never scans its grades
+        self.assertFalse(any('FROM "grades"' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(list(stale_courses()), [self.course])
+
+        output = StringIO()
+        call_command('refresh_course_statistics', '--stale', stdout=output)
+        self.assertIn('Refreshed statistics for 1 stale courses', output.getvalue())
+        self.assertFalse(stale_courses().exists())
+
+        course_statistic = CourseStatistic.objects.get(course=self.course, assignment=None)
+        self.assertEqual(course_statistic.student_count, 4)
+        self.assertEqual(course_statistic.graded_count, 3)
+        self.assertEqual(course_statistic.completion_rate, 75.0)
+        self.assertEqual(course_statistic.mean, 60.0)
+        self.assertEqual(course_statistic.median, 60.0)
+        self.assertEqual(course_statistic.percentiles['25'], 50.0)
+        self.assertEqual(course_statistic.histogram, [0, 0, 0, 0, 1, 0, 1, 0, 1, 0])
+        self.assertTrue(CourseStatistic.objects.filter(assignment=self.quiz).exists())
+
+    def test_refresh_upserts_rows(self):
+        refresh_course_statistics(self.course)
+        stale = Assignment.objects.create(course=self.course, title='Old', due_date=timezone.now(), max_score=Decimal('10'))
+        refresh_course_statistics(self.course)
+        stale.delete()
+        Grade.objects.create(enrollment=self.enrollments[0], assignment=self.quiz, score=Decimal('5'))
+        refresh_course_statistics(self.course)
+
+        self.assertEqual(CourseStatistic.objects.filter(course=self.course, assignment=None).count(), 1)
+        self.assertEqual(
+            list(CourseStatistic.objects.filter(course=self.course, assignment__isnull=False).values_list('assignment', flat=True)),
+            [self.quiz.id]
+        )
+        self.assertEqual(CourseStatistic.objects.get(assignment=self.quiz).graded_count, 1)
+
+    def test_concurrent_refresh_creating_the_course_row(self):
+        # Both refreshes found no course row; the other one created it first
+        refresh_course_statistics(self.course)
+        Grade.objects.create(enrollment=self.enrollments[0], assignment=self.quiz, score=Decimal('5'))
+        update = analytics._update_course_row
+        calls = []
+
+        def update_after_losing_the_race(*args):
+            calls.append(args)
+            return 0 if len(calls) == 1 else update(*args)
+
+        with mock.patch.object(analytics, '_update_course_row', update_after_losing_the_race):
+            refresh_course_statistics(self.course)
+        self.assertEqual(len(calls), 2)
+        course_statistic = CourseStatistic.objects.get(course=self.course, assignment=None)
+        self.assertEqual(course_statistic.graded_count, 1)
+
+    def test_write_during_refresh_keeps_course_stale(self):
+        refresh_course_statistics(self.course)
+        compute = analytics.compute_course_grades
+
+        def compute_while_graded(course):
+            report = compute(course)
+            with self.captureOnCommitCallbacks(execute=True):
+                Grade.objects.create(enrollment=self.enrollments[0], assignment=self.quiz, score=Decimal('5'))
+            return report
+
+        with mock.patch.object(analytics, 'compute_course_grades', compute_while_graded):
+            refresh_course_statistics(self.course)
+        self.assertEqual(list(stale_courses()), [self.course])
+
+    def test_page_reads_only_precomputed_rows(self):
+        call_command('refresh_course_statistics', stdout=StringIO())
+        self.client.force_login(self.instructor)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/courses/{self.course.id}/analytics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.context['course_statistic'])
+        self.assertFalse(any('"grades"' in query['sql'] for query in queries.captured_queries))
+
+class RegistrationTests(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(code='CS101', name='Intro to Computing', capacity=1)
+        self.first = User.objects.create_user(username='first', password='pass')
+        self.second = User.objects.create_user(username='second', password='pass')
+        self.third = User.objects.create_user(username='third', password='pass')
+
+    def test_full_course_waitlists_in_order_and_promotes_on_drop(self):
+        self.assertEqual(registration.enroll(self.first, self.course), registration.ENROLLED)
+        self.assertEqual(registration.enroll(self.second, self.course), registration.WAITLISTED)
+        self.assertEqual(registration.enroll(self.third, self.course), registration.WAITLISTED)
+        self.assertEqual(registration.enroll(self.second, self.course), registration.ALREADY_WAITLISTED)
+        self.assertEqual(registration.enroll(self.first, self.course), registration.ALREADY_ENROLLED)
+
+        self.assertTrue(registration.drop(self.first, self.course))
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_taken, 1)
+        self.assertEqual(
+            list(Enrollment.objects.filter(course=self.course, is_active=True).values_list('student__username', flat=True)),
+            ['second']
+        )
+        self.assertEqual(list(WaitlistEntry.objects.values_list('student__username', flat=True)), ['third'])
+
+    def test_raising_capacity_promotes_waitlist(self):
+        registration.enroll(self.first, self.course)
+        registration.enroll(self.second, self.course)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.capacity = 2
+            self.course.save()
+        self.assertTrue(Enrollment.objects.filter(course=self.course, student=self.second, is_active=True).exists())
+        self.assertFalse(WaitlistEntry.objects.exists())
+
+    def test_saving_a_loaded_course_keeps_seats_taken_from_other_requests(self):
+        # An edit form loads the course, then a registration takes a seat
+        edited = Course.objects.get(id=self.course.id)
+        registration.enroll(self.first, self.course)
+        edited.name = 'Introduction to Computing'
+        edited.save()
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.name, self.course.seats_taken), ('Introduction to Computing', 1))
+
+        # And a drop frees it again while another edit is open
+        edited = Course.objects.get(id=self.course.id)
+        registration.drop(self.first, self.course)
+        edited.description = 'Updated'
+        edited.save()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_taken, 0)
+
+    def test_admin_deactivating_an_enrollment_frees_its_seat(self):
+        registration.enroll(self.first, self.course)
+        registration.enroll(self.second, self.course)
+        enrollment = Enrollment.objects.get(student=self.first)
+        admin = User.objects.create_superuser(username='admin', password='pass', email='admin@example.com')
+        self.client.force_login(admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/admin/courses/enrollment/{enrollment.id}/change/', {
+                'student': self.first.id,
+                'course': self.course.id,
+            })
+        self.assertEqual(response.status_code, 302)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_taken, 1)
+        self.assertEqual(
+            list(Enrollment.objects.filter(course=self.course, is_active=True).values_list('student__username', flat=True)),
+            ['second']
+        )
+        self.assertFalse(WaitlistEntry.objects.exists())
+
+    def test_enroll_view_requires_post(self):
+        self.client.force_login(self.first)
+        self.assertEqual(self.client.get(f'/courses/enroll/{self.course.id}/').status_code, 405)
+        response = self.client.post(f'/courses/enroll/{self.course.id}/')
+        self.assertRedirects(response, f'/courses/{self.course.id}/', fetch_redirect_response=False)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_taken, 1)
+
+class ConcurrentRegistrationTests(TransactionTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.memory_database = None
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # Shared-cache in-memory SQLite fails concurrent readers instead of
+            # waiting for the write lock: run on a file copy of the test database
+            handle, cls.database_file = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(handle)
+            connection.ensure_connection()
+            with closing(sqlite3.connect(cls.database_file)) as target:
+                connection.connection.backup(target)
+            # Keep the in-memory database alive for the tests that follow
+            cls.memory_database = (connection.connection, dict(connection.settings_dict))
+            connection.connection = None
+            connection.settings_dict.update(NAME=cls.database_file, OPTIONS={'timeout': 20})
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.memory_database is not None:
+            connections.close_all()
+            raw_connection, settings_dict = cls.memory_database
+            connection.settings_dict.clear()
+            connection.settings_dict.update(settings_dict)
+            connection.connection = raw_connection
+            os.remove(cls.database_file)
+        super().tearDownClass()
+
+    def test_course_is_never_oversubscribed(self):
+        output = StringIO()
+        call_command('loadtest_enrollment', students=200, capacity=20, workers=16, stdout=output)
+        self.assertIn('20 enrolled, 180 waitlisted, 0 failed', output.getvalue())
+
+class RosterSyncTests(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(code='CS101', name='Intro to Computing', capacity=2)
+        self.other = Course.objects.create(code='MA101', name='Calculus')
+        self.students = {
+            name: User.objects.create_user(username=name, password='pass')
+            for name in ('ada', 'bob', 'cy', 'dee')
+        }
+        Enrollment.objects.create(student=self.students['ada'], course=self.course)
+        Enrollment.objects.create(student=self.students['bob'], course=self.course, is_active=False)
+        Enrollment.objects.create(student=self.students['cy'], course=self.course)
+        Enrollment.objects.create(student=self.students['dee'], course=self.other)
+        registration.recount_seats()
+
+    def active(self, course):
+        return set(Enrollment.objects.filter(course=course, is_active=True).values_list('student__username', flat=True))
+
+    def test_sync_diffs_roster_against_enrollments(self):
+        roster = iter([
+            (2, {'course': 'CS101', 'username': 'ada'}),
+            (3, {'course': 'CS101', 'username': 'bob'}),
+            (4, {'course': 'CS101', 'username': 'dee'}),
+            (5, {'course': 'CS101', 'username': 'nobody'}),
+        ])
+        result = sync_enrollments(roster, batch_size=1)
+
+        self.assertEqual((result.created, result.reactivated, result.deactivated, result.unchanged), (1, 1, 0, 1))
+        self.assertEqual(result.errors, [(5, 'No student with username "nobody"')])
+        # The failed row makes CS101 incomplete, so cy keeps the seat
+        self.assertEqual(result.incomplete, {self.course.id})
+        self.assertEqual(self.active(self.course), {'ada', 'bob', 'cy', 'dee'})
+        self.assertEqual(self.active(self.other), {'dee'})
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_taken, 4)
+
+    def test_complete_roster_deactivates_missing_students(self):
+        result = sync_enrollments(iter([(2, {'course': 'CS101', 'username': 'ada'})]))
+        self.assertEqual((result.created, result.deactivated), (0, 1))
+        self.assertEqual(self.active(self.course), {'ada'})
+
+    def test_unresolved_rows_deactivate_nothing(self):
+        # The wrong identifier column: no row names a known student
+        roster = iter([(2, {'course': 'CS101', 'student_id': 'ada'}), (3, {'course': 'MA101', 'student_id': 'dee'})])
+        result = sync_enrollments(roster)
+        self.assertEqual(len(result.errors), 2)
+        self.assertEqual(result.changed, 0)
+        self.assertEqual(self.active(self.course), {'ada', 'cy'})
+        self.assertEqual(self.active(self.other), {'dee'})
+
+    def test_created_counts_only_inserted_enrollments(self):
+        # dee enrolled in MA101 after the roster was diffed
+        sync = RosterSync()
+        self.assertEqual(sync._create([(self.students['dee'].id, self.other.id), (self.students['ada'].id, self.other.id)]), 1)
+
+    def test_authoritative_sync_does_not_promote_the_waitlist(self):
+        waiting = User.objects.create_user(username='eve', password='pass')
+        WaitlistEntry.objects.create(course=self.course, student=waiting)
+        sync_enrollments(iter([(2, {'course': 'CS101', 'username': 'ada'})]))
+        self.assertEqual(self.active(self.course), {'ada'})
+        self.assertTrue(WaitlistEntry.objects.filter(course=self.course, student=waiting).exists())
+
+    def test_command_reports_throughput(self):
+        output = StringIO()
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as roster:
+            roster.write('course,username\nCS101,ada\nCS101,dee\n')
+        self.addCleanup(os.remove, roster.name)
+
+        call_command('sync_enrollments', roster.name, '--no-deactivate', stdout=output)
+        self.assertIn('create: 1/1', output.getvalue())
+        self.assertIn('1 created, 0 reactivated, 0 deactivated', output.getvalue())
+        self.assertEqual(self.active(self.course), {'ada', 'cy', 'dee'})
+
+    def test_admin_action_limits_sync_to_selected_courses(self):
+        admin = User.objects.create_superuser(username='admin', password='pass', email='admin@example.com')
+        self.client.force_login(admin)
+        response = self.client.post('/admin/courses/course/', {
+            'action': 'sync_roster',
+            '_selected_action': [self.course.id],
+            'apply': '1',
+            'deactivate': 'on',
+            'roster': SimpleUploadedFile('roster.csv', b'course,username\nCS101,ada\nMA101,bob\n', content_type='text/csv'),
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.active(self.course), {'ada'})
+        self.assertEqual(self.active(self.other), {'dee'})
+
+@override_settings(COURSE_FRAGMENT_CACHE_TIMEOUT=3600)
+class CourseFragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.instructor = User.objects.create_user(
+            username='instructor', password='pass', role=User.INSTRUCTOR, first_name='Grace', last_name='Hopper'
+        )
+        self.course = Course.objects.create(code='CS101', name='Intro to Computing', instructor=self.instructor)
+        self.students = [User.objects.create_user(username=f'student{index}', password='pass') for index in range(2)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for student in self.students:
+                registration.enroll(student, self.course)
+            Announcement.objects.create(course=self.course, title='Welcome', content='Hello', instructor=self.instructor)
+
+    def get_detail(self, student):
+        self.client.force_login(student)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/courses/{self.course.id}/')
+        return response, [query['sql'] for query in queries.captured_queries]
+
+    def test_fragments_are_shared_across_students(self):
+        response, _ = self.get_detail(self.students[0])
+        self.assertContains(response, 'Welcome')
+        self.assertContains(response, 'Total Students:</strong> 2')
+
+        response, queries = self.get_detail(self.students[1])
+        self.assertContains(response, 'Posted by: Grace Hopper')
+        self.assertFalse(any('"announcements"' in query for query in queries))
+
+    def test_only_the_instructor_sees_the_roster(self):
+        response, _ = self.get_detail(self.instructor)
+        self.assertContains(response, 'Enrolled Students')
+        self.assertContains(response, 'student1')
+        self.assertContains(response, f'/courses/{self.course.id}/grades/import/')
+
+        response, _ = self.get_detail(self.students[0])
+        self.assertNotContains(response, 'Enrolled Students')
+
+    def test_writes_invalidate_course_fragments(self):
+        self.get_detail(self.students[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            Announcement.objects.create(course=self.course, title='Exam moved', content='Friday', instructor=self.instructor)
+            registration.drop(self.students[1], self.course)
+
+        response, _ = self.get_detail(self.students[0])
+        self.assertContains(response, 'Exam moved')
+        self.assertContains(response, 'Total Students:</strong> 1')
+
+    @override_settings(COURSE_FRAGMENT_CACHE_TIMEOUT=0)
+    def test_fragments_are_not_cached_without_a_timeout(self):
+        self.get_detail(self.students[0])
+        _, queries = self.get_detail(self.students[1])
+        self.assertTrue(any('"announcements"' in query for query in queries))
+
+class AnnouncementStreamTests(TestCase):
+    IDLE_STREAMS = 2000
+
+    def setUp(self):
+        self.instructor = User.objects.create_user(username='instructor', password='pass', role=User.INSTRUCTOR)
+        self.course = Course.objects.create(code='CS101', name='Intro to Computing', instructor=self.instructor)
+        self.student = User.objects.create_user(username='student', password='pass')
+        Enrollment.objects.create(student=self.student, course=self.course)
+
+    def stream_request(self, **headers):
+        request = AsyncRequestFactory().get('/courses/announcements/stream/', headers=headers)
+
+        async def auser():
+            return self.student
+        request.auser = auser
+        return request
+
+    async def listen(self, events, **headers):
+        response = await announcement_stream(self.stream_request(**headers))
+        async for chunk in response.streaming_content:
+            if chunk.startswith(b'event:'):
+                events.append(chunk.decode())
+
+    async def wait_for(self, condition, timeout=30):
+        async with asyncio.timeout(timeout):
+            while not condition():
+                await asyncio.sleep(0.01)
+
+    def publish(self, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Announcement.objects.create(course=self.course, title=title, content='...', instructor=self.instructor)
+
+    async def test_idle_streams_all_receive_new_announcement(self):
+        hub = get_hub()
+        events = []
+        listeners = [asyncio.create_task(self.listen(events)) for _ in range(self.IDLE_STREAMS)]
+        try:
+            await self.wait_for(lambda: hub.subscriber_count(self.course.id) == self.IDLE_STREAMS)
+            await sync_to_async(self.publish)('Exam moved')
+            await self.wait_for(lambda: len(events) == self.IDLE_STREAMS)
+        finally:
+            for listener in listeners:
+                listener.cancel()
+            await asyncio.gather(*listeners, return_exceptions=True)
+
+        self.assertTrue(all('"title": "Exam moved"' in event for event in events))
+        self.assertEqual(hub.subscriber_count(), 0)
+
+    async def test_reconnect_replays_missed_announcements(self):
+        seen = await sync_to_async(self.publish)('First')
+        await sync_to_async(self.publish)('Second')
+        events = []
+        listener = asyncio.create_task(self.listen(events, **{'Last-Event-ID': str(seen.id)}))
+        try:
+            await self.wait_for(lambda: events)
+        finally:
+            listener.cancel()
+            await asyncio.gather(listener, return_exceptions=True)
+        self.assertEqual(len(events), 1)
+        self.assertIn('"title": "Second"', events[0])
+
+    def test_stream_requires_login(self):
+        self.assertEqual(self.client.get('/courses/announcements/stream/').status_code, 401)
+
+    def test_wsgi_stream_ends_at_once(self):
+        # A WSGI worker cannot hold the stream open; 204 makes EventSource give up
+        self.client.force_login(self.student)
+        environ = RequestFactory().get(
+            '/courses/announcements/stream/',
+            HTTP_COOKIE=f'sessionid={self.client.cookies["sessionid"].value}',
+            HTTP_HOST='localhost'
+        ).environ
+        statuses = []
+        response = WSGIHandler()(environ, lambda status, headers: statuses.append(status))
+        try:
+            body = b''.join(response)
+        finally:
+            response.close()
+        self.assertEqual(statuses, ['204 No Content'])
+        self.assertEqual(body, b'')
+
+    def test_pages_open_the_stream_only_when_live(self):
+        self.client.force_login(self.student)
+        self.assertNotContains(self.client.get('/courses/'), 'EventSource(')
+        with self.settings(LIVE_ANNOUNCEMENTS=True):
+            self.assertContains(self.client.get('/courses/'), 'EventSource(')
+
+class FlakyEmailBackend(LocmemEmailBackend):
+    """Counts opened connections and rejects mail to ``failing``."""
+    failing = set()
+    opened = 0
+
+    def open(self):
+        FlakyEmailBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        if any(set(message.to) & self.failing for message in messages):
+            raise OSError('Recipient rejected')
+        return super().send_messages(messages)
+
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user(username='instructor', password='pass', role=User.INSTRUCTOR)
+        self.course = Course.objects.create(code='CS101', name='Intro to Computing', instructor=self.instructor)
+        self.students = [
+            User.objects.create_user(username=f'student{i}', password='pass', email=f'student{i}@example.com')
+            for i in range(5)
+        ]
+        opted_out = User.objects.create_user(
+            username='quiet', password='pass', email='quiet@example.com', email_notifications=False
+        )
+        for student in self.students + [opted_out]:
+            Enrollment.objects.create(student=student, course=self.course)
+        FlakyEmailBackend.failing = set()
+        FlakyEmailBackend.opened = 0
+
+    def publish(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Announcement.objects.create(
+                course=self.course, title='Exam moved', content='To Friday.', instructor=self.instructor
+            )
+
+    def test_publishing_queues_emails_without_sending(self):
+        self.publish()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            set(OutboxEmail.objects.values_list('to_email', flat=True)),
+            {student.email for student in self.students}
+        )
+
+    def test_worker_sends_batch_over_one_connection(self):
+        self.publish()
+        connection = mail.get_connection('courses.tests.FlakyEmailBackend')
+        result = send_pending(batch_size=100, connection=connection)
+        self.assertEqual(result.sent, 5)
+        self.assertEqual(FlakyEmailBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].subject, '[CS101] Exam moved')
+        self.assertFalse(OutboxEmail.objects.exclude(status=OutboxEmail.SENT).exists())
+
+        call_command('send_outbox', '--once', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_failed_email_is_retried_then_given_up(self):
+        self.publish()
+        FlakyEmailBackend.failing = {'student0@example.com'}
+        connection = mail.get_connection('courses.tests.FlakyEmailBackend')
+        result = send_pending(connection=connection, max_attempts=2)
+        self.assertEqual((result.sent, result.retried), (4, 1))
+        failing = OutboxEmail.objects.get(to_email='student0@example.com')
+        self.assertEqual((failing.status, failing.attempts), (OutboxEmail.PENDING, 1))
+        self.assertGreater(failing.next_attempt_at, timezone.now())
+
+        OutboxEmail.objects.filter(id=failing.id).update(next_attempt_at=timezone.now())
+        result = send_pending(connection=connection, max_attempts=2)
+        self.assertEqual(result.failed, 1)
+        failing.refresh_from_db()
+        self.assertEqual(failing.status, OutboxEmail.FAILED)
+        self.assertEqual(failing.last_error, 'Recipient rejected')
+
+    def test_enqueue_counts_only_new_rows(self):
+        announcement = self.publish()
+        self.assertEqual(OutboxEmail.objects.count(), 5)
+        self.assertEqual(enqueue_announcement(announcement.id), 0)
+
+    def test_rate_limited_batch_is_claimed_for_as_long_as_it_sends(self):
+        self.publish()
+        started = timezone.now()
+
+        def stop(seconds):
+            # The worker is stopped while it waits for the rate limit
+            raise KeyboardInterrupt
+        limiter = RateLimiter(3, clock=lambda: 0.0, sleep=stop)
+        limiter.wait()
+        connection = mail.get_connection('courses.tests.FlakyEmailBackend')
+        with self.assertRaises(KeyboardInterrupt):
+            send_pending(batch_size=100, rate_limiter=limiter, connection=connection)
+
+        # No more than a minute's worth of rows is claimed, for as long as sending them takes
+        claimed = OutboxEmail.objects.filter(next_attempt_at__gt=started)
+        self.assertEqual(claimed.count(), 3)
+        self.assertGreaterEqual(
+            min(claimed.values_list('next_attempt_at', flat=True)),
+            started + CLAIM_TIMEOUT + timezone.timedelta(minutes=1)
+        )
+        # The rows sent before the stop are not sent again
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.SENT).count(), 2)
+
+    def test_rate_limiter_spaces_sends_over_a_minute(self):
+        now = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+        limiter = RateLimiter(3, clock=lambda: now[0], sleep=sleep)
+        for _ in range(7):
+            limiter.wait()
+            now[0] += 1
+        self.assertEqual(sleeps, [57, 57])
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user(username='instructor', password='pass', role=User.INSTRUCTOR)
+        self.student = User.objects.create_user(username='student', password='pass')
+        self.course = Course.objects.create(code='CS101', name='Intro to Computing', instructor=self.instructor)
+        enrollment = Enrollment.objects.create(student=self.student, course=self.course)
+        quiz = Assignment.objects.create(course=self.course, title='Quiz', due_date=timezone.now(), max_score=Decimal('10'))
+        Grade.objects.create(enrollment=enrollment, assignment=quiz, score=Decimal('7'))
+        Announcement.objects.create(course=self.course, title='Welcome', content='Hello', instructor=self.instructor)
+
+    async def get(self, view, user, *args):
+        request = AsyncRequestFactory().get('/')
+        request.session = SessionBase()
+        request._messages = FallbackStorage(request)
+
+        async def auser():
+            return user
+        request.auser = auser
+        return await view(request, *args)
+
+    async def test_views_render_from_async_queries(self):
+        for view, args, expected in (
+            (async_views.course_list, (), 'Intro to Computing'),
+            (async_views.course_detail, (self.course.id,), 'Welcome'),
+            (async_views.announcement_list, (), 'Welcome'),
+            (async_views.grade_list, (), 'Quiz'),
+        ):
+            response = await self.get(view, self.student, *args)
+            self.assertContains(response, expected)
+
+        response = await self.get(async_views.course_detail, self.instructor, self.course.id)
+        self.assertContains(response, 'Welcome')
+        self.assertContains(response, 'Enrolled Students')
+
+    async def test_anonymous_users_are_sent_to_login(self):
+        response = await self.get(async_views.course_list, AnonymousUser())
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith('/login/'))
+
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        histogram.reset()
+        self.instructor = User.objects.create_user(username='instructor', password='pass', role=User.INSTRUCTOR)
+        self.student = User.objects.create_user(username='student', password='pass')
+        for i in range(12):
+            course = Course.objects.create(code=f'CS{i}', name=f'Course {i}', instructor=self.instructor)
+            Enrollment.objects.create(student=self.student, course=course)
+            Announcement.objects.create(course=course, title=f'News {i}', content='...', instructor=self.instructor)
+
+    def test_announcement_list_is_timed_without_duplicate_queries(self):
+        self.client.login(username='student', password='pass')
+        with self.assertNoLogs('student_portal.performance', level='WARNING'):
+            response = self.client.get('/courses/announcements/')
+        self.assertContains(response, 'News 11')
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+')
+
+    def test_repeated_query_is_flagged(self):
+        def view(request):
+            for course in Course.objects.all():
+                course.get_total_assignments()
+            return HttpResponse()
+
+        with self.assertLogs('student_portal.performance', level='WARNING') as logs:
+            PerformanceMiddleware(view)(RequestFactory().get('/'))
+        event = json.loads(logs.records[0].getMessage())
+        self.assertEqual(event['count'], 12)
+        self.assertIn('"assignments"', event['sql'])
+
+    def test_histogram_is_admin_only(self):
+        self.client.login(username='student', password='pass')
+        self.client.get('/courses/announcements/')
+        self.assertEqual(self.client.get('/admin/performance/').status_code, 302)
+
+        User.objects.create_superuser(username='root', password='pass')
+        self.client.login(username='root', password='pass')
+        rows = self.client.get('/admin/performance/?format=json').json()['views']
+        row = next(row for row in rows if row['url_name'] == 'courses:announcements')
+        self.assertEqual(row['count'], 1)
+        self.assertEqual(sum(row['buckets']), 1)
+        self.assertContains(self.client.get('/admin/performance/'), 'courses:announcements')
+
+class ConnectionBenchmarkTests(TestCase):
+    def test_benchmark_runs_every_connection_mode(self):
+        User.objects.create_user(username='student', password='pass')
+        output = StringIO()
+        call_command('benchmark_connections', '--requests', '3', stdout=output)
+        lines = output.getvalue().splitlines()
+        for mode in ('close per request', 'persistent', 'persistent + checks'):
+            self.assertTrue(any(line.startswith(mode) and line.endswith('HTTP 200') for line in lines), mode)
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], 0)
+
+@override_settings(DATABASE_REPLICAS=['replica_1', 'replica_2'])
+class ReadReplicaRoutingTests(SimpleTestCase):
+    router = ReplicaRouter()
+
+    def route(self, request, write=False):
+        """Run a view through the pin middleware; return where it read and the response."""
+        routed = {}
+
+        @read_replica
+        def view(request):
+            routed['read'] = self.router.db_for_read(Course)
+            if write:
+                routed['write'] = self.router.db_for_write(Enrollment)
+            return HttpResponse()
+        response = ReplicaPinMiddleware(view)(request)
+        return routed, response
+
+    def test_marked_views_read_from_a_replica(self):
+        routed, response = self.route(RequestFactory().get('/courses/'))
+        self.assertIn(routed['read'], ('replica_1', 'replica_2'))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.router.db_for_read(Course), 'default')
+
+    def test_writes_go_to_primary_and_pin_the_user(self):
+        routed, response = self.route(RequestFactory().post('/courses/enroll/1/'), write=True)
+        self.assertEqual(routed['write'], 'default')
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 10)
+
+        request = RequestFactory().get('/courses/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        routed, _ = self.route(request)
+        self.assertEqual(routed['read'], 'default')
+
+    def test_async_views_read_from_a_replica(self):
+        @read_replica
+        async def view(request):
+            return await sync_to_async(self.router.db_for_read)(Course)
+        self.assertIn(asyncio.run(view(None)), ('replica_1', 'replica_2'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_primary(self):
+        routed, response = self.route(RequestFactory().post('/'), write=True)
+        self.assertEqual(routed['read'], 'default')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
@@ -1,17 +1,28 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, streams, views
 
 app_name = 'courses'
 
+# The read-heavy pages have async versions for the ASGI application
+read_views = async_views if settings.ASYNC_READ_VIEWS else views
+
 urlpatterns = [
-    path('', views.course_list, name='course_list'),
-    path('<int:course_id>/', views.course_detail, name='course_detail'),
-    path('announcements/', views.announcement_list, name='announcements'),
+    path('', read_views.course_list, name='course_list'),
+    path('<int:course_id>/', read_views.course_detail, name='course_detail'),
+    path('<int:course_id>/grades/import/', views.import_grades, name='import_grades'),
+    path('<int:course_id>/export/', views.export_course, name='export_course'),
+    path('<int:course_id>/analytics/', views.course_analytics, name='course_analytics'),
+    path('export/', views.export_institution, name='export_institution'),
+    path('announcements/', read_views.announcement_list, name='announcements'),
     path('announcements/create/', views.create_announcement, name='create_announcement'),
     path('announcements/<int:announcement_id>/', views.announcement_detail, name='announcement_detail'),
-    path('grades/', views.grade_list, name='grades'),
+    path('announcements/stream/', streams.announcement_stream, name='announcement_stream'),
+    path('announcements/mark-all-read/', views.mark_all_announcements_read, name='mark_all_announcements_read'),
+    path('grades/', read_views.grade_list, name='grades'),
     path('available/', views.available_courses, name='available_courses'),
     path('enroll/<int:course_id>/', views.enroll_course, name='enroll_course'),
+    path('drop/<int:course_id>/', views.drop_course, name='drop_course'),
     path('manage/', views.manage_courses, name='manage_courses'),
     path('manage/create/', views.create_course, name='create_course'),
     path('manage/<int:course_id>/edit/', views.edit_course, name='edit_course'),
@@ -1,33 +1,51 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth.decorators import login_required, user_passes_test
+from django.http import Http404, StreamingHttpResponse
+from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Avg, Q
-from .models import Course, Enrollment, Grade, Announcement
-from .forms import CourseForm, GradeForm, AnnouncementForm
+from django.db.models import Count, Exists, OuterRef, Q
+from django.views.decorators.http import require_POST
+from .models import Course, CourseStatistic, Enrollment, Grade, Announcement, WaitlistEntry
+from .forms import CourseForm, GradeForm, AnnouncementForm, GradeImportForm
+from .grade_import import GradeImportError, import_gradebook
+from .exports import DATASETS, FORMATS
+from .read_state import mark_all_read, mark_read, with_read_state
+from . import registration
+from student_portal.decorators import read_replica, role_required
+from student_portal.pagination import KeysetPaginator
 from users.models import User
 
-@login_required
-def course_list(request):
-    if request.user.role == 'student':
+catalog_paginator = KeysetPaginator(('code',))
+feed_paginator = KeysetPaginator(('-created_at', '-id'))
+
+def visible_courses(user):
+    """The active courses a user sees in their course list."""
+    if user.role == 'student':
         courses = Course.objects.filter(
-            enrollment__student=request.user,
+            enrollment__student=user,
             enrollment__is_active=True,
             is_active=True
         )
-    elif request.user.role == 'instructor':
-        courses = Course.objects.filter(instructor=request.user, is_active=True)
+    elif user.role == 'instructor':
+        courses = Course.objects.filter(instructor=user, is_active=True)
     else:
         courses = Course.objects.filter(is_active=True)
-    
+    return courses.select_related('instructor')
+
+@login_required
+@read_replica
+def course_list(request):
+    page = catalog_paginator.paginate(visible_courses(request.user), request)
     return render(request, 'courses/course_list.html', {
-        'courses': courses,
+        'courses': page.object_list,
+        'page': page,
         'title': 'Courses',
         'description': 'Browse available courses'
     })
 
 @login_required
+@read_replica
 def course_detail(request, course_id):
-    course = get_object_or_404(Course, id=course_id)
+    course = get_object_or_404(Course.objects.select_related('instructor'), id=course_id)
     
     if request.user.role == 'student':
         enrollment = get_object_or_404(Enrollment, student=request.user, course=course)
@@ -36,13 +54,14 @@ def course_detail(request, course_id):
             'course': course,
             'enrollment': enrollment,
             'grades': grades,
-            'announcements': Announcement.objects.filter(course=course, is_active=True)
+            'announcements': Announcement.objects.filter(course=course, is_active=True).select_related('instructor')
         }
     else:
         context = {
             'course': course,
-            'students': course.students.filter(enrollment__is_active=True),
-            'announcements': Announcement.objects.filter(course=course, is_active=True)
+            'is_instructor': course.instructor_id == request.user.id,
+            'enrolled_students': course.students.filter(enrollment__is_active=True),
+            'announcements': Announcement.objects.filter(course=course, is_active=True).select_related('instructor')
         }
     
     context.update({
@@ -52,7 +71,7 @@ def course_detail(request, course_id):
     
     return render(request, 'courses/course_detail.html', context)
 
-@user_passes_test(lambda u: u.is_admin())
+@role_required(User.ADMIN)
 def create_course(request):
     if request.method == 'POST':
         form = CourseForm(request.POST)
@@ -64,8 +83,7 @@ def create_course(request):
         form = CourseForm()
     return render(request, 'courses/course_form.html', {'form': form, 'action': 'Create'})
 
-@login_required
-@user_passes_test(lambda u: u.is_instructor())
+@role_required(User.INSTRUCTOR)
 def add_grade(request, course_id, student_id):
     course = get_object_or_404(Course, id=course_id)
     student = get_object_or_404(User, id=student_id)
@@ -88,8 +106,98 @@ def add_grade(request, course_id, student_id):
         'student': student
     })
 
-@login_required
-@user_passes_test(lambda u: u.is_instructor())
+@role_required(User.INSTRUCTOR, User.ADMIN)
+def import_grades(request, course_id):
+    courses = Course.objects.all() if request.user.is_admin() else Course.objects.filter(instructor=request.user)
+    course = get_object_or_404(courses, id=course_id)
+    result = None
+    
+    if request.method == 'POST':
+        form = GradeImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            gradebook = form.cleaned_data['gradebook']
+            try:
+                result = import_gradebook(course, gradebook, gradebook.name)
+            except GradeImportError as e:
+                form.add_error('gradebook', str(e))
+            else:
+                if result.has_errors:
+                    messages.warning(request, f'Imported {result.grades_written} grades; {len(result.errors)} problems need attention.')
+                else:
+                    messages.success(request, f'Imported {result.grades_written} grades.')
+    else:
+        form = GradeImportForm()
+    
+    return render(request, 'courses/import_grades.html', {
+        'form': form,
+        'course': course,
+        'result': result,
+        'title': f'Import Grades: {course.code}',
+        'description': 'Upload a gradebook to add or update grades in bulk'
+    })
+
+def _export_response(request, filename, rows_for_dataset, allowed_datasets):
+    dataset = request.GET.get('dataset', allowed_datasets[0])
+    export_format = request.GET.get('format', 'csv')
+    if dataset not in allowed_datasets or export_format not in FORMATS:
+        raise Http404('Unknown export')
+    
+    write_lines, content_type = FORMATS[export_format]
+    response = StreamingHttpResponse(write_lines(rows_for_dataset(DATASETS[dataset])), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}-{dataset}.{export_format}"'
+    return response
+
+@role_required(User.INSTRUCTOR, User.ADMIN)
+def export_course(request, course_id):
+    courses = Course.objects.all() if request.user.is_admin() else Course.objects.filter(instructor=request.user)
+    course = get_object_or_404(courses, id=course_id)
+    return _export_response(
+        request,
+        course.code,
+        lambda rows: rows(course),
+        ('gradebook', 'grades', 'roster')
+    )
+
+@role_required(User.ADMIN)
+def export_institution(request):
+    return _export_response(request, 'institution', lambda rows: rows(), ('grades', 'roster'))
+
+@role_required(User.INSTRUCTOR, User.ADMIN)
+def course_analytics(request, course_id):
+    courses = Course.objects.all() if request.user.is_admin() else Course.objects.filter(instructor=request.user)
+    course = get_object_or_404(courses, id=course_id)
+    
+    # Rendered from precomputed rows only; never scans the grades table
+    course_statistic = None
+    assignment_statistics = []
+    for statistic in CourseStatistic.objects.filter(course=course).select_related('assignment').order_by(
+        'assignment__due_date', 'assignment_id'
+    ):
+        if statistic.assignment_id is None:
+            course_statistic = statistic
+        else:
+            assignment_statistics.append(statistic)
+    
+    histogram_bars = []
+    if course_statistic:
+        tallest = max(course_statistic.histogram, default=0) or 1
+        for band, count in enumerate(course_statistic.histogram):
+            histogram_bars.append({
+                'label': f'{band * 10}-{band * 10 + 10}%',
+                'count': count,
+                'height': round(count / tallest * 100)
+            })
+    
+    return render(request, 'courses/course_analytics.html', {
+        'course': course,
+        'course_statistic': course_statistic,
+        'histogram_bars': histogram_bars,
+        'assignment_statistics': assignment_statistics,
+        'title': f'Analytics: {course.code}',
+        'description': 'Class performance at a glance'
+    })
+
+@role_required(User.INSTRUCTOR)
 def create_announcement(request):
     if request.method == 'POST':
         form = AnnouncementForm(request.POST)
@@ -109,38 +217,44 @@ def create_announcement(request):
         'description': 'Create a new announcement for your course'
     })
 
-@login_required
-def announcement_list(request):
-    if request.user.role == 'student':
-        announcements = Announcement.objects.filter(
-            course__enrollment__student=request.user,
+def visible_announcements(user):
+    """The active announcements a user sees in their feed, with read state for students."""
+    if user.role == 'student':
+        announcements = with_read_state(Announcement.objects.filter(
+            course__enrollment__student=user,
             course__enrollment__is_active=True,
             is_active=True
-        )
-        # Add read status for each announcement
-        for announcement in announcements:
-            announcement.is_read = announcement.read_by.filter(id=request.user.id).exists()
-    elif request.user.role == 'instructor':
+        ), user)
+    elif user.role == 'instructor':
         announcements = Announcement.objects.filter(
-            course__instructor=request.user,
+            course__instructor=user,
             is_active=True
         )
     else:
         announcements = Announcement.objects.filter(is_active=True)
-    
+    return announcements.select_related('course', 'instructor')
+
+@login_required
+@read_replica
+def announcement_list(request):
+    page = feed_paginator.paginate(visible_announcements(request.user), request)
     return render(request, 'courses/announcement_list.html', {
-        'announcements': announcements,
+        'announcements': page.object_list,
+        'page': page,
         'title': 'Announcements',
         'description': 'View all announcements'
     })
 
 @login_required
 def announcement_detail(request, announcement_id):
-    announcement = get_object_or_404(Announcement, id=announcement_id)
+    announcements = Announcement.objects.select_related('course', 'instructor')
+    if request.user.role == 'student':
+        announcements = with_read_state(announcements, request.user)
+    announcement = get_object_or_404(announcements, id=announcement_id)
     
     # Mark announcement as read for the current user
     if request.user.role == 'student':
-        announcement.read_by.add(request.user)
+        mark_read(request.user, announcement)
     
     return render(request, 'courses/announcement_detail.html', {
         'announcement': announcement,
@@ -149,53 +263,87 @@ def announcement_detail(request, announcement_id):
     })
 
 @login_required
+@require_POST
+def mark_all_announcements_read(request):
+    if request.user.role == 'student':
+        mark_all_read(request.user)
+        messages.success(request, 'All announcements marked as read.')
+    return redirect('courses:announcements')
+
+@login_required
+@read_replica
 def grade_list(request):
     if request.user.role != 'student':
         messages.error(request, 'Only students can view grades.')
         return redirect('dashboard')
     
-    enrollments = Enrollment.objects.filter(student=request.user, is_active=True)
-    grades = Grade.objects.filter(enrollment__in=enrollments)
+    enrollments, grades = grade_list_querysets(request.user)
+    return render(request, 'courses/grade_list.html', grade_list_context(list(enrollments), grades))
+
+def grade_list_querysets(user):
+    """The student's active enrollments and every grade in them: two queries."""
+    enrollments = Enrollment.objects.filter(
+        student=user,
+        is_active=True
+    ).select_related('course', 'grade_summary').order_by('course__code')
+    grades = Grade.objects.filter(
+        enrollment__student=user,
+        enrollment__is_active=True
+    ).select_related('assignment').order_by('assignment__due_date', 'id')
+    return enrollments, grades
+
+def grade_list_context(enrollments, grades):
+    # Grades are grouped in Python
+    grades_by_enrollment = {enrollment.id: [] for enrollment in enrollments}
+    for grade in grades:
+        grades_by_enrollment[grade.enrollment_id].append(grade)
     
-    # Calculate course averages
+    # Course averages come from the materialized per-enrollment summaries
     course_averages = {}
     for enrollment in enrollments:
-        course_grades = grades.filter(enrollment=enrollment)
-        if course_grades.exists():
-            avg = course_grades.annotate(
-                percentage=(models.F('score') * 100.0 / models.F('max_score'))
-            ).aggregate(avg=Avg('percentage'))['avg']
-            course_averages[enrollment.course.id] = round(avg, 1) if avg else None
+        enrollment.course_grades = grades_by_enrollment[enrollment.id]
+        summary = getattr(enrollment, 'grade_summary', None)
+        if summary and summary.graded_count:
+            course_averages[enrollment.course.id] = summary.weighted_percentage
     
-    return render(request, 'courses/grade_list.html', {
+    return {
         'enrollments': enrollments,
-        'grades': grades,
         'course_averages': course_averages,
         'title': 'Grades',
         'description': 'View your academic performance'
-    })
+    }
 
-@login_required
-@user_passes_test(lambda u: u.is_student())
+@role_required(User.STUDENT)
+@require_POST
 def enroll_course(request, course_id):
     course = get_object_or_404(Course, id=course_id)
-    
-    # Check if already enrolled
-    if Enrollment.objects.filter(student=request.user, course=course).exists():
+    status = registration.enroll(request.user, course)
+
+    if status == registration.ENROLLED:
+        messages.success(request, f'Successfully enrolled in {course.code}.')
+        return redirect('courses:course_detail', course_id=course.id)
+    if status == registration.ALREADY_ENROLLED:
         messages.warning(request, f'You are already enrolled in {course.code}.')
-        return redirect('courses:course_list')
-    
-    # Create enrollment
-    Enrollment.objects.create(
-        student=request.user,
-        course=course,
-        is_active=True
-    )
-    
-    messages.success(request, f'Successfully enrolled in {course.code}.')
-    return redirect('courses:course_detail', course_id=course.id)
+    elif status == registration.WAITLISTED:
+        messages.info(request, f'{course.code} is full. You have been added to its waitlist.')
+    elif status == registration.ALREADY_WAITLISTED:
+        messages.info(request, f'You are already on the waitlist for {course.code}.')
+    else:
+        messages.error(request, f'{course.code} is not open for enrollment.')
+    return redirect('courses:available_courses')
+
+@role_required(User.STUDENT)
+@require_POST
+def drop_course(request, course_id):
+    course = get_object_or_404(Course, id=course_id)
+    if registration.drop(request.user, course):
+        messages.success(request, f'You have left {course.code}.')
+    else:
+        messages.warning(request, f'You are not enrolled in {course.code}.')
+    return redirect('courses:course_list')
 
 @login_required
+@read_replica
 def available_courses(request):
     if request.user.role != 'student':
         messages.error(request, 'Only students can view available courses.')
@@ -210,26 +358,33 @@ def available_courses(request):
         is_active=True
     ).exclude(
         id__in=enrolled_courses.values_list('id', flat=True)
+    ).annotate(
+        is_waitlisted=Exists(WaitlistEntry.objects.filter(course=OuterRef('pk'), student=request.user))
     )
     
+    page = catalog_paginator.paginate(available_courses.select_related('instructor'), request)
     return render(request, 'courses/available_courses.html', {
-        'courses': available_courses,
+        'courses': page.object_list,
+        'page': page,
         'title': 'Available Courses',
         'description': 'Browse and enroll in available courses'
     })
 
-@login_required
-@user_passes_test(lambda u: u.is_admin)
+@role_required(User.ADMIN)
 def manage_courses(request):
-    courses = Course.objects.all().order_by('-created_at')
+    # Counted from the enrollments in the page query, not one COUNT per row
+    courses = Course.objects.select_related('instructor').annotate(
+        student_count=Count('enrollment', filter=Q(enrollment__is_active=True))
+    )
+    page = feed_paginator.paginate(courses, request)
     return render(request, 'courses/manage_courses.html', {
-        'courses': courses,
+        'courses': page.object_list,
+        'page': page,
         'title': 'Manage Courses',
         'description': 'Add, edit, or delete courses'
     })
 
-@login_required
-@user_passes_test(lambda u: u.is_admin)
+@role_required(User.ADMIN)
 def edit_course(request, course_id):
     course = get_object_or_404(Course, id=course_id)
     if request.method == 'POST':
@@ -249,8 +404,7 @@ def edit_course(request, course_id):
         'action': 'Update'
     })
 
-@login_required
-@user_passes_test(lambda u: u.is_admin)
+@role_required(User.ADMIN)
 def delete_course(request, course_id):
     course = get_object_or_404(Course, id=course_id)
     if request.method == 'POST':
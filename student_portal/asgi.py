@@ -12,5 +12,10 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'student_portal.settings')
+# Async requests each get their own connection, so a persistent one would
+# outlive its request unused; pool with DB_POOL=True instead
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+# Streams are coroutines here, not worker threads
+os.environ.setdefault('LIVE_ANNOUNCEMENTS', 'True')
 
 application = get_asgi_application()
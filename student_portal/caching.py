@@ -0,0 +1,92 @@
+"""Full-page caching for pages anonymous visitors see.
+
+``cache_anonymous_page`` serves a view's rendered response to every
+anonymous visitor from the cache. Signed-in users, requests with pending
+flash messages and responses that set cookies or embed a CSRF token are
+always rendered fresh and never stored. Every response gets an ETag and
+Last-Modified, so a repeat visitor revalidating with If-None-Match or
+If-Modified-Since gets a 304, and ``Vary: Cookie`` so a page cached for an
+anonymous visitor is never reused once they sign in.
+
+Pages are cached by path and only the query parameters a view declares in
+``query_params``: the others do not change the page, and keying on them
+would let any ``?x=<random>`` fill the cache and bypass it.
+"""
+import hashlib
+import time
+from functools import wraps
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers, set_response_etag
+)
+from django.utils.http import http_date, parse_http_date_safe
+
+def page_cache_key(request, query_params=()):
+    params = [(name, value) for name in sorted(query_params) for value in request.GET.getlist(name)]
+    page = hashlib.md5(repr((request.path, params)).encode()).hexdigest()
+    return f'anonymous-page:{page}'
+
+def _shareable_request(request):
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        and not len(get_messages(request))
+    )
+
+def _shareable_response(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    )
+
+def _render(view, request, args, kwargs, **cache_control):
+    response = view(request, *args, **kwargs)
+    if hasattr(response, 'render'):
+        response.render()
+    patch_vary_headers(response, ('Cookie',))
+    if response.status_code == 200 and not response.streaming:
+        patch_cache_control(response, no_cache=True, **cache_control)
+        if not response.has_header('ETag'):
+            set_response_etag(response)
+        if not response.has_header('Last-Modified'):
+            response['Last-Modified'] = http_date(time.time())
+    return response
+
+def _conditional(request, response):
+    """Turn ``response`` into a 304 when the client already has it."""
+    if response.status_code != 200 or response.streaming:
+        return response
+    return get_conditional_response(
+        request,
+        etag=response.get('ETag'),
+        last_modified=parse_http_date_safe(response.get('Last-Modified', '')),
+        response=response,
+    )
+
+def cache_anonymous_page(view=None, timeout=None, query_params=()):
+    """Decorate a view that renders the same page for every anonymous visitor.
+
+    ``query_params`` names the query parameters the page depends on.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if not _shareable_request(request):
+                return _conditional(request, _render(view, request, args, kwargs, private=True))
+
+            key = page_cache_key(request, query_params)
+            response = cache.get(key)
+            if response is None:
+                response = _render(view, request, args, kwargs)
+                if _shareable_response(request, response):
+                    cache.set(key, response, settings.ANONYMOUS_PAGE_CACHE_TIMEOUT if timeout is None else timeout)
+            return _conditional(request, response)
+        return wrapped
+
+    if view is not None:
+        return decorator(view)
+    return decorator
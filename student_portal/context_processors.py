@@ -0,0 +1,4 @@
+from django.conf import settings
+
+def live_announcements(request):
+    return {'live_announcements': settings.LIVE_ANNOUNCEMENTS}
@@ -0,0 +1,114 @@
+"""Read-replica routing.
+
+``ReplicaRouter`` sends every write to ``default``. Reads go to one of the
+``DATABASE_REPLICAS`` aliases only inside ``use_replica()``, which the
+``read_replica`` view decorator enters for the read-only pages; everything
+else reads from the primary too, so a view that reads what it is about to
+write never sees a lagging copy.
+
+Replicas lag behind the primary, so a user who just wrote something would
+not see it on the next page. ``ReplicaPinMiddleware`` notices requests that
+wrote to the primary and sets a cookie that keeps the user's reads on the
+primary for ``REPLICA_PIN_SECONDS``.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'read_primary'
+
+_reads_from_replica = ContextVar('reads_from_replica', default=False)
+_request_state = ContextVar('replica_request_state', default=None)
+
+class RequestState:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+@contextmanager
+def use_replica():
+    """Let reads in this block go to a replica, unless the request is pinned to the primary."""
+    token = _reads_from_replica.set(True)
+    try:
+        yield
+    finally:
+        _reads_from_replica.reset(token)
+
+def reading_from_replica():
+    """Whether reads made here go to a replica."""
+    if not getattr(settings, 'DATABASE_REPLICAS', ()) or not _reads_from_replica.get():
+        return False
+    state = _request_state.get()
+    if state is not None and state.pinned:
+        return False
+    # Reads inside a transaction must see its writes
+    return not connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if reading_from_replica():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+class ReplicaPinMiddleware:
+    """Keep a user's reads on the primary for a while after they wrote to it.
+
+    Placed before the session middleware, so a write made while saving the
+    session counts too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = RequestState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.pin(state, response)
+
+    async def __acall__(self, request):
+        state = RequestState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.pin(state, response)
+
+    def pin(self, state, response):
+        if state.wrote and getattr(settings, 'DATABASE_REPLICAS', ()):
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+                secure=settings.SESSION_COOKIE_SECURE
+            )
+        return response
@@ -0,0 +1,67 @@
+"""View decorators.
+
+Django 5.0's ``login_required`` only wraps sync views; ``async_login_required``
+awaits ``request.auser()`` instead, so an async view never leaves the event
+loop to find out who is signed in.
+
+``role_required`` lets only signed-in users with one of the given roles
+into a view and records the roles on it as ``required_roles``; the role is
+read from ``request.user``, which ``users.middleware`` loads from a cached
+snapshot, so the check costs no query on a cache hit.
+
+``read_replica`` marks a read-only view whose queries may go to a replica
+(see ``student_portal.db_routing``); it wraps sync and async views alike.
+"""
+from functools import wraps
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from .db_routing import use_replica
+
+def async_login_required(view):
+    @wraps(view)
+    async def wrapped(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), settings.LOGIN_URL)
+        # Resolved here so the view and the templates read it without a query
+        request.user = user
+        return await view(request, *args, **kwargs)
+    return wrapped
+
+def role_required(*roles):
+    """Like ``user_passes_test(lambda u: u.role in roles)``: anyone else goes to the login page."""
+    def allowed(user):
+        return user.is_authenticated and user.role in roles
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapped(request, *args, **kwargs):
+                user = await request.auser()
+                if not allowed(user):
+                    return redirect_to_login(request.get_full_path(), settings.LOGIN_URL)
+                request.user = user
+                return await view(request, *args, **kwargs)
+        else:
+            @wraps(view)
+            def wrapped(request, *args, **kwargs):
+                if not allowed(request.user):
+                    return redirect_to_login(request.get_full_path(), settings.LOGIN_URL)
+                return view(request, *args, **kwargs)
+        wrapped.required_roles = roles
+        return wrapped
+    return decorator
+
+def read_replica(view):
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            with use_replica():
+                return await view(request, *args, **kwargs)
+    else:
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            with use_replica():
+                return view(request, *args, **kwargs)
+    return wrapped
@@ -0,0 +1,139 @@
+"""Keyset (cursor) pagination shared by the portal's list views.
+
+Pages are found by seeking past the last row of the previous page on the
+ordering columns rather than with OFFSET, so the cost of a page does not grow
+with how deep into the list it is. Cursors are opaque, URL-safe tokens
+holding the ordering values of the row they point at.
+"""
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+DEFAULT_PER_PAGE = 25
+MAX_PER_PAGE = 100
+
+class InvalidCursor(Exception):
+    pass
+
+class KeysetPage:
+    def __init__(self, object_list, per_page, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+class KeysetPaginator:
+    """Paginate a queryset on a unique ordering such as ``('-created_at', '-id')`` or ``('code',)``."""
+
+    def __init__(self, ordering, per_page=DEFAULT_PER_PAGE, max_per_page=MAX_PER_PAGE):
+        self.ordering = tuple(ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        self.per_page = per_page
+        self.max_per_page = max_per_page
+
+    def get_per_page(self, request):
+        try:
+            per_page = int(request.GET.get('per_page', self.per_page))
+        except ValueError:
+            per_page = self.per_page
+        return max(1, min(per_page, self.max_per_page))
+
+    def encode_cursor(self, obj, queryset):
+        values = []
+        for name in self.fields:
+            field = queryset.model._meta.get_field(name)
+            values.append(field.value_to_string(obj))
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, token, queryset):
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            raw_values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if len(raw_values) != len(self.fields):
+                raise InvalidCursor(token)
+            return [
+                queryset.model._meta.get_field(name).to_python(value)
+                for name, value in zip(self.fields, raw_values)
+            ]
+        except (ValueError, TypeError, ValidationError) as e:
+            raise InvalidCursor(token) from e
+
+    def _seek(self, values, reverse):
+        """Build the row-value comparison ``(a, b) > (x, y)`` as nested Q objects."""
+        condition = Q()
+        for position in range(len(self.ordering) - 1, -1, -1):
+            descending = self.ordering[position].startswith('-')
+            lookup = 'lt' if descending != reverse else 'gt'
+            name = self.fields[position]
+            step = Q(**{f'{name}__{lookup}': values[position]})
+            if position < len(self.ordering) - 1:
+                step |= Q(**{name: values[position]}) & condition
+            condition = step
+        return condition
+
+    def page_queryset(self, queryset, request):
+        """Return ``(queryset, per_page, backwards, has_cursor)`` for the requested page.
+
+        The queryset fetches one row more than a page so that the presence of
+        a following page is known without a COUNT.
+        """
+        per_page = self.get_per_page(request)
+        after = request.GET.get('after')
+        before = request.GET.get('before')
+        backwards = bool(before) and not after
+        token = before if backwards else after
+
+        has_cursor = False
+        if token:
+            try:
+                values = self.decode_cursor(token, queryset)
+            except InvalidCursor:
+                backwards = False
+            else:
+                queryset = queryset.filter(self._seek(values, backwards))
+                has_cursor = True
+
+        ordering = self.ordering
+        if backwards:
+            ordering = tuple(name[1:] if name.startswith('-') else f'-{name}' for name in ordering)
+        return queryset.order_by(*ordering)[:per_page + 1], per_page, backwards, has_cursor
+
+    def build_page(self, rows, queryset, per_page, backwards, has_cursor):
+        """Turn the rows fetched for ``page_queryset`` into a ``KeysetPage``."""
+        rows = list(rows)
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        if backwards:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or backwards:
+                next_cursor = self.encode_cursor(rows[-1], queryset)
+            if (has_more and backwards) or (has_cursor and not backwards):
+                previous_cursor = self.encode_cursor(rows[0], queryset)
+        return KeysetPage(rows, per_page, next_cursor, previous_cursor)
+
+    def paginate(self, queryset, request):
+        page_queryset, per_page, backwards, has_cursor = self.page_queryset(queryset, request)
+        return self.build_page(page_queryset, queryset, per_page, backwards, has_cursor)
+
+    async def apaginate(self, queryset, request):
+        page_queryset, per_page, backwards, has_cursor = self.page_queryset(queryset, request)
+        rows = [row async for row in page_queryset]
+        return self.build_page(rows, queryset, per_page, backwards, has_cursor)
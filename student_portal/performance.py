@@ -0,0 +1,275 @@
+"""Per-request performance instrumentation.
+
+``PerformanceMiddleware`` measures every request: wall time, the number and
+duration of database queries (through ``execute_wrapper`` on every
+connection) and template render time (through ``TimedDjangoTemplates``, the
+template backend in ``TEMPLATES``). It reports them in a ``Server-Timing``
+header and one JSON log line on the ``student_portal.performance`` logger,
+and adds them to a per-URL-name histogram shown at ``/admin/performance/``,
+which covers all worker processes only when the cache is shared.
+
+A request that runs the same SQL ``PERFORMANCE_DUPLICATE_QUERY_THRESHOLD``
+times or more (the N+1 pattern of a query inside a template loop) is
+flagged with a warning that names the view and the repeated statement.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in milliseconds; the last bucket catches the rest
+BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+FIELDS = ('count', 'total_ms', 'queries', 'db_ms', 'template_ms', 'duplicates')
+NAMES_KEY = 'performance:names'
+
+_IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+
+_current = ContextVar('request_metrics', default=None)
+
+def fingerprint(sql):
+    """SQL with the length of IN lists erased, so lookups of different batches compare equal."""
+    return _IN_LIST.sub('(...)', sql)
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[fingerprint(sql)] += 1
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def duplicates(self, threshold):
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        # Templates rendered from inside another render are already timed
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - started
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing every render for ``PerformanceMiddleware``."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+class Histogram:
+    """Request timings per URL name, buffered per process and flushed to the cache.
+
+    Counters are kept in the cache with ``incr``. With a shared cache
+    (``CACHE_BACKEND`` ``file`` or ``redis``) every worker process adds to
+    the same totals; with the default per-process ``locmem`` cache,
+    ``/admin/performance/`` only shows the requests of the process that
+    serves it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flushed_at = time.monotonic()
+
+    def record(self, url_name, elapsed_ms, queries, db_ms, template_ms, duplicates):
+        with self._lock:
+            row = self._pending.setdefault(url_name, Counter())
+            row.update({
+                'count': 1,
+                'total_ms': round(elapsed_ms),
+                'queries': queries,
+                'db_ms': round(db_ms),
+                'template_ms': round(template_ms),
+                'duplicates': int(bool(duplicates)),
+                f'bucket:{bucket_index(elapsed_ms)}': 1,
+            })
+            due = time.monotonic() - self._flushed_at >= getattr(settings, 'PERFORMANCE_FLUSH_SECONDS', 10)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        names = cache.get(NAMES_KEY, set())
+        if not set(pending) <= names:
+            cache.set(NAMES_KEY, names | set(pending), None)
+        for url_name, row in pending.items():
+            for field, value in row.items():
+                if not value:
+                    continue
+                key = f'performance:{url_name}:{field}'
+                cache.add(key, 0, None)
+                cache.incr(key, value)
+
+    def report(self):
+        """Flushed totals: ``[{url_name, count, mean_ms, p50_ms, ..., buckets}]``, slowest first."""
+        self.flush()
+        rows = []
+        for url_name in sorted(cache.get(NAMES_KEY, set())):
+            keys = [f'performance:{url_name}:{field}' for field in FIELDS]
+            keys += [f'performance:{url_name}:bucket:{index}' for index in range(len(BUCKETS) + 1)]
+            values = cache.get_many(keys)
+            totals = {field: values.get(f'performance:{url_name}:{field}', 0) for field in FIELDS}
+            if not totals['count']:
+                continue
+            buckets = [values.get(f'performance:{url_name}:bucket:{index}', 0) for index in range(len(BUCKETS) + 1)]
+            count = totals['count']
+            rows.append({
+                'url_name': url_name,
+                'count': count,
+                'mean_ms': totals['total_ms'] / count,
+                'p50_ms': bucket_percentile(buckets, 50),
+                'p95_ms': bucket_percentile(buckets, 95),
+                'p99_ms': bucket_percentile(buckets, 99),
+                'queries': totals['queries'] / count,
+                'db_ms': totals['db_ms'] / count,
+                'template_ms': totals['template_ms'] / count,
+                'duplicate_requests': totals['duplicates'],
+                'buckets': buckets,
+            })
+        return sorted(rows, key=lambda row: row['mean_ms'] * row['count'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._pending = {}
+        names = cache.get(NAMES_KEY, set())
+        cache.delete_many([
+            f'performance:{url_name}:{field}'
+            for url_name in names
+            for field in FIELDS + tuple(f'bucket:{index}' for index in range(len(BUCKETS) + 1))
+        ] + [NAMES_KEY])
+
+def bucket_index(elapsed_ms):
+    for index, bound in enumerate(BUCKETS):
+        if elapsed_ms <= bound:
+            return index
+    return len(BUCKETS)
+
+def bucket_percentile(buckets, percent):
+    """Upper bound of the bucket holding the percentile; ``None`` past the last bound."""
+    target = sum(buckets) * percent / 100
+    seen = 0
+    for index, count in enumerate(buckets):
+        seen += count
+        if count and seen >= target:
+            return BUCKETS[index] if index < len(BUCKETS) else None
+    return None
+
+histogram = Histogram()
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with self._wrap_connections(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        # Connections belong to threads: the async ORM runs its queries on
+        # the request's sync thread, so the wrappers are installed there
+        wrappers = await sync_to_async(self._wrap_connections)(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(wrappers.close)()
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def _wrap_connections(self, metrics):
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(metrics))
+        return stack
+
+    def finish(self, request, response, metrics):
+        # A stream's duration is how long the client stayed, not how slow we were
+        if response.streaming:
+            return response
+
+        elapsed_ms = metrics.elapsed * 1000
+        db_ms = metrics.db_time * 1000
+        template_ms = metrics.template_time * 1000
+        match = getattr(request, 'resolver_match', None)
+        url_name = (match.view_name if match else None) or 'unresolved'
+        duplicates = metrics.duplicates(getattr(settings, 'PERFORMANCE_DUPLICATE_QUERY_THRESHOLD', 5))
+
+        response['Server-Timing'] = (
+            f'db;dur={db_ms:.1f};desc="{metrics.queries} queries", '
+            f'tpl;dur={template_ms:.1f}, total;dur={elapsed_ms:.1f}'
+        )
+        logger.info(json.dumps({
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'url_name': url_name,
+            'status': response.status_code,
+            'duration_ms': round(elapsed_ms, 1),
+            'queries': metrics.queries,
+            'db_ms': round(db_ms, 1),
+            'template_ms': round(template_ms, 1),
+            'duplicate_queries': len(duplicates),
+        }))
+        for sql, count in duplicates:
+            logger.warning(json.dumps({
+                'event': 'duplicate_queries',
+                'url_name': url_name,
+                'path': request.path,
+                'count': count,
+                'sql': sql,
+            }))
+        histogram.record(url_name, elapsed_ms, metrics.queries, db_ms, template_ms, duplicates)
+        return response
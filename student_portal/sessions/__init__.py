@@ -0,0 +1,20 @@
+"""Session engines for ``SESSION_ENGINE``.
+
+``student_portal.sessions.db`` and ``student_portal.sessions.cached_db`` are
+Django's database and cached database engines with a lazy ``cycle_key``:
+Django's inserts the session under its new key at once and then updates it
+when the response saves what login added, so every login wrote the session
+twice. Here the new key is only created when the response saves the
+session, in one insert.
+"""
+
+class LazyCycleKeyMixin:
+    def cycle_key(self):
+        data = self._session
+        key = self.session_key
+        # save() creates a session under a new key when there is none
+        self._session_key = None
+        self._session_cache = data
+        self.modified = True
+        if key:
+            self.delete(key)
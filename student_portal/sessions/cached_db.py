@@ -0,0 +1,5 @@
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from . import LazyCycleKeyMixin
+
+class SessionStore(LazyCycleKeyMixin, CachedDBStore):
+    pass
@@ -0,0 +1,5 @@
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from . import LazyCycleKeyMixin
+
+class SessionStore(LazyCycleKeyMixin, DBStore):
+    pass
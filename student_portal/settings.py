@@ -3,7 +3,10 @@ Django settings for student_portal project.
 """
 
 from pathlib import Path
+import hashlib
+import importlib.util
 import os
+import django
 from django.contrib.messages import constants as messages
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -64,10 +67,12 @@ INSTALLED_APPS = [
 # Conditionally add SecurityMiddleware only in production
 MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'student_portal.performance.PerformanceMiddleware',
+    'student_portal.db_routing.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -79,7 +84,8 @@ ROOT_URLCONF = 'student_portal.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for PerformanceMiddleware
+        'BACKEND': 'student_portal.performance.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -88,6 +94,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'student_portal.context_processors.live_announcements',
             ],
         },
     },
@@ -97,6 +104,23 @@ WSGI_APPLICATION = 'student_portal.wsgi.application'
 
 # Database
 # Use PostgreSQL in production, SQLite in development
+#
+# Connections: the web process keeps each connection for DB_CONN_MAX_AGE
+# seconds (0 closes it after every request, "None" keeps it forever) and
+# checks it before reuse when DB_CONN_HEALTH_CHECKS is on. Processes started
+# with DB_PROCESS_ROLE=command (workers and cron jobs, set by the process
+# manager) use DB_COMMAND_CONN_MAX_AGE instead; long-running ones (send_outbox)
+# apply it between batches. DB_POOL=True (DB_COMMAND_POOL=True for commands)
+# replaces persistent connections with a psycopg connection pool of
+# DB_POOL_MIN_SIZE to DB_POOL_MAX_SIZE connections; that needs Django 5.1+,
+# psycopg 3 and psycopg_pool, and falls back to persistent connections
+# without them.
+COMMAND_PROCESS = os.environ.get('DB_PROCESS_ROLE', 'web') == 'command'
+
+def env_conn_max_age(name, default):
+    value = os.environ.get(name, default)
+    return None if value == 'None' else int(value)
+
 if not DEBUG and os.environ.get('DB_NAME'):
     DATABASES = {
         'default': {
@@ -106,8 +130,28 @@ if not DEBUG and os.environ.get('DB_NAME'):
             'PASSWORD': os.environ.get('DB_PASSWORD'),
             'HOST': os.environ.get('DB_HOST', 'localhost'),
             'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': env_conn_max_age(
+                'DB_COMMAND_CONN_MAX_AGE' if COMMAND_PROCESS else 'DB_CONN_MAX_AGE',
+                '60' if COMMAND_PROCESS else '600'
+            ),
+            'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+            },
         }
     }
+    if (
+        os.environ.get('DB_COMMAND_POOL' if COMMAND_PROCESS else 'DB_POOL', 'False') == 'True'
+        and django.VERSION >= (5, 1)
+        and importlib.util.find_spec('psycopg_pool') is not None
+    ):
+        # Pooled connections go back to the pool after each request
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        }
 else:
     DATABASES = {
         'default': {
@@ -116,6 +160,26 @@ else:
         }
     }
 
+# Read replicas: DB_REPLICAS is a comma-separated list of replica hosts
+# ("host" or "host:port") for PostgreSQL, or of database files for SQLite
+# (e.g. a copy of db.sqlite3, to try it out locally). Views marked
+# @read_replica read from them; a user who wrote is kept on the primary for
+# REPLICA_PIN_SECONDS (see student_portal.db_routing). Tests only use the
+# primary (student_portal.test_runner).
+DATABASE_REPLICAS = []
+for index, location in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    replica = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if replica['ENGINE'] == 'django.db.backends.sqlite3':
+        replica['NAME'] = location.strip()
+    else:
+        host, _, port = location.strip().partition(':')
+        replica.update(HOST=host, PORT=port or replica['PORT'])
+    DATABASES[f'replica_{index}'] = replica
+    DATABASE_REPLICAS.append(f'replica_{index}')
+DATABASE_ROUTERS = ['student_portal.db_routing.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+TEST_RUNNER = 'student_portal.test_runner.PrimaryOnlyTestRunner'
+
 # Email configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend' if not DEBUG else 'django.core.mail.backends.console.EmailBackend'
 EMAIL_HOST = os.environ.get('EMAIL_HOST', 'smtp.gmail.com')
@@ -123,6 +187,15 @@ EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 587))
 EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'True') == 'True'
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', EMAIL_HOST_USER or 'webmaster@localhost')
+
+# Announcement emails are queued in the outbox and sent by
+# "manage.py send_outbox": OUTBOX_BATCH_SIZE per claimed batch, at most
+# OUTBOX_RATE_PER_MINUTE per worker (0 for no limit), a failed email retried
+# with backoff until OUTBOX_MAX_ATTEMPTS
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 100))
+OUTBOX_RATE_PER_MINUTE = int(os.environ.get('OUTBOX_RATE_PER_MINUTE', 300))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 5))
 
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = 'static/'
@@ -134,6 +207,9 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Threads per process that resize uploaded profile pictures
+AVATAR_WORKERS = int(os.environ.get('AVATAR_WORKERS', 2))
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -145,6 +221,52 @@ LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'login'
 
+# Password hashing: PASSWORD_HASHER names the hasher new passwords are
+# stored with, "pbkdf2" (Django's default), "scrypt" or "argon2" (needs
+# argon2-cffi). The others stay listed so existing hashes still verify, and a
+# user whose hash uses another hasher or other costs is rehashed on their
+# next login, so switching is opt-in: it rehashes every user once, and a
+# rollback to an older release cannot verify the new hashes. The costs
+# default to Django's; `python manage.py benchmark_login` shows what each
+# configuration costs in logins per second per core.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2')
+if PASSWORD_HASHER == 'argon2' and importlib.util.find_spec('argon2') is None:
+    PASSWORD_HASHER = 'scrypt'
+if PASSWORD_HASHER == 'scrypt' and not hasattr(hashlib, 'scrypt'):
+    PASSWORD_HASHER = 'pbkdf2'
+PASSWORD_HASHER_PATHS = {
+    'argon2': 'users.hashers.Argon2PasswordHasher',
+    'scrypt': 'users.hashers.ScryptPasswordHasher',
+    'pbkdf2': 'users.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [PASSWORD_HASHER_PATHS[PASSWORD_HASHER]] + [
+    path for name, path in PASSWORD_HASHER_PATHS.items() if name != PASSWORD_HASHER
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+PASSWORD_HASHER_OPTIONS = {
+    name: int(os.environ[variable])
+    for name, variable in {
+        'pbkdf2_iterations': 'PBKDF2_ITERATIONS',
+        'scrypt_work_factor': 'SCRYPT_WORK_FACTOR',
+        'argon2_time_cost': 'ARGON2_TIME_COST',
+        'argon2_memory_cost': 'ARGON2_MEMORY_COST',
+        'argon2_parallelism': 'ARGON2_PARALLELISM',
+    }.items()
+    if os.environ.get(variable)
+}
+
+# Logins hashing a password at once per process; the rest wait up to
+# LOGIN_QUEUE_TIMEOUT seconds and then get a 503, so a burst of logins
+# leaves CPU for the other requests. The semaphore is per process, so the
+# default shares half the CPUs among the WEB_CONCURRENCY worker processes
+# (gunicorn's own variable for its worker count). It only bounds anything
+# when a process serves several requests at once (gunicorn --threads, or
+# ASGI); sync workers serve one request each, and their number is the bound.
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+LOGIN_CONCURRENCY = int(os.environ.get(
+    'LOGIN_CONCURRENCY', max(1, (os.cpu_count() or 2) // 2 // WEB_CONCURRENCY)
+))
+LOGIN_QUEUE_TIMEOUT = float(os.environ.get('LOGIN_QUEUE_TIMEOUT', 5))
+
 # Crispy Forms
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
@@ -158,3 +280,90 @@ MESSAGE_TAGS = {
     messages.ERROR: 'alert-danger',
 }
 
+
+# Cache: CACHE_BACKEND picks "locmem" (default, per process), "file"
+# (CACHE_LOCATION directory, shared by the processes of one host) or "redis"
+# (REDIS_URL, shared by every host; needs the redis package). Keys carry
+# DEPLOY_VERSION so a release never serves pages cached by the previous one.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+if CACHE_BACKEND == 'redis' and importlib.util.find_spec('redis') is None:
+    CACHE_BACKEND = 'locmem'
+# Whether every worker process sees the same cache. Caches that are
+# invalidated on writes (sessions, the user snapshot, course fragments,
+# dashboards) are only on by default when they are: a per-process locmem
+# cache is only invalidated in the process that made the write.
+SHARED_CACHE = CACHE_BACKEND in ('file', 'redis')
+DEPLOY_VERSION = os.environ.get('DEPLOY_VERSION', 'dev')
+
+CACHES = {
+    'default': {
+        **{
+            'locmem': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'student-portal',
+            },
+            'file': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / '.cache')),
+            },
+            'redis': {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+            },
+        }[CACHE_BACKEND],
+        'KEY_PREFIX': f'student-portal:{DEPLOY_VERSION}',
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', 300)),
+    }
+}
+
+# Sessions: SESSION_BACKEND "cached_db" reads sessions from the cache and
+# writes them through to the database. It is the default with a shared cache;
+# a per-process locmem cache would keep serving a session that another
+# process logged out, so "db" is the default otherwise. "signed_cookies" keeps sessions out of the
+# server entirely. Flash messages are kept in a cookie, so showing one never
+# writes the session.
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cached_db' if SHARED_CACHE else 'db')
+SESSION_ENGINE = {
+    'db': 'student_portal.sessions.db',
+    'cached_db': 'student_portal.sessions.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[SESSION_BACKEND]
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+# Seconds the signed-in user's snapshot (users.middleware) stays cached;
+# saving the user drops it earlier. Off (0) unless the cache is shared: a
+# per-process cache would keep a deactivated user or a changed role alive
+# in the other processes.
+USER_CACHE_TIMEOUT = int(os.environ.get('USER_CACHE_TIMEOUT', 300 if SHARED_CACHE else 0))
+
+# Seconds a full page rendered for anonymous visitors stays cached
+ANONYMOUS_PAGE_CACHE_TIMEOUT = int(os.environ.get('ANONYMOUS_PAGE_CACHE_TIMEOUT', 600))
+
+# Route the dashboard, course, announcement and grade list pages to their
+# async views; only worth it when served by the ASGI application
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS', 'False') == 'True'
+
+# Live announcement stream: "local" fans out within one process, "postgres"
+# across every worker through LISTEN/NOTIFY (PostgreSQL only)
+ANNOUNCEMENT_HUB_BACKEND = os.environ.get('ANNOUNCEMENT_HUB_BACKEND', 'local')
+SSE_KEEPALIVE_SECONDS = int(os.environ.get('SSE_KEEPALIVE_SECONDS', 15))
+# Whether pages open the live announcement stream; only the ASGI application
+# can hold the streams open, so student_portal.asgi turns it on
+LIVE_ANNOUNCEMENTS = os.environ.get('LIVE_ANNOUNCEMENTS', 'False') == 'True'
+
+# Seconds a cached course fragment ({% coursecache %}) is kept; any write to
+# the course, its announcements or enrollments replaces it earlier. Off (0)
+# unless the cache is shared, as other processes would not see the write.
+COURSE_FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('COURSE_FRAGMENT_CACHE_TIMEOUT', 3600 if SHARED_CACHE else 0))
+
+# Seconds a student's dashboard stays cached; writes to their enrollments,
+# grades or course announcements invalidate it earlier. Off (0) unless the
+# cache is shared, for the same reason.
+DASHBOARD_CACHE_TIMEOUT = int(os.environ.get('DASHBOARD_CACHE_TIMEOUT', 300 if SHARED_CACHE else 0))
+
+# Request instrumentation (student_portal.performance): a request running the
+# same SQL this many times is logged as an N+1 pattern; each process adds its
+# timings to the histogram at /admin/performance/ this often. The histogram
+# lives in the cache, so it only covers every process when SHARED_CACHE.
+PERFORMANCE_DUPLICATE_QUERY_THRESHOLD = int(os.environ.get('PERFORMANCE_DUPLICATE_QUERY_THRESHOLD', 5))
+PERFORMANCE_FLUSH_SECONDS = int(os.environ.get('PERFORMANCE_FLUSH_SECONDS', 10))
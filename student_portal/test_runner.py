@@ -0,0 +1,20 @@
+"""Test runner that keeps the suite on the primary database.
+
+Whatever ``DB_REPLICAS`` the environment sets, the suite should behave the
+same: outside a transaction (``TransactionTestCase``) reads in
+``@read_replica`` views would go to a replica alias the test does not
+declare. The runner clears ``DATABASE_REPLICAS`` for the run with
+``override_settings``; tests of the routing override it themselves.
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+class PrimaryOnlyTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._primary_only = override_settings(DATABASE_REPLICAS=[])
+        self._primary_only.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._primary_only.disable()
+        super().teardown_test_environment(**kwargs)
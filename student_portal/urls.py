@@ -6,6 +6,7 @@ from django.conf.urls.static import static
 from . import views
 
 urlpatterns = [
+    path('admin/performance/', admin.site.admin_view(views.performance_report), name='performance_report'),
     path('admin/', admin.site.urls),  # Django admin panel
     path('', include('users.urls')),  # Include user URLs at root
     path('courses/', include('courses.urls')),  # Courses app URLs
@@ -1,25 +1,50 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.contrib import admin
+from django.http import JsonResponse
+from django.shortcuts import redirect, render
+from .caching import cache_anonymous_page
+from .performance import BUCKETS, histogram
 
+@cache_anonymous_page
 def about(request):
     return render(request, 'pages/about.html', {
         'title': 'About Us',
         'description': 'Learn more about our student portal and mission.'
     })
 
+@cache_anonymous_page
 def contact(request):
     return render(request, 'pages/contact.html', {
         'title': 'Contact Us',
         'description': 'Get in touch with our support team.'
     })
 
+@cache_anonymous_page
 def faq(request):
     return render(request, 'pages/faq.html', {
         'title': 'Frequently Asked Questions',
         'description': 'Find answers to common questions about our student portal.'
     })
 
+@cache_anonymous_page
 def privacy(request):
     return render(request, 'pages/privacy.html', {
         'title': 'Privacy Policy',
         'description': 'Learn about how we protect your data and privacy.'
-    }) 
\ No newline at end of file
+    })
+
+def performance_report(request):
+    """Per-URL-name request timings collected by ``PerformanceMiddleware``; wrapped by the admin site."""
+    if request.method == 'POST' and 'reset' in request.POST:
+        histogram.reset()
+        return redirect('performance_report')
+    rows = histogram.report()
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'buckets_ms': BUCKETS, 'views': rows})
+    return render(request, 'admin/performance.html', {
+        **admin.site.each_context(request),
+        'title': 'Request performance',
+        'rows': rows,
+        'shared_cache': settings.SHARED_CACHE,
+        'bucket_labels': [f'≤{bound}' for bound in BUCKETS] + [f'>{BUCKETS[-1]}'],
+    })
@@ -0,0 +1,57 @@
+"""Async version of the dashboard; see ``courses.async_views``."""
+import asyncio
+from django.shortcuts import render
+from courses.models import Announcement, Enrollment
+from courses.read_state import unread
+from student_portal.decorators import async_login_required
+from .cache import aget_dashboard_context
+from .views import average_grade, instructor_dashboard_querysets
+
+async def _list(queryset):
+    return [row async for row in queryset]
+
+async def _student_dashboard_context(user):
+    """The three dashboard queries of ``users.views._student_dashboard_context``, run together.
+
+    The announcements are filtered on an enrollment subquery rather than the
+    loaded course ids so they do not wait for the enrollments.
+    """
+    enrollments = Enrollment.objects.filter(student=user, is_active=True)
+    announcements = Announcement.objects.filter(
+        course__in=enrollments.values('course'),
+        is_active=True
+    )
+    enrollments, unread_count, recent_announcements = await asyncio.gather(
+        _list(enrollments.select_related('course__instructor', 'grade_summary')),
+        unread(announcements, user).acount(),
+        _list(announcements.select_related('course', 'instructor').order_by('-created_at')[:5])
+    )
+    return {
+        'enrolled_courses': enrollments,
+        'average_grade': average_grade(enrollments),
+        'unread_count': unread_count,
+        'recent_announcements': recent_announcements,
+    }
+
+@async_login_required
+async def dashboard(request):
+    context = {
+        'title': 'Dashboard',
+        'description': 'Your academic overview'
+    }
+
+    if request.user.role == 'student':
+        context.update(await aget_dashboard_context(
+            request.user.id,
+            lambda: _student_dashboard_context(request.user)
+        ))
+
+    elif request.user.role == 'instructor':
+        teaching_courses, students, recent_announcements = instructor_dashboard_querysets(request.user)
+        context['teaching_courses'], context['total_students'], context['recent_announcements'] = await asyncio.gather(
+            _list(teaching_courses),
+            students.acount(),
+            _list(recent_announcements)
+        )
+
+    return render(request, 'users/dashboard.html', context)
@@ -0,0 +1,36 @@
+"""Logins through a bounded number of password-hashing slots.
+
+Hashing a password is the most expensive thing a request does. During a
+burst of logins ``authenticate_bounded`` lets ``LOGIN_CONCURRENCY`` of them
+hash at once per process; the others wait up to ``LOGIN_QUEUE_TIMEOUT``
+seconds for a slot and then raise ``LoginBusy``, so the remaining threads
+keep serving other pages.
+
+The slots are a semaphore in the process, not shared between workers: size
+``LOGIN_CONCURRENCY`` per worker, below its thread count. Under sync
+workers, which serve one request at a time, it has no effect.
+"""
+import threading
+from functools import cache
+from django.conf import settings
+from django.contrib.auth import authenticate
+
+class LoginBusy(Exception):
+    pass
+
+@cache
+def _slots(size):
+    return threading.BoundedSemaphore(size)
+
+def login_slots():
+    return _slots(settings.LOGIN_CONCURRENCY)
+
+def authenticate_bounded(request, **credentials):
+    slots = login_slots()
+    if not slots.acquire(timeout=settings.LOGIN_QUEUE_TIMEOUT):
+        raise LoginBusy
+    try:
+        # A hash made with another hasher or other costs is upgraded here
+        return authenticate(request, **credentials)
+    finally:
+        slots.release()
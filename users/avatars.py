@@ -0,0 +1,175 @@
+"""Profile picture processing.
+
+An upload is never served as is. ``save_avatar`` checks it in the request,
+then hands it to a small thread pool that decodes it once with Pillow,
+crops it square and re-encodes it at every size in ``AVATAR_SIZES`` as
+WebP and JPEG, without EXIF or other metadata. Files are named after a hash
+of the upload (``avatars/<hash>-<size>.<ext>``), so a URL never changes
+content and can be cached for good; ``User.avatar_hash`` points at the
+current set. It is switched to a new set only once all its files are
+written, so pages keep showing the previous picture until then. The pool
+lives in the web process: a job lost with its process leaves the previous
+picture in place, and the user can simply upload again.
+"""
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.db.models import Q
+from PIL import Image, ImageOps, UnidentifiedImageError
+from .cache import invalidate_user
+
+logger = logging.getLogger(__name__)
+
+AVATAR_SIZES = (48, 128, 256)
+AVATAR_FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpg', 'JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+)
+AVATAR_DIR = 'avatars'
+# Bumped whenever the output changes, so new files get new names
+PIPELINE_VERSION = b'1'
+MAX_PIXELS = 40_000_000
+
+class AvatarError(ValueError):
+    pass
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'AVATAR_WORKERS', 2),
+                thread_name_prefix='avatar'
+            )
+        return _executor
+
+def avatar_name(avatar_hash, size, extension):
+    return f'{AVATAR_DIR}/{avatar_hash}-{size}.{extension}'
+
+def avatar_url(avatar_hash, size, extension='jpg'):
+    size = min((s for s in AVATAR_SIZES if s >= size), default=AVATAR_SIZES[-1])
+    return default_storage.url(avatar_name(avatar_hash, size, extension))
+
+def check_image(data):
+    """Read the header only: reject what is not an image or is too big to decode."""
+    try:
+        with Image.open(BytesIO(data)) as image:
+            width, height = image.size
+            image.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError) as e:
+        raise AvatarError('Not a valid image') from e
+    if width * height > MAX_PIXELS:
+        raise AvatarError('Image dimensions are too large')
+
+def render_avatars(data):
+    """Yield ``(size, extension, bytes)`` for every avatar size and format."""
+    with Image.open(BytesIO(data)) as image:
+        # Let the JPEG decoder downscale while decoding instead of after
+        image.draft('RGB', (AVATAR_SIZES[-1] * 2, AVATAR_SIZES[-1] * 2))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+        largest = ImageOps.fit(image, (AVATAR_SIZES[-1], AVATAR_SIZES[-1]), Image.Resampling.LANCZOS)
+
+    flat = largest
+    if largest.mode == 'RGBA':
+        flat = Image.new('RGB', largest.size, (255, 255, 255))
+        flat.paste(largest, mask=largest.getchannel('A'))
+
+    for size in AVATAR_SIZES:
+        for extension, format, options in AVATAR_FORMATS:
+            source = largest if format == 'WEBP' else flat
+            if size != source.width:
+                source = source.resize((size, size), Image.Resampling.LANCZOS)
+            output = BytesIO()
+            # A fresh image carries no EXIF, ICC or comments
+            source.save(output, format, **options)
+            yield size, extension, output.getvalue()
+
+def write_avatars(avatar_hash, data):
+    for size, extension, content in render_avatars(data):
+        name = avatar_name(avatar_hash, size, extension)
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(content))
+
+def delete_avatars(avatar_hash):
+    for size in AVATAR_SIZES:
+        for extension, _, _ in AVATAR_FORMATS:
+            default_storage.delete(avatar_name(avatar_hash, size, extension))
+
+def _unused(avatar_hash):
+    """``avatar_hash`` if no user points at its files any more, else ``''``."""
+    from .models import User
+    if avatar_hash and User.objects.filter(avatar_hash=avatar_hash).exists():
+        return ''
+    return avatar_hash
+
+def _stale_files(user):
+    """The files ``user`` stops using: their avatar set unless shared, and a legacy upload."""
+    stale_hash = user.avatar_hash
+    if stale_hash and type(user).objects.filter(avatar_hash=stale_hash).exclude(id=user.id).exists():
+        stale_hash = ''
+    return stale_hash, user.profile_picture.name if user.profile_picture else ''
+
+def _delete_files(stale_hash, stale_picture):
+    if stale_picture:
+        default_storage.delete(stale_picture)
+    if stale_hash:
+        delete_avatars(stale_hash)
+
+def _process(user_id, avatar_hash, data, previous_hash, previous_picture):
+    from .models import User
+    try:
+        write_avatars(avatar_hash, data)
+    except Exception:
+        # The user keeps the previous picture
+        logger.exception('Could not process the avatar of user %s', user_id)
+        raise
+    close_old_connections()
+    try:
+        # Only if the picture did not change again while this one was rendered
+        unchanged = Q(profile_picture=previous_picture) if previous_picture else (
+            Q(profile_picture='') | Q(profile_picture__isnull=True)
+        )
+        switched = User.objects.filter(unchanged, id=user_id, avatar_hash=previous_hash).update(
+            avatar_hash=avatar_hash, profile_picture=None
+        )
+        if switched:
+            invalidate_user(user_id)
+            if previous_hash != avatar_hash:
+                _delete_files(_unused(previous_hash), previous_picture)
+        else:
+            _delete_files(_unused(avatar_hash), '')
+    finally:
+        close_old_connections()
+    return avatar_hash
+
+def save_avatar(user, upload):
+    """Render the avatars of ``upload`` in the background, then point ``user`` at them.
+
+    Raises ``AvatarError`` for uploads that are not images. Returns the new
+    avatar hash, whose files may not exist yet, and the future of the
+    background job.
+    """
+    data = upload.read()
+    check_image(data)
+    avatar_hash = hashlib.sha256(PIPELINE_VERSION + data).hexdigest()[:20]
+    previous_picture = user.profile_picture.name if user.profile_picture else ''
+    job = get_executor().submit(_process, user.id, avatar_hash, data, user.avatar_hash, previous_picture)
+    return avatar_hash, job
+
+def remove_avatar(user):
+    stale_hash, stale_picture = _stale_files(user)
+    user.avatar_hash = ''
+    user.profile_picture = None
+    user.save(update_fields=['avatar_hash', 'profile_picture'])
+    return get_executor().submit(_delete_files, stale_hash, stale_picture)
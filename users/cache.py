@@ -0,0 +1,89 @@
+import zlib
+from functools import cache as memoize
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+DASHBOARD_CACHE_PREFIX = 'dashboard'
+USER_CACHE_PREFIX = 'user'
+
+def dashboard_cache_key(user_id):
+    return f'{DASHBOARD_CACHE_PREFIX}:{user_id}'
+
+def get_dashboard_context(user_id, build):
+    """Return the cached dashboard context for a user, building it on a miss.
+
+    Off when ``DASHBOARD_CACHE_TIMEOUT`` is 0, the default unless the cache is
+    shared: invalidating a per-process cache misses the other processes.
+    """
+    timeout = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 0)
+    if not timeout:
+        return build()
+    key = dashboard_cache_key(user_id)
+    context = cache.get(key)
+    if context is None:
+        context = build()
+        cache.set(key, context, timeout)
+    return context
+
+async def aget_dashboard_context(user_id, build):
+    """Async ``get_dashboard_context``; ``build`` is a coroutine function."""
+    timeout = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 0)
+    if not timeout:
+        return await build()
+    key = dashboard_cache_key(user_id)
+    context = await cache.aget(key)
+    if context is None:
+        context = await build()
+        await cache.aset(key, context, timeout)
+    return context
+
+def invalidate_dashboards(user_ids):
+    """Drop the cached dashboards of the given users."""
+    keys = [dashboard_cache_key(user_id) for user_id in set(user_ids)]
+    if keys:
+        cache.delete_many(keys)
+
+@memoize
+def _user_fields():
+    from .models import User
+    return tuple(User._meta.concrete_fields)
+
+@memoize
+def _snapshot_version():
+    # Changes with the model's columns, so a migration retires old snapshots
+    return f"{zlib.crc32(','.join(field.attname for field in _user_fields()).encode()):08x}"
+
+def user_cache_key(user_id):
+    return f'{USER_CACHE_PREFIX}:{_snapshot_version()}:{user_id}'
+
+def get_cached_user(user_id, load):
+    """Return the user from its cached snapshot, calling ``load`` on a miss.
+
+    The snapshot holds the column values only, never what an instance
+    memoizes during a request (``_completion_rate``). A ``None`` from
+    ``load`` (an unknown or inactive user) is not cached.
+    """
+    timeout = getattr(settings, 'USER_CACHE_TIMEOUT', 0)
+    if not timeout:
+        return load()
+    from .models import User
+    fields = _user_fields()
+    key = user_cache_key(user_id)
+    values = cache.get(key)
+    if values is not None:
+        return User.from_db(DEFAULT_DB_ALIAS, [field.attname for field in fields], values)
+    user = load()
+    if user is not None:
+        cache.set(key, [field.get_prep_value(getattr(user, field.attname)) for field in fields], timeout)
+    return user
+
+def invalidate_user(user_id):
+    """Drop the cached snapshot of a user."""
+    cache.delete(user_cache_key(user_id))
+
+def invalidate_users(user_ids):
+    """Drop the cached snapshots of the given users."""
+    keys = [user_cache_key(user_id) for user_id in set(user_ids)]
+    if keys:
+        cache.delete_many(keys)
@@ -0,0 +1,39 @@
+"""Django's password hashers with their costs taken from ``PASSWORD_HASHER_OPTIONS``.
+
+The algorithm names are Django's, so hashes stay interchangeable with the
+stock hashers. ``must_update`` compares a stored hash's costs with the
+configured ones, so a changed cost is applied on each user's next login.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+def _option(name, default):
+    return getattr(settings, 'PASSWORD_HASHER_OPTIONS', {}).get(name, default)
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return _option('pbkdf2_iterations', hashers.PBKDF2PasswordHasher.iterations)
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return _option('scrypt_work_factor', hashers.ScryptPasswordHasher.work_factor)
+
+    @property
+    def maxmem(self):
+        # OpenSSL refuses more than 32 MiB unless told; scrypt needs 128 * n * r bytes
+        return 256 * self.work_factor * self.block_size
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return _option('argon2_time_cost', hashers.Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return _option('argon2_memory_cost', hashers.Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return _option('argon2_parallelism', hashers.Argon2PasswordHasher.parallelism)
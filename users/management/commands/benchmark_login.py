@@ -0,0 +1,48 @@
+import os
+import time
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+class Command(BaseCommand):
+    help = (
+        'Measures the password check of a login for every configured hasher (PASSWORD_HASHERS, '
+        'with the costs of PASSWORD_HASHER_OPTIONS) and reports logins per second per core'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=20, help='Password checks per hasher')
+        parser.add_argument('--hasher', action='append', dest='hashers',
+                            help='Dotted path of a hasher to measure (repeatable; default: PASSWORD_HASHERS)')
+
+    def measure(self, hasher, total):
+        encoded = hasher.encode('correct horse battery staple', hasher.salt())
+        # CPU time is what a core spends; wall time includes waiting for memory
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        for _ in range(total):
+            hasher.verify('correct horse battery staple', encoded)
+        return encoded, time.process_time() - cpu_started, time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        paths = options['hashers'] or settings.PASSWORD_HASHERS
+        preferred = get_hasher().algorithm
+        self.stdout.write(f'{options["logins"]} password checks per hasher ({os.cpu_count()} CPUs)')
+        for path in paths:
+            hasher = import_string(path)()
+            try:
+                encoded, cpu, wall = self.measure(hasher, options['logins'])
+            except ValueError as error:
+                # The hasher's library is not installed
+                self.stdout.write(f'{hasher.algorithm:<22} skipped: {error}')
+                continue
+            costs = ', '.join(
+                f'{name} {value}' for name, value in hasher.decode(encoded).items()
+                if name not in ('algorithm', 'hash', 'salt')
+            )
+            marker = ' (new passwords)' if hasher.algorithm == preferred and not options['hashers'] else ''
+            self.stdout.write(
+                f'{hasher.algorithm:<22} {options["logins"] / cpu:8.1f} logins/s per core   '
+                f'{wall * 1000 / options["logins"]:8.1f} ms/login   {costs}{marker}'
+            )
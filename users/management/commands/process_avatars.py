@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from users.avatars import AvatarError, save_avatar
+from users.models import User
+
+class Command(BaseCommand):
+    help = 'Resizes profile pictures uploaded before avatar processing into avatars and removes the originals'
+
+    def handle(self, *args, **options):
+        jobs = []
+        for user in User.objects.exclude(profile_picture='').exclude(profile_picture=None).filter(avatar_hash=''):
+            try:
+                with user.profile_picture.open('rb') as picture:
+                    _, job = save_avatar(user, picture)
+                jobs.append((user, job))
+            except (OSError, AvatarError) as e:
+                self.stdout.write(self.style.ERROR(f'{user.username}: {e}'))
+
+        failed = 0
+        for user, job in jobs:
+            try:
+                job.result()
+            except Exception as e:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'{user.username}: {e}'))
+        self.stdout.write(self.style.SUCCESS(f'Processed {len(jobs) - failed} profile pictures'))
@@ -0,0 +1,39 @@
+import time
+from importlib import import_module
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+class Command(BaseCommand):
+    help = (
+        'Deletes expired sessions in small batches, so the table is never locked by one huge delete '
+        'the way clearsessions can'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.1, help='Seconds to wait between batches')
+
+    def handle(self, *args, **options):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        if not hasattr(store, 'get_model_class'):
+            self.stdout.write(f'{settings.SESSION_ENGINE} does not keep sessions in the database; nothing to purge')
+            return
+
+        model = store.get_model_class()
+        now = timezone.now()
+        expired = model.objects.filter(expire_date__lt=now).order_by('expire_date')
+        started = time.perf_counter()
+        deleted = 0
+        while True:
+            keys = list(expired.values_list('session_key', flat=True)[:options['batch_size']])
+            if not keys:
+                break
+            deleted += model.objects.filter(session_key__in=keys, expire_date__lt=now).delete()[0]
+            if len(keys) < options['batch_size']:
+                break
+            time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} expired sessions in {time.perf_counter() - started:.2f}s'
+        ))
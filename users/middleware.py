@@ -0,0 +1,66 @@
+"""Authentication from a cached user snapshot.
+
+``CachedAuthenticationMiddleware`` stands in for Django's
+``AuthenticationMiddleware``: ``request.user`` is loaded through
+``users.cache.get_cached_user``, so a signed-in request (and the role check
+of ``role_required``) costs no query on a cache hit. Saving or deleting a
+user drops the snapshot (``users.signals``), and so does a queryset
+``update()`` of users (``UserQuerySet``). Writes that bypass the ORM, such
+as raw SQL or a database console, are only seen once the snapshot expires
+after ``USER_CACHE_TIMEOUT``: drop it with ``users.cache.invalidate_user``
+after such a change to a role or ``is_active``.
+"""
+from functools import partial
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model, load_backend
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+from .cache import get_cached_user
+
+def get_user(request):
+    """``django.contrib.auth.get_user``, with the user read from its snapshot."""
+    try:
+        user_id = get_user_model()._meta.pk.to_python(request.session[SESSION_KEY])
+        backend_path = request.session[BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+    backend = load_backend(backend_path)
+    user = get_cached_user(user_id, lambda: backend.get_user(user_id))
+    if user is None:
+        return AnonymousUser()
+
+    # Verify the session, so changing the password still signs out other sessions
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    session_auth_hash = user.get_session_auth_hash()
+    if session_hash and constant_time_compare(session_hash, session_auth_hash):
+        return user
+    if session_hash and any(
+        constant_time_compare(session_hash, fallback_hash)
+        for fallback_hash in user.get_session_auth_fallback_hash()
+    ):
+        request.session.cycle_key()
+        request.session[HASH_SESSION_KEY] = session_auth_hash
+        return user
+    request.session.flush()
+    return AnonymousUser()
+
+def _user(request):
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = get_user(request)
+    return request._cached_user
+
+async def _auser(request):
+    if not hasattr(request, '_acached_user'):
+        request._acached_user = await sync_to_async(get_user)(request)
+    return request._acached_user
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: _user(request))
+        request.auser = partial(_auser, request)
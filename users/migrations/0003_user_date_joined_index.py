@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0002_user_bio_user_email_notifications_user_language_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-date_joined', '-id'], name='users_date_joined_idx'),
+        ),
+    ]
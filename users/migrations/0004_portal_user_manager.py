@@ -0,0 +1,20 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:34
+
+import users.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_date_joined_index'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', users.models.PortalUserManager()),
+            ],
+        ),
+    ]
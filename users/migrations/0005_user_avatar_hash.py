@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_portal_user_manager'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_hash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+    ]
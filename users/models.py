@@ -1,5 +1,70 @@
-from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.conf import settings
+from django.contrib.auth.models import AbstractUser, UserManager
+from django.db import models, transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+class UserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        """Update the matching users and drop their cached snapshots.
+
+        ``post_save`` does not fire for a queryset update, so without this a
+        deactivated user or a changed role would live on in the snapshot of
+        ``users.cache`` until it expires. Raw SQL still bypasses it.
+        """
+        if not getattr(settings, 'USER_CACHE_TIMEOUT', 0):
+            return super().update(**kwargs)
+        from .cache import invalidate_users
+        user_ids = list(self.values_list('pk', flat=True))
+        rows = super().update(**kwargs)
+        invalidate_users(user_ids)
+        # Again after commit: a request may have cached the old rows in between
+        transaction.on_commit(lambda: invalidate_users(user_ids), using=self.db)
+        return rows
+
+class PortalUserManager(UserManager.from_queryset(UserQuerySet)):
+    def completion_rates(self, students):
+        """Return ``{student_id: completion percentage}`` for a cohort in one query.
+
+        ``students`` may be a queryset of users or an iterable of ids. A
+        student's rate is the share of active assignments, across their active
+        enrollments, that have a grade; every requested student is in the
+        result, and those without any (or who are not students) count as 0.
+        """
+        from courses.models import Assignment, Enrollment, Grade
+        if not isinstance(students, models.QuerySet):
+            students = list(students)
+        
+        active_assignments = Assignment.objects.filter(
+            course=OuterRef('course'),
+            is_active=True
+        ).order_by().values('course').annotate(total=Count('id')).values('total')
+        graded_assignments = Grade.objects.filter(
+            enrollment=OuterRef('pk'),
+            assignment__is_active=True
+        ).order_by().values('enrollment').annotate(total=Count('id')).values('total')
+        
+        # One row per student, correlated with the users below
+        enrollments = Enrollment.objects.filter(
+            student=OuterRef('pk'),
+            student__role=self.model.STUDENT,
+            is_active=True
+        ).order_by().values('student').annotate(
+            total=Sum(Coalesce(Subquery(active_assignments, output_field=IntegerField()), 0)),
+            completed=Sum(Coalesce(Subquery(graded_assignments, output_field=IntegerField()), 0)),
+        )
+        rows = self.filter(pk__in=students).order_by().annotate(
+            total=Subquery(enrollments.values('total'), output_field=IntegerField()),
+            completed=Subquery(enrollments.values('completed'), output_field=IntegerField()),
+        ).values_list('pk', 'total', 'completed')
+        
+        rates = {}
+        if not isinstance(students, models.QuerySet):
+            # Ids of users that do not exist count as 0 as well
+            rates = {student_id: 0 for student_id in students}
+        for student_id, total, completed in rows:
+            rates[student_id] = int((completed / total) * 100) if total else 0
+        return rates
 
 class User(AbstractUser):
     STUDENT = 'student'
@@ -18,13 +83,20 @@ class User(AbstractUser):
     year_of_study = models.IntegerField(blank=True, null=True)
     phone_number = models.CharField(max_length=20, blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profile_pictures/', blank=True, null=True)
+    # Names the processed avatar files, see users.avatars
+    avatar_hash = models.CharField(max_length=20, blank=True, default='', editable=False, db_index=True)
     bio = models.TextField(blank=True, null=True)
     language = models.CharField(max_length=10, default='en')
     timezone = models.CharField(max_length=50, default='UTC')
     email_notifications = models.BooleanField(default=True)
     
+    objects = PortalUserManager()
+    
     class Meta:
         db_table = 'users'
+        indexes = [
+            models.Index(fields=['-date_joined', '-id'], name='users_date_joined_idx'),
+        ]
         
     def is_student(self):
         return self.role == self.STUDENT
@@ -37,18 +109,10 @@ class User(AbstractUser):
         
     def get_completion_rate(self):
         """Calculate the student's overall course completion rate"""
-        if not self.is_student():
-            return 0
-            
-        from courses.models import Enrollment, Grade, Assignment
-        enrollments = Enrollment.objects.filter(student=self, is_active=True)
-        if not enrollments.exists():
-            return 0
-            
-        total_assignments = Assignment.objects.filter(course__in=enrollments.values_list('course', flat=True), is_active=True).count()
-        completed_assignments = Grade.objects.filter(enrollment__in=enrollments).count()
-        
-        if total_assignments == 0:
-            return 0
-            
-        return int((completed_assignments / total_assignments) * 100)
+        # Memoized on the instance, which lives for one request as request.user
+        if not hasattr(self, '_completion_rate'):
+            if not self.is_student():
+                self._completion_rate = 0
+            else:
+                self._completion_rate = User.objects.completion_rates([self.pk]).get(self.pk, 0)
+        return self._completion_rate
@@ -0,0 +1,13 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cache import invalidate_user
+from .models import User
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_snapshot(sender, instance, **kwargs):
+    user_id = instance.pk
+    invalidate_user(user_id)
+    # Again after commit: a request may have cached the old row in between
+    transaction.on_commit(lambda: invalidate_user(user_id))
@@ -0,0 +1,30 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+from ..avatars import avatar_url
+
+register = template.Library()
+
+@register.simple_tag
+def avatar(user, size=48, css_class='rounded-circle', element_id=''):
+    """Render ``user``'s avatar at ``size`` CSS pixels, WebP with a JPEG fallback.
+
+    {% avatar user 48 %}
+    """
+    size = int(size)
+    id_attr = format_html(' id="{}"', element_id) if element_id else ''
+    if user.avatar_hash:
+        return format_html(
+            '<picture><source type="image/webp" srcset="{} 1x, {} 2x">'
+            '<img src="{}" srcset="{} 2x" width="{}" height="{}" alt="{}" class="{}"{} loading="lazy" decoding="async">'
+            '</picture>',
+            avatar_url(user.avatar_hash, size, 'webp'), avatar_url(user.avatar_hash, size * 2, 'webp'),
+            avatar_url(user.avatar_hash, size), avatar_url(user.avatar_hash, size * 2),
+            size, size, user.get_full_name() or user.username, css_class, id_attr
+        )
+    # Pictures uploaded before avatars were processed
+    src = user.profile_picture.url if user.profile_picture else static('img/default-avatar.png')
+    return format_html(
+        '<img src="{}" width="{}" height="{}" alt="{}" class="{}"{} loading="lazy">',
+        src, size, size, user.get_full_name() or user.username, css_class, id_attr
+    )
@@ -1,3 +1,447 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from unittest import mock
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from django.contrib.auth.hashers import make_password
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.base import SessionBase
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from django.db import connection
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from courses.models import Announcement, Assignment, Course, Enrollment, Grade
+from PIL import Image
+from . import async_views
+from student_portal.caching import page_cache_key
+from student_portal.decorators import role_required
+from .auth import login_slots
+from .avatars import AVATAR_FORMATS, AVATAR_SIZES, AvatarError, avatar_name, remove_avatar, save_avatar
+from .cache import user_cache_key
+from .models import User
 
-# Create your tests here.
+@override_settings(DASHBOARD_CACHE_TIMEOUT=300)
+class StudentDashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.instructor = User.objects.create_user(username='instructor', password='pass', role=User.INSTRUCTOR)
+        self.student = User.objects.create_user(username='student', password='pass', role=User.STUDENT)
+        self.client.force_login(self.student)
+        for index in range(5):
+            course = Course.objects.create(code=f'CS{index:03d}', name=f'Course {index}', instructor=self.instructor)
+            Enrollment.objects.create(student=self.student, course=course)
+            Announcement.objects.create(course=course, instructor=self.instructor, title=f'News {index}', content='Hello')
+
+    def test_dashboard_query_count_is_fixed(self):
+        # session, user, enrollments, unread count, recent announcements
+        with self.assertNumQueries(5):
+            response = self.client.get('/dashboard/')
+        self.assertEqual(response.context['unread_count'], 5)
+        self.assertContains(response, 'Course 4')
+
+        # Served from the per-user cache: only session and user lookups
+        with self.assertNumQueries(2):
+            self.client.get('/dashboard/')
+
+    @override_settings(DASHBOARD_CACHE_TIMEOUT=0)
+    def test_dashboard_is_not_cached_without_a_timeout(self):
+        self.client.get('/dashboard/')
+        with self.assertNumQueries(5):
+            self.client.get('/dashboard/')
+
+    def test_writes_invalidate_cached_dashboard(self):
+        self.client.get('/dashboard/')
+        enrollment = Enrollment.objects.filter(student=self.student).first()
+        assignment = Assignment.objects.create(
+            course=enrollment.course, title='Quiz', due_date=timezone.now(), max_score=Decimal('10')
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            Grade.objects.create(enrollment=enrollment, assignment=assignment, score=Decimal('9'))
+
+        response = self.client.get('/dashboard/')
+        self.assertEqual(response.context['average_grade'], Decimal('90.0'))
+
+        announcement = Announcement.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            announcement.read_by.add(self.student)
+
+        response = self.client.get('/dashboard/')
+        self.assertEqual(response.context['unread_count'], 4)
+
+class CohortCompletionRateTests(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(code='CS101', name='Intro to Computing')
+        self.other_course = Course.objects.create(code='CS102', name='Data Structures')
+        assignments = [
+            Assignment.objects.create(course=self.course, title=f'A{index}', due_date=timezone.now(), max_score=10)
+            for index in range(3)
+        ]
+        self.retired = Assignment.objects.create(
+            course=self.course, title='Retired', due_date=timezone.now(), max_score=10, is_active=False
+        )
+        Assignment.objects.create(course=self.other_course, title='B0', due_date=timezone.now(), max_score=10)
+
+        self.students = []
+        for index, graded in enumerate((3, 1, 0)):
+            student = User.objects.create_user(
+                username=f'student{index}', password='pass', program_of_study='Computing'
+            )
+            enrollment = Enrollment.objects.create(student=student, course=self.course)
+            Enrollment.objects.create(student=student, course=self.other_course)
+            for assignment in assignments[:graded]:
+                Grade.objects.create(enrollment=enrollment, assignment=assignment, score=5)
+            Grade.objects.create(enrollment=enrollment, assignment=self.retired, score=5)
+            self.students.append(student)
+        self.unenrolled = User.objects.create_user(username='new', password='pass', program_of_study='Computing')
+
+    def test_cohort_rates_in_one_query(self):
+        with self.assertNumQueries(1):
+            rates = User.objects.completion_rates(User.objects.filter(program_of_study='Computing'))
+        # 4 active assignments each; grades on the inactive assignment do not count
+        self.assertEqual(rates, {
+            self.students[0].id: 75, self.students[1].id: 25, self.students[2].id: 0, self.unenrolled.id: 0
+        })
+
+    def test_every_requested_student_gets_a_rate(self):
+        instructor = User.objects.create_user(username='teacher', password='pass', role=User.INSTRUCTOR)
+        Enrollment.objects.create(student=instructor, course=self.course)
+        expected = {self.students[1].id: 25, self.unenrolled.id: 0, instructor.id: 0}
+
+        rates = User.objects.completion_rates(User.objects.filter(id__in=expected))
+        self.assertEqual(rates, expected)
+        with self.assertNumQueries(1):
+            rates = User.objects.completion_rates(list(expected))
+        self.assertEqual(rates, expected)
+
+    def test_per_user_rate_is_memoized(self):
+        student = User.objects.get(pk=self.students[0].pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(student.get_completion_rate(), 75)
+            self.assertEqual(student.get_completion_rate(), 75)
+
+class AnonymousPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_pages_are_cached_and_revalidated(self):
+        first = self.client.get('/about/')
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('Cookie', first['Vary'])
+        self.assertIn('no-cache', first['Cache-Control'])
+
+        with self.assertNumQueries(0), self.assertTemplateNotUsed('pages/about.html'):
+            second = self.client.get('/about/')
+        self.assertEqual(second.content, first.content)
+
+        not_modified = self.client.get('/about/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        not_modified = self.client.get('/', HTTP_IF_MODIFIED_SINCE=self.client.get('/')['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_pages_are_cached_by_path_and_declared_query_params(self):
+        self.assertEqual(
+            page_cache_key(RequestFactory().get('/about/?utm_source=mail')),
+            page_cache_key(RequestFactory().get('/about/'))
+        )
+        self.assertNotEqual(
+            page_cache_key(RequestFactory().get('/about/?page=2'), ['page']),
+            page_cache_key(RequestFactory().get('/about/'), ['page'])
+        )
+        self.assertEqual(
+            page_cache_key(RequestFactory().get('/about/?page=2&x=1'), ['page']),
+            page_cache_key(RequestFactory().get('/about/?x=2&page=2'), ['page'])
+        )
+
+        self.client.get('/about/')
+        with self.assertNumQueries(0), self.assertTemplateNotUsed('pages/about.html'):
+            self.client.get('/about/?cache-buster=1')
+
+    def test_signed_in_users_get_fresh_private_pages(self):
+        self.client.get('/about/')
+        user = User.objects.create_user(username='student', password='pass', first_name='Ada', last_name='Lovelace')
+        self.client.force_login(user)
+
+        response = self.client.get('/about/')
+        self.assertContains(response, 'Ada Lovelace')
+        self.assertIn('private', response['Cache-Control'])
+        self.assertRedirects(self.client.get('/'), '/dashboard/', fetch_redirect_response=False)
+
+class AsyncDashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.instructor = User.objects.create_user(username='instructor', password='pass', role=User.INSTRUCTOR)
+        self.student = User.objects.create_user(username='student', password='pass')
+        course = Course.objects.create(code='CS101', name='Intro to Computing', instructor=self.instructor)
+        Enrollment.objects.create(student=self.student, course=course)
+        Announcement.objects.create(course=course, instructor=self.instructor, title='Welcome', content='Hello')
+
+    async def get_dashboard(self, user):
+        request = AsyncRequestFactory().get('/dashboard/')
+        request.session = SessionBase()
+        request._messages = FallbackStorage(request)
+
+        async def auser():
+            return user
+        request.auser = auser
+        return await async_views.dashboard(request)
+
+    async def test_dashboard_matches_sync_context(self):
+        response = await self.get_dashboard(self.student)
+        self.assertContains(response, 'Intro to Computing')
+        self.assertContains(response, '<span class="h5 mb-0" data-unread-count>1</span>', html=True)
+
+        response = await self.get_dashboard(self.instructor)
+        self.assertContains(response, 'Welcome')
+
+# The background jobs write through their own database connection
+class AvatarPipelineTests(TransactionTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username='student', password='pass')
+
+    def photo(self, color='red', size=(1200, 800)):
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera Maker'
+        output = BytesIO()
+        Image.new('RGB', size, color).save(output, 'JPEG', exif=exif)
+        return SimpleUploadedFile('photo.jpg', output.getvalue(), content_type='image/jpeg')
+
+    def upload(self, user, color='red'):
+        avatar_hash, job = save_avatar(user, self.photo(color))
+        self.assertEqual(job.result(timeout=30), avatar_hash)
+        user.refresh_from_db()
+        return avatar_hash
+
+    def test_upload_is_resized_into_square_avatars_without_metadata(self):
+        self.upload(self.user)
+        self.assertEqual(len(self.user.avatar_hash), 20)
+        self.assertFalse(self.user.profile_picture)
+        for size in AVATAR_SIZES:
+            for extension, format, _ in AVATAR_FORMATS:
+                with default_storage.open(avatar_name(self.user.avatar_hash, size, extension)) as file:
+                    with Image.open(file) as image:
+                        self.assertEqual((image.format, image.size), (format, (size, size)))
+                        self.assertFalse(image.getexif())
+
+    def test_new_upload_replaces_old_files(self):
+        self.upload(self.user, 'red')
+        old = avatar_name(self.user.avatar_hash, 48, 'jpg')
+        self.upload(self.user, 'blue')
+        self.assertFalse(default_storage.exists(old))
+        self.assertTrue(default_storage.exists(avatar_name(self.user.avatar_hash, 48, 'jpg')))
+
+        remove_avatar(self.user).result(timeout=30)
+        self.assertEqual(self.user.avatar_hash, '')
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'avatars')), [])
+
+    def test_previous_picture_is_kept_until_the_new_files_exist(self):
+        old_hash = self.upload(self.user, 'red')
+        failing = mock.patch('users.avatars.write_avatars', side_effect=OSError('Disk full'))
+        with failing, self.assertLogs('users.avatars', 'ERROR'), self.assertRaises(OSError):
+            _, job = save_avatar(self.user, self.photo('blue'))
+            job.result(timeout=30)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar_hash, old_hash)
+        self.assertTrue(default_storage.exists(avatar_name(old_hash, 48, 'jpg')))
+
+    def test_older_upload_finishing_late_does_not_win(self):
+        stale = User.objects.get(id=self.user.id)
+        newest = self.upload(self.user, 'blue')
+        # Rendered from the picture the user had before the newest upload
+        late_hash, job = save_avatar(stale, self.photo('red'))
+        job.result(timeout=30)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar_hash, newest)
+        self.assertFalse(default_storage.exists(avatar_name(late_hash, 48, 'jpg')))
+
+    def test_shared_avatar_files_are_kept(self):
+        other = User.objects.create_user(username='twin', password='pass')
+        self.upload(self.user)
+        self.upload(other)
+        remove_avatar(self.user).result(timeout=30)
+        self.assertTrue(default_storage.exists(avatar_name(other.avatar_hash, 48, 'webp')))
+
+    def test_rejects_files_that_are_not_images(self):
+        upload = SimpleUploadedFile('photo.jpg', b'not an image', content_type='image/jpeg')
+        with self.assertRaises(AvatarError):
+            save_avatar(self.user, upload)
+
+        self.client.login(username='student', password='pass')
+        upload.seek(0)
+        response = self.client.post('/profile/update-picture/', {'profile_picture': upload})
+        self.assertFalse(response.json()['success'])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar_hash, '')
+
+    def test_tag_serves_small_webp_with_jpeg_fallback(self):
+        self.upload(self.user)
+        html = Template('{% load avatars %}{% avatar user 48 %}').render(Context({'user': self.user}))
+        self.assertIn(f'{self.user.avatar_hash}-48.webp 1x', html)
+        self.assertIn(f'{self.user.avatar_hash}-128.webp 2x', html)
+        self.assertIn(f'src="/media/avatars/{self.user.avatar_hash}-48.jpg"', html)
+
+@override_settings(SESSION_ENGINE='student_portal.sessions.db')
+class SessionWriteTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='pass', first_name='Ada')
+
+    def session_writes(self, queries):
+        return [
+            query['sql'].split()[0] for query in queries
+            if 'django_session' in query['sql'] and query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+
+    def test_login_writes_the_session_once(self):
+        self.client.get('/login/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/login/', {'username': 'student', 'password': 'pass'})
+        self.assertRedirects(response, '/dashboard/', fetch_redirect_response=False)
+        self.assertEqual(self.session_writes(queries.captured_queries), ['INSERT'])
+        self.assertTrue(self.client.session.get_expire_at_browser_close())
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_login_replaces_the_anonymous_session(self):
+        session = self.client.session
+        session['seen'] = True
+        session.save()
+        self.client.post('/login/', {'username': 'student', 'password': 'pass', 'remember': 'on'})
+        self.assertNotEqual(self.client.session.session_key, session.session_key)
+        self.assertTrue(self.client.session['seen'])
+        self.assertFalse(Session.objects.filter(session_key=session.session_key).exists())
+
+    def test_flash_messages_do_not_write_the_session(self):
+        self.client.force_login(User.objects.create_user(username='instructor', password='pass', role=User.INSTRUCTOR))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/courses/available/')
+        self.assertRedirects(response, '/dashboard/', fetch_redirect_response=False)
+        self.assertIn('messages', response.cookies)
+        self.assertEqual(self.session_writes(queries.captured_queries), [])
+
+    def test_purge_deletes_expired_sessions_in_batches(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f'expired{i}', session_data='', expire_date=now - timedelta(days=1)) for i in range(25)]
+            + [Session(session_key='live', session_data='', expire_date=now + timedelta(days=1))]
+        )
+        output = StringIO()
+        call_command('purge_sessions', '--batch-size', '10', '--pause', '0', stdout=output)
+        self.assertIn('Deleted 25 expired sessions', output.getvalue())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+
+@override_settings(USER_CACHE_TIMEOUT=300)
+class CachedUserTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='admin', password='pass', role=User.ADMIN)
+        self.client.force_login(self.admin)
+
+    def user_queries(self, queries):
+        return [query['sql'] for query in queries if query['sql'].startswith('SELECT "users"')]
+
+    def test_user_is_read_from_the_snapshot(self):
+        self.client.get('/courses/manage/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/courses/manage/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['user'], self.admin)
+        self.assertEqual(self.user_queries(queries.captured_queries), [])
+
+    def test_snapshot_holds_column_values_only(self):
+        self.client.get('/courses/manage/')
+        values = cache.get(user_cache_key(self.admin.pk))
+        self.assertEqual(len(values), len(User._meta.concrete_fields))
+        self.assertTrue(all(isinstance(value, (str, int, bool, type(None), datetime)) for value in values))
+
+    def test_saving_the_user_drops_the_snapshot(self):
+        self.client.get('/courses/manage/')
+        self.admin.role = User.STUDENT
+        self.admin.save()
+        response = self.client.get('/courses/manage/')
+        self.assertRedirects(response, '/login/?next=/courses/manage/', fetch_redirect_response=False)
+
+    def test_queryset_updates_drop_the_snapshot(self):
+        self.client.get('/courses/manage/')
+        User.objects.filter(role=User.ADMIN).update(role=User.STUDENT)
+        response = self.client.get('/courses/manage/')
+        self.assertRedirects(response, '/login/?next=/courses/manage/', fetch_redirect_response=False)
+
+        self.client.get('/courses/manage/')
+        User.objects.filter(id=self.admin.id).update(is_active=False)
+        self.assertIsNone(cache.get(user_cache_key(self.admin.pk)))
+
+
+        self.client.get('/courses/manage/')
+        self.admin.set_password('changed')
+        self.admin.save()
+        response = self.client.get('/courses/manage/')
+        self.assertRedirects(response, '/login/?next=/courses/manage/', fetch_redirect_response=False)
+
+    def test_admin_pages_require_the_admin_role(self):
+        # These checked ``u.is_admin`` without calling it, letting everyone in
+        self.client.force_login(User.objects.create_user(username='student', password='pass'))
+        course = Course.objects.create(code='CS101', name='Intro', instructor=self.admin)
+        for path in ('/courses/manage/', f'/courses/manage/{course.id}/edit/', f'/courses/manage/{course.id}/delete/'):
+            self.assertEqual(self.client.get(path).status_code, 302)
+        self.client.post(f'/courses/manage/{course.id}/delete/')
+        self.assertTrue(Course.objects.filter(id=course.id).exists())
+
+    def test_role_required_records_the_roles(self):
+        view = role_required(User.INSTRUCTOR, User.ADMIN)(lambda request: None)
+        self.assertEqual(view.required_roles, (User.INSTRUCTOR, User.ADMIN))
+
+@override_settings(
+    PASSWORD_HASHERS=['users.hashers.ScryptPasswordHasher', 'users.hashers.PBKDF2PasswordHasher'],
+    PASSWORD_HASHER_OPTIONS={'pbkdf2_iterations': 1000},
+)
+class PasswordHashingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='pass')
+
+    def login(self):
+        return self.client.post('/login/', {'username': 'student', 'password': 'pass'})
+
+    def test_login_rehashes_with_the_preferred_hasher(self):
+        User.objects.filter(id=self.user.id).update(password=make_password('pass', hasher='pbkdf2_sha256'))
+        self.assertRedirects(self.login(), '/dashboard/', fetch_redirect_response=False)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$16384$'))
+
+    def test_login_applies_changed_costs(self):
+        with self.settings(PASSWORD_HASHERS=['users.hashers.PBKDF2PasswordHasher']):
+            self.user.set_password('pass')
+            self.user.save()
+            with self.settings(PASSWORD_HASHER_OPTIONS={'pbkdf2_iterations': 2000}):
+                self.login()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+
+    @override_settings(LOGIN_CONCURRENCY=1, LOGIN_QUEUE_TIMEOUT=0)
+    def test_busy_login_is_turned_away(self):
+        slots = login_slots()
+        slots.acquire()
+        try:
+            response = self.login()
+        finally:
+            slots.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertNotIn('_auth_user_id', self.client.session)
+        self.assertRedirects(self.login(), '/dashboard/', fetch_redirect_response=False)
+
+    def test_benchmark_reports_logins_per_core(self):
+        output = StringIO()
+        call_command('benchmark_login', '--logins', '2', '--hasher', 'users.hashers.PBKDF2PasswordHasher', stdout=output)
+        self.assertIn('logins/s per core', output.getvalue())
+        self.assertIn('iterations 1000', output.getvalue())
@@ -1,18 +1,27 @@
 from django.shortcuts import render, redirect
-from django.contrib.auth import login, logout, authenticate
+from django.conf import settings
+from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.contrib.auth.decorators import user_passes_test
 from django.db.models import Avg, Q
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
-import os
 from .models import User
-from courses.models import Course, Enrollment, Announcement, Grade
+from courses.models import Course, Enrollment, Announcement
+from courses.read_state import unread
+from .auth import LoginBusy, authenticate_bounded
+from .avatars import AvatarError, avatar_url, remove_avatar, save_avatar
+from .cache import get_dashboard_context
 from .forms import UserRegistrationForm, UserUpdateForm, UserProfileForm
+from student_portal.caching import cache_anonymous_page
+from student_portal.decorators import role_required
+from student_portal.pagination import KeysetPaginator
+
+user_paginator = KeysetPaginator(('-date_joined', '-id'), per_page=50)
 
 # Create your views here.
 
+@cache_anonymous_page
 def home(request):
     if request.user.is_authenticated:
         return redirect('dashboard')
@@ -62,7 +71,7 @@ def login_view(request):
             return render(request, 'users/login.html')
         
         try:
-            user = authenticate(request, username=username, password=password)
+            user = authenticate_bounded(request, username=username, password=password)
             if user is not None:
                 login(request, user)
                 if not remember:
@@ -71,6 +80,11 @@ def login_view(request):
                 return redirect('dashboard')
             else:
                 messages.error(request, 'Invalid username or password.')
+        except LoginBusy:
+            messages.error(request, 'Too many people are signing in right now. Please try again in a moment.')
+            response = render(request, 'users/login.html', status=503)
+            response['Retry-After'] = str(max(1, round(settings.LOGIN_QUEUE_TIMEOUT)))
+            return response
         except Exception as e:
             messages.error(request, 'An error occurred during login. Please try again.')
     
@@ -92,44 +106,55 @@ def dashboard(request):
     }
     
     if request.user.role == 'student':
-        enrollments = Enrollment.objects.filter(student=request.user, is_active=True)
-        context['enrolled_courses'] = enrollments
-        
-        # Calculate average grade across all assignments
-        grades = Grade.objects.filter(enrollment__in=enrollments)
-        if grades.exists():
-            grade_percentages = grades.annotate(
-                percentage=models.ExpressionWrapper(
-                    models.F('score') * 100.0 / models.F('max_score'),
-                    output_field=models.FloatField()
-                )
-            )
-            context['average_grade'] = grade_percentages.aggregate(Avg('percentage'))['percentage__avg']
-        else:
-            context['average_grade'] = None
-            
-        # Get announcements for enrolled courses
-        announcements = Announcement.objects.filter(
-            course__in=enrollments.values_list('course', flat=True),
-            is_active=True
-        )
-        context['unread_announcements'] = announcements.exclude(read_by=request.user)
-        context['recent_announcements'] = announcements.order_by('-created_at')[:5]
+        context.update(get_dashboard_context(
+            request.user.id,
+            lambda: _student_dashboard_context(request.user)
+        ))
 
     elif request.user.role == 'instructor':
-        teaching_courses = Course.objects.filter(instructor=request.user, is_active=True)
+        teaching_courses, students, recent_announcements = instructor_dashboard_querysets(request.user)
         context['teaching_courses'] = teaching_courses
-        context['total_students'] = Enrollment.objects.filter(
-            course__in=teaching_courses,
-            is_active=True
-        ).count()
-        context['recent_announcements'] = Announcement.objects.filter(
-            course__in=teaching_courses,
-            is_active=True
-        ).order_by('-created_at')[:5]
+        context['total_students'] = students.count()
+        context['recent_announcements'] = recent_announcements
 
     return render(request, 'users/dashboard.html', context)
 
+def instructor_dashboard_querysets(user):
+    """The instructor's active courses, their active enrollments and the five latest announcements."""
+    teaching_courses = Course.objects.filter(instructor=user, is_active=True)
+    students = Enrollment.objects.filter(course__in=teaching_courses, is_active=True)
+    recent_announcements = Announcement.objects.filter(
+        course__in=teaching_courses,
+        is_active=True
+    ).select_related('course').order_by('-created_at')[:5]
+    return teaching_courses, students, recent_announcements
+
+def average_grade(enrollments):
+    """Average of the materialized per-course grade summaries."""
+    percentages = []
+    for enrollment in enrollments:
+        summary = getattr(enrollment, 'grade_summary', None)
+        if summary and summary.graded_count:
+            percentages.append(summary.weighted_percentage)
+    return sum(percentages) / len(percentages) if percentages else None
+
+def _student_dashboard_context(user):
+    """Build the student dashboard data in a fixed number of queries."""
+    enrollments = list(Enrollment.objects.filter(
+        student=user,
+        is_active=True
+    ).select_related('course__instructor', 'grade_summary'))
+    course_ids = [enrollment.course_id for enrollment in enrollments]
+    announcements = Announcement.objects.filter(course__in=course_ids, is_active=True)
+    return {
+        'enrolled_courses': enrollments,
+        'average_grade': average_grade(enrollments),
+        'unread_count': unread(announcements, user).count(),
+        'recent_announcements': list(
+            announcements.select_related('course', 'instructor').order_by('-created_at')[:5]
+        ),
+    }
+
 @login_required
 def profile(request):
     if request.method == 'POST':
@@ -151,12 +176,12 @@ def password_reset(request):
         return redirect('login')
     return render(request, 'users/password_reset.html')
 
-@user_passes_test(lambda u: u.is_admin())
+@role_required(User.ADMIN)
 def user_management(request):
-    users = User.objects.all()
-    return render(request, 'users/user_management.html', {'users': users})
+    page = user_paginator.paginate(User.objects.all(), request)
+    return render(request, 'users/user_management.html', {'users': page.object_list, 'page': page})
 
-@user_passes_test(lambda u: u.is_admin())
+@role_required(User.ADMIN)
 def create_user(request):
     if request.method == 'POST':
         form = UserRegistrationForm(request.POST)
@@ -177,7 +202,7 @@ def update_profile_picture(request):
     file = request.FILES['profile_picture']
     
     # Validate file type
-    allowed_types = ['image/jpeg', 'image/png', 'image/gif']
+    allowed_types = ['image/jpeg', 'image/png', 'image/gif', 'image/webp']
     if file.content_type not in allowed_types:
         return JsonResponse({'success': False, 'error': 'Invalid file type'})
     
@@ -185,34 +210,23 @@ def update_profile_picture(request):
     if file.size > 5 * 1024 * 1024:
         return JsonResponse({'success': False, 'error': 'File too large'})
     
-    # Delete old profile picture if it exists
-    if request.user.profile_picture:
-        old_picture_path = request.user.profile_picture.path
-        if os.path.exists(old_picture_path):
-            os.remove(old_picture_path)
-    
-    # Save new profile picture
-    request.user.profile_picture = file
-    request.user.save()
+    # Resized in the background; the user is switched to the new files once they exist
+    try:
+        avatar_hash, _ = save_avatar(request.user, file)
+    except AvatarError as e:
+        return JsonResponse({'success': False, 'error': str(e)})
     
     return JsonResponse({
         'success': True,
-        'picture_url': request.user.profile_picture.url
+        'picture_url': avatar_url(avatar_hash, 256)
     })
 
 @login_required
 @require_POST
 def delete_profile_picture(request):
-    if request.user.profile_picture:
-        # Delete the file
-        old_picture_path = request.user.profile_picture.path
-        if os.path.exists(old_picture_path):
-            os.remove(old_picture_path)
-        
-        # Clear the field
-        request.user.profile_picture = None
-        request.user.save()
-        
+    if request.user.avatar_hash or request.user.profile_picture:
+        # The files are deleted in the background
+        remove_avatar(request.user)
         return JsonResponse({'success': True})
     
     return JsonResponse({'success': False, 'error': 'No profile picture to delete'})